@@ -2,20 +2,56 @@ import os
 
 import streamlit as st
 from dotenv import load_dotenv
+from google import genai
 from slack_sdk import WebClient
 
-from src.aging import run_aging_update, send_reminders
-from src.llm_analyzer import analyze_thread
+from src.aging import run_aging_update, send_reminder_digest
+from src.concept_index import ConceptIndex
+from src.jobs import (
+    DONE,
+    FAILED,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    JobRunner,
+    JobStore,
+    batch_progress,
+)
+from src.llm_analyzer import TokenUsage, analyze_thread
+from src.model_router import ModelRouter
 from src.notion_client import fetch_open_pages, save_to_notion
+from src.notion_mirror import NotionMirror
+from src.notion_schema import SCHEMA_CACHE_TTL, SchemaError, ensure_schema, is_formula_aging
+from src.pipeline import (
+    StageGates,
+    StageLimits,
+    adopt_saved_url,
+    record_thread_state,
+    refresh_job_key,
+    refresh_thread,
+    saved_overflow,
+    unchanged_since_save,
+)
+from src.search_index import SearchIndex, embedder_from_config
 from src.slack_client import fetch_slack_thread, parse_slack_thread_url
+from src.thread_state import ThreadStateStore
+from src.token_budget import TokenBudget
 
 load_dotenv()
 
 st.set_page_config(page_title="flow-to-stock", page_icon="🔄", layout="wide")
 
+OPEN_PAGES_TTL = 300
+REFRESH_JOB = "refresh"
+# 少数の選択はまとめ更新より先に処理する
+INTERACTIVE_BATCH_SIZE = 3
+
 
+@st.cache_resource(show_spinner=False)
 def get_secret(key: str) -> str:
-    """Get a secret from st.secrets (Streamlit Cloud) or os.environ (local)."""
+    """Get a secret from st.secrets (Streamlit Cloud) or os.environ (local).
+
+    Resolved once per process; restart the app after changing secrets.
+    """
     try:
         return st.secrets[key]
     except (KeyError, FileNotFoundError):
@@ -36,12 +72,48 @@ st.title("flow-to-stock")
 st.caption("Slack議論を「行動」と「思考資産」に変換する")
 
 
+@st.cache_resource(show_spinner=False)
+def _slack_client(token: str) -> WebClient:
+    return WebClient(token=token)
+
+
+@st.cache_resource(show_spinner=False)
+def _gemini_client(api_key: str) -> genai.Client:
+    return genai.Client(api_key=api_key)
+
+
+@st.cache_data(ttl=SCHEMA_CACHE_TTL, show_spinner=False)
+def load_notion_schema(token: str, database_id: str) -> dict:
+    return ensure_schema(token, database_id)
+
+
+@st.cache_resource(show_spinner=False)
+def get_notion_mirror(database_id: str) -> NotionMirror:
+    return NotionMirror(database_id)
+
+
+@st.cache_data(ttl=OPEN_PAGES_TTL, show_spinner=False)
+def load_open_pages(token: str, database_id: str) -> list[dict]:
+    return fetch_open_pages(token, database_id, get_notion_mirror(database_id))
+
+
+def invalidate_notion_cache(schema: bool = False) -> None:
+    """Drop cached Notion reads after a write so lists reflect the save.
+
+    Pass `schema` after the database schema may have changed (the aging run
+    provisions Aging Days as a formula), so saves stop writing a number to it.
+    """
+    load_open_pages.clear()
+    if schema:
+        load_notion_schema.clear()
+
+
 def get_slack_client() -> WebClient:
     token = get_secret("SLACK_USER_TOKEN")
     if not token:
         st.error("SLACK_USER_TOKEN が設定されていません。")
         st.stop()
-    return WebClient(token=token)
+    return _slack_client(token)
 
 
 def get_notion_token() -> str:
@@ -60,6 +132,17 @@ def get_notion_database_id() -> str:
     return db_id
 
 
+def check_notion_schema() -> dict:
+    """Validate the Notion schema before any analysis is started."""
+    try:
+        return load_notion_schema(get_notion_token(), get_notion_database_id())
+    except SchemaError as e:
+        st.error("Notionデータベースのプロパティが不足しています:")
+        for problem in e.problems:
+            st.markdown(f"- {problem}")
+        st.stop()
+
+
 def get_gemini_api_key() -> str:
     key = get_secret("GEMINI_API_KEY")
     if not key:
@@ -68,6 +151,121 @@ def get_gemini_api_key() -> str:
     return key
 
 
+def get_gemini_client() -> genai.Client:
+    return _gemini_client(get_gemini_api_key())
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_store() -> JobStore:
+    return JobStore()
+
+
+@st.cache_resource(show_spinner=False)
+def get_thread_state() -> ThreadStateStore:
+    return ThreadStateStore()
+
+
+@st.cache_resource(show_spinner=False)
+def get_model_router() -> ModelRouter:
+    return ModelRouter.from_config(get_secret)
+
+
+@st.cache_resource(show_spinner=False)
+def get_token_budget() -> TokenBudget:
+    return TokenBudget.from_config(get_secret)
+
+
+@st.cache_resource(show_spinner=False)
+def get_search_index() -> SearchIndex:
+    return SearchIndex(embedder=embedder_from_config(get_secret))
+
+
+@st.cache_resource(show_spinner=False)
+def get_concept_index() -> ConceptIndex:
+    return ConceptIndex()
+
+
+@st.cache_resource(show_spinner=False)
+def _job_runner(
+    slack_token: str, api_key: str, notion_token: str, database_id: str
+) -> JobRunner:
+    slack = _slack_client(slack_token)
+    gemini = _gemini_client(api_key)
+    limits = StageLimits.from_config(get_secret)
+    gates = StageGates(limits)
+
+    def refresh(payload: dict) -> dict:
+        return refresh_thread(
+            slack,
+            api_key,
+            notion_token,
+            database_id,
+            payload["slack_url"],
+            memo=payload.get("memo"),
+            status=payload.get("status", "Open"),
+            aging_formula=payload.get("aging_formula", False),
+            gemini=gemini,
+            gates=gates,
+            state=get_thread_state(),
+            router=get_model_router(),
+            indexes=[get_search_index(), get_concept_index()],
+            mirror=get_notion_mirror(database_id),
+            budget=get_token_budget(),
+        )
+
+    # Workers fan out across items; the gates cap Slack/Gemini/Notion separately
+    runner = JobRunner(get_job_store(), {REFRESH_JOB: refresh}, workers=limits.workers)
+    runner.start()
+    return runner
+
+
+def get_job_runner() -> JobRunner:
+    """Process-wide worker pool; survives reruns and browser reconnects."""
+    slack_token = get_secret("SLACK_USER_TOKEN")
+    if not slack_token:
+        st.error("SLACK_USER_TOKEN が設定されていません。")
+        st.stop()
+    return _job_runner(
+        slack_token, get_gemini_api_key(), get_notion_token(), get_notion_database_id()
+    )
+
+
+@st.fragment(run_every=2)
+def show_refresh_progress(batch_id: str) -> None:
+    jobs = get_job_store().batch(batch_id)
+    progress = batch_progress(jobs)
+    if not progress["total"]:
+        return
+
+    st.progress(
+        progress["finished"] / progress["total"],
+        text=f"更新中: {progress['finished']}/{progress['total']}件",
+    )
+    for job in jobs:
+        if job["status"] == DONE and job["result"].get("skipped"):
+            st.markdown(f"- :fast_forward: {job['label']}（変更なし）")
+        elif job["status"] == DONE:
+            st.markdown(f"- :white_check_mark: [{job['label']}]({job['result']['page_url']})")
+        elif job["status"] == FAILED:
+            st.error(f"{job['label']}: {job['error']}")
+        else:
+            st.markdown(f"- :hourglass: {job['label']}")
+
+    if progress["finished"] == progress["total"]:
+        counted = st.session_state.setdefault("counted_batches", set())
+        if batch_id not in counted:
+            counted.add(batch_id)
+            invalidate_notion_cache()
+            st.session_state["session_total_tokens"] = st.session_state.get(
+                "session_total_tokens", 0
+            ) + sum(
+                j["result"]["total_tokens"]
+                for j in jobs
+                if j["status"] == DONE and not j["coalesced_into"]
+            )
+        st.success(f"更新完了: {progress['done']}/{progress['total']}件")
+
+
 # --- サイドバー ---
 with st.sidebar:
     # トークン使用量
@@ -77,7 +275,14 @@ with st.sidebar:
     if "token_usage" in st.session_state:
         usage = st.session_state["token_usage"]
         st.caption(f"直近: 入力 {usage.prompt_tokens:,} / 出力 {usage.completion_tokens:,}")
-    st.caption("Gemini 2.0 Flash 無料枠: 1,500 req/日")
+        if usage.model:
+            st.caption(f"モデル: {usage.model}（{usage.route_reason}）")
+    budget = get_token_budget()
+    if budget.per_day:
+        st.caption(f"本日のトークン: {budget.used_today():,} / {budget.per_day:,}")
+    router = get_model_router()
+    routes = [f"{rule.name} → {rule.model}" for rule in router.rules]
+    st.caption("モデル: " + " / ".join([*routes, f"既定 → {router.default_model}"]))
     st.divider()
 
     st.header("Aging管理")
@@ -85,15 +290,28 @@ with st.sidebar:
         with st.spinner("Aging更新中..."):
             notion_token = get_notion_token()
             db_id = get_notion_database_id()
-            result = run_aging_update(notion_token, db_id)
-            st.success(f"更新完了: {result['updated']}件")
+            result = run_aging_update(
+                notion_token,
+                db_id,
+                aging_mode=get_secret("NOTION_AGING_MODE") or None,
+                mirror=get_notion_mirror(db_id),
+            )
+            invalidate_notion_cache(schema=True)
+            if result["aging_mode"] == "formula":
+                st.success("Aging Days は formula で自動計算されています（書き込みなし）")
+            else:
+                st.success(f"更新完了: {result['updated']}件")
 
             if result["reminders"]:
                 slack = get_slack_client()
                 user_id = get_secret("SLACK_REMINDER_USER_ID")
                 if user_id:
-                    sent = send_reminders(slack, user_id, result["reminders"])
-                    st.info(f"リマインド送信: {sent}件")
+                    digests = send_reminder_digest(slack, user_id, result["reminders"])
+                    sent = sum(len(d["page_ids"]) for d in digests if d["ok"])
+                    st.info(f"リマインド送信: {sent}件 ({len(digests)}メッセージ)")
+                    for d in digests:
+                        if not d["ok"]:
+                            st.error(f"リマインド送信エラー: {d['error']}")
                 else:
                     st.warning("SLACK_REMINDER_USER_ID 未設定のためリマインド送信をスキップ")
 
@@ -115,7 +333,7 @@ with st.sidebar:
         with st.spinner("Notionから取得中..."):
             notion_token = get_notion_token()
             db_id = get_notion_database_id()
-            pages = fetch_open_pages(notion_token, db_id)
+            pages = load_open_pages(notion_token, db_id)
             st.session_state["refresh_pages"] = pages
 
     if "refresh_pages" in st.session_state:
@@ -133,42 +351,58 @@ with st.sidebar:
                     selected.append(page)
 
             if selected and st.button("選択したアイテムを更新"):
-                slack = get_slack_client()
-                api_key = get_gemini_api_key()
-                notion_token = get_notion_token()
-                db_id = get_notion_database_id()
-
-                progress = st.progress(0)
-                success_count = 0
-                errors = []
-
-                for idx, page in enumerate(selected):
-                    try:
-                        channel_id, thread_ts = parse_slack_thread_url(page["slack_url"])
-                        thread = fetch_slack_thread(slack, channel_id, thread_ts, page["slack_url"])
-                        analysis, token_usage = analyze_thread(
-                            thread, api_key, memo=page.get("memo"),
-                        )
-                        save_to_notion(
-                            notion_token, db_id, analysis,
-                            thread.url, thread.channel_name,
-                            page.get("memo"), page.get("status", "Open"),
+                schema = check_notion_schema()
+                runner = get_job_runner()
+                batch_id = runner.submit_batch(
+                    REFRESH_JOB,
+                    [
+                        (
+                            page["title"],
+                            {
+                                "slack_url": page["slack_url"],
+                                "memo": page.get("memo"),
+                                "status": page.get("status", "Open"),
+                                "aging_formula": is_formula_aging(schema),
+                            },
                         )
-                        st.session_state["session_total_tokens"] = (
-                            st.session_state.get("session_total_tokens", 0)
-                            + token_usage.total_tokens
-                        )
-                        success_count += 1
-                    except Exception as e:
-                        errors.append(f"{page['title']}: {e}")
+                        for page in selected
+                    ],
+                    priority=(
+                        PRIORITY_INTERACTIVE
+                        if len(selected) <= INTERACTIVE_BATCH_SIZE
+                        else PRIORITY_BULK
+                    ),
+                    key=refresh_job_key,
+                )
+                st.session_state["refresh_batch_id"] = batch_id
+                del st.session_state["refresh_pages"]
 
-                    progress.progress((idx + 1) / len(selected))
+    # ブラウザ再接続後も直近のバッチを表示する
+    batch_id = st.session_state.get("refresh_batch_id") or get_job_store().latest_batch_id(
+        REFRESH_JOB
+    )
+    if batch_id:
+        show_refresh_progress(batch_id)
 
-                st.success(f"更新完了: {success_count}/{len(selected)}件")
-                for err in errors:
-                    st.error(err)
+    st.divider()
 
-                del st.session_state["refresh_pages"]
+    # --- 検索 ---
+    st.header("過去の議論を検索")
+    query = st.text_input("キーワード・論点", key="search_query")
+    if query:
+        hits = get_search_index().search(query, limit=10)
+        if not hits:
+            st.info("該当する議論はありません。")
+        for hit in hits:
+            link = f"[Notion]({hit['page_url']}) / " if hit["page_url"] else ""
+            st.markdown(f"- **{hit['theme']}** {link}[Slack]({hit['slack_url']})")
+
+    with st.expander("よく出るコンセプト"):
+        top = get_concept_index().top(10)
+        if not top:
+            st.caption("まだコンセプトはありません。")
+        for c in top:
+            st.markdown(f"- **{c['name']}** {c['threads']}件（{c['first_seen']} 〜 {c['last_seen']}）")
 
 # --- メイン: 入力フォーム ---
 st.header("Slack スレッドを分析")
@@ -180,6 +414,10 @@ slack_url = st.text_input(
 memo = st.text_area("補足メモ（任意）", placeholder="追加のコンテキストがあれば入力")
 
 if st.button("分析する", type="primary", disabled=not slack_url):
+    if get_secret("NOTION_TOKEN") and get_secret("NOTION_DATABASE_ID"):
+        with st.spinner("Notionスキーマを確認中..."):
+            check_notion_schema()
+
     with st.spinner("Slackスレッドを取得中..."):
         try:
             channel_id, thread_ts = parse_slack_thread_url(slack_url)
@@ -192,15 +430,28 @@ if st.button("分析する", type="primary", disabled=not slack_url):
             st.error(f"Slack取得エラー: {e}")
             st.stop()
 
-    with st.spinner("Gemini で分析中..."):
-        try:
-            api_key = get_gemini_api_key()
-            analysis, token_usage = analyze_thread(
-                thread, api_key, memo=memo if memo else None
-            )
-        except Exception as e:
-            st.error(f"分析エラー: {e}")
-            st.stop()
+    # 保存済みスレッドは別のURL表記でも同じページを更新し、変更がなければ再分析しない
+    adopt_saved_url(get_thread_state(), thread)
+    previous = unchanged_since_save(get_thread_state(), thread, memo if memo else None)
+    if previous:
+        st.info("前回保存時から変更がないため、保存済みの分析結果を表示しています。")
+        analysis = previous["analysis"]
+        token_usage = TokenUsage(0, 0, 0)
+    else:
+        with st.spinner("Gemini で分析中..."):
+            try:
+                api_key = get_gemini_api_key()
+                analysis, token_usage = analyze_thread(
+                    thread,
+                    api_key,
+                    memo=memo if memo else None,
+                    client=get_gemini_client(),
+                    router=get_model_router(),
+                    budget=get_token_budget(),
+                )
+            except Exception as e:
+                st.error(f"分析エラー: {e}")
+                st.stop()
 
     st.session_state["analysis"] = analysis
     st.session_state["thread"] = thread
@@ -274,6 +525,7 @@ if "analysis" in st.session_state:
             try:
                 notion_token = get_notion_token()
                 db_id = get_notion_database_id()
+                schema = check_notion_schema()
                 page_url = save_to_notion(
                     notion_token,
                     db_id,
@@ -281,7 +533,16 @@ if "analysis" in st.session_state:
                     thread.url,
                     thread.channel_name,
                     st.session_state.get("memo"),
+                    aging_formula=is_formula_aging(schema),
+                    mirror=get_notion_mirror(db_id),
+                    overflow=saved_overflow(get_thread_state(), thread),
+                )
+                record_thread_state(
+                    get_thread_state(), thread, analysis, st.session_state.get("memo"), page_url
                 )
+                for index in (get_search_index(), get_concept_index()):
+                    index.record(thread, analysis, page_url)
+                invalidate_notion_cache()
                 st.success("保存完了!")
                 st.markdown(f"[Notionで開く]({page_url})")
                 del st.session_state["analysis"]
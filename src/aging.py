@@ -1,12 +1,48 @@
-from datetime import date
+import time
+from collections.abc import Iterator
+from datetime import date, timedelta
+from typing import TYPE_CHECKING
 
-import httpx
-from slack_sdk import WebClient
+from src.checkpoint import Checkpoint
+from src.lazy import lazy_import
+from src.mrkdwn import escape_mrkdwn, link_mrkdwn
+from src.notion_mirror import page_gone
+from src.notion_schema import cache_schema, fetch_database_schema, is_formula_aging
+
+if TYPE_CHECKING:
+    from slack_sdk import WebClient
+
+    from src.notion_mirror import NotionMirror
+
+httpx = lazy_import("httpx")
+slack_errors = lazy_import("slack_sdk.errors")
 
 NOTION_VERSION = "2022-06-28"
 BASE_URL = "https://api.notion.com/v1"
 HTTP_TIMEOUT = 30.0
 
+REMINDER_AGING_DAYS = 7
+
+# Aging Days as a Notion formula: derived on read, no nightly page writes.
+AGING_FORMULA = 'dateBetween(now(), prop("Last Managed At"), "days")'
+
+# Properties transferred per query (everything else is projected away).
+AGING_PROPERTIES = ["Last Managed At", "Aging Days"]
+REMINDER_PROPERTIES = [
+    "Title",
+    "Status",
+    "Next Decision Required",
+    "Slack URL",
+    "Last Managed At",
+]
+
+# Slack Block Kit limits: 50 blocks per message, 3000 chars per section text.
+DIGEST_MAX_BLOCKS = 50
+DIGEST_SECTION_MAX_CHARS = 3000
+# chat.postMessage allows roughly one message per second per channel.
+DIGEST_POST_INTERVAL = 1.0
+DIGEST_MAX_RETRIES = 3
+
 
 def _headers(token: str) -> dict:
     return {
@@ -21,96 +57,274 @@ def calculate_aging_days(last_managed: date, today: date) -> int:
     return (today - last_managed).days
 
 
-def run_aging_update(
+def _property_ids(properties: dict, names: list[str]) -> list[str]:
+    return [properties[name]["id"] for name in names if name in properties]
+
+
+def provision_aging_formula(token: str, database_id: str) -> dict:
+    """Convert the Aging Days property into a formula over Last Managed At.
+
+    Returns the updated schema properties.
+    """
+    resp = httpx.patch(
+        f"{BASE_URL}/databases/{database_id}",
+        headers=_headers(token),
+        json={"properties": {"Aging Days": {"formula": {"expression": AGING_FORMULA}}}},
+        timeout=HTTP_TIMEOUT,
+    )
+    resp.raise_for_status()
+    properties = resp.json().get("properties", {})
+    if not is_formula_aging(properties):
+        raise RuntimeError("Failed to provision Aging Days as a formula property")
+    cache_schema(database_id, properties)
+    return properties
+
+
+def _iter_query_batches(
     token: str,
     database_id: str,
-    today: date | None = None,
-) -> dict:
-    """Update aging days for all active pages.
+    filter_: dict,
+    property_ids: list[str],
+    start_cursor: str | None = None,
+) -> Iterator[tuple[list[dict], str | None]]:
+    """Run a paginated database query with projected properties.
 
-    Returns dict with 'updated' count and 'reminders' list.
+    Yields (results, next_cursor) per Notion result page; next_cursor is None
+    on the last page.
     """
-    if today is None:
-        today = date.today()
+    params = [("filter_properties", prop_id) for prop_id in property_ids]
 
-    filter_payload = {
-        "filter": {
-            "and": [
-                {"property": "Status", "select": {"does_not_equal": "Done"}},
-                {"property": "Status", "select": {"does_not_equal": "Archived"}},
-            ]
-        }
-    }
-
-    pages = []
-    next_cursor = None
+    next_cursor = start_cursor
     while True:
-        payload = dict(filter_payload)
+        payload = {"filter": filter_}
         if next_cursor:
             payload["start_cursor"] = next_cursor
 
         resp = httpx.post(
             f"{BASE_URL}/databases/{database_id}/query",
             headers=_headers(token),
+            params=params,
             json=payload,
             timeout=HTTP_TIMEOUT,
         )
         resp.raise_for_status()
         response = resp.json()
 
-        pages.extend(response.get("results", []))
-        if not response.get("has_more"):
-            break
-        next_cursor = response.get("next_cursor")
+        next_cursor = response.get("next_cursor") if response.get("has_more") else None
+        yield response.get("results", []), next_cursor
         if not next_cursor:
             break
 
-    reminders = []
-    updated = 0
 
+def _query_pages(
+    token: str,
+    database_id: str,
+    filter_: dict,
+    property_ids: list[str],
+) -> list[dict]:
+    """Run a paginated database query, returning only the projected properties."""
+    pages = []
+    for results, _ in _iter_query_batches(token, database_id, filter_, property_ids):
+        pages.extend(results)
+    return pages
+
+
+def aging_update_filter(today: date) -> dict:
+    """Active pages whose aging is not already 0 (Last Managed At before today)."""
+    return {
+        "and": [
+            {"property": "Status", "select": {"does_not_equal": "Done"}},
+            {"property": "Status", "select": {"does_not_equal": "Archived"}},
+            {"property": "Last Managed At", "date": {"before": today.isoformat()}},
+        ]
+    }
+
+
+def reminder_filter(today: date, stale_days: int = REMINDER_AGING_DAYS) -> dict:
+    """Open pages not managed for at least `stale_days` days."""
+    threshold = today - timedelta(days=stale_days)
+    return {
+        "and": [
+            {"property": "Status", "select": {"equals": "Open"}},
+            {
+                "property": "Last Managed At",
+                "date": {"on_or_before": threshold.isoformat()},
+            },
+        ]
+    }
+
+
+def _last_managed(props: dict) -> date | None:
+    last_managed_prop = props.get("Last Managed At", {}).get("date")
+    if not last_managed_prop or not last_managed_prop.get("start"):
+        return None
+    return date.fromisoformat(last_managed_prop["start"][:10])
+
+
+def fetch_reminder_candidates(
+    token: str,
+    database_id: str,
+    today: date,
+    properties: dict | None = None,
+    mirror: "NotionMirror | None" = None,
+) -> list[dict]:
+    """Query stale Open pages and return reminder dicts.
+
+    With `mirror`, pages are read from the (already synced) local mirror.
+    """
+    if mirror:
+        pages = mirror.reminder_pages(today, REMINDER_AGING_DAYS)
+    else:
+        if properties is None:
+            properties = fetch_database_schema(token, database_id)
+        pages = _query_pages(
+            token,
+            database_id,
+            reminder_filter(today),
+            _property_ids(properties, REMINDER_PROPERTIES),
+        )
+
+    reminders = []
     for page in pages:
         props = page["properties"]
-        last_managed_prop = props.get("Last Managed At", {}).get("date")
-        if not last_managed_prop or not last_managed_prop.get("start"):
+        last_managed = _last_managed(props)
+        if last_managed is None:
             continue
 
-        last_managed = date.fromisoformat(last_managed_prop["start"])
-        aging_days = calculate_aging_days(last_managed, today)
+        theme = "".join(
+            p["text"]["content"] for p in props.get("Title", {}).get("title", [])
+        ) or "Unknown"
+        next_decision = "".join(
+            p["text"]["content"]
+            for p in props.get("Next Decision Required", {}).get("rich_text", [])
+        )
+
+        slack_url = props.get("Slack URL", {}).get("url", "")
 
-        update_resp = httpx.patch(
-            f"{BASE_URL}/pages/{page['id']}",
-            headers=_headers(token),
-            json={"properties": {"Aging Days": {"number": aging_days}}},
-            timeout=HTTP_TIMEOUT,
+        reminders.append(
+            {
+                "page_id": page["id"],
+                "theme": theme,
+                "next_decision_required": next_decision,
+                "aging_days": calculate_aging_days(last_managed, today),
+                "slack_url": slack_url,
+            }
         )
-        update_resp.raise_for_status()
-        updated += 1
-
-        status = props.get("Status", {}).get("select", {}).get("name", "")
-        if status == "Open" and aging_days >= 7:
-            title_parts = props.get("Title", {}).get("title", [])
-            theme = title_parts[0]["text"]["content"] if title_parts else "Unknown"
-
-            ndr_parts = props.get("Next Decision Required", {}).get("rich_text", [])
-            next_decision = ndr_parts[0]["text"]["content"] if ndr_parts else ""
-
-            slack_url = props.get("Slack URL", {}).get("url", "")
-
-            reminders.append(
-                {
-                    "page_id": page["id"],
-                    "theme": theme,
-                    "next_decision_required": next_decision,
-                    "aging_days": aging_days,
-                    "slack_url": slack_url,
-                }
+
+    return reminders
+
+
+def run_aging_update(
+    token: str,
+    database_id: str,
+    today: date | None = None,
+    aging_mode: str | None = None,
+    checkpoint: Checkpoint | None = None,
+    dry_run: bool = False,
+    mirror: "NotionMirror | None" = None,
+) -> dict:
+    """Update aging days for all active pages.
+
+    aging_mode: "number" rewrites the Aging Days number on each stale page,
+    "formula" provisions Aging Days as a formula (if needed) and never writes
+    pages, None follows the current database schema.
+
+    With `checkpoint`, the query cursor and the pages already updated in the
+    current result page are persisted, so a rerun resumes where a failed run
+    stopped. The cursor belongs to the query for `today`; progress saved on
+    another day is dropped. With `dry_run`, nothing is written to Notion.
+
+    Stale/Open filtering is done by Notion; only the properties needed for
+    each step are transferred. With `mirror`, it is synced once and
+    candidates are selected locally; page updates are written through.
+    There is no query cursor then: a rerun skips the pages in the
+    checkpoint's done set.
+    Returns dict with 'updated' (or would-update in dry run), 'scanned',
+    'unchanged' counts, 'reminders' list and the 'aging_mode'.
+    """
+    if today is None:
+        today = date.today()
+    if checkpoint:
+        checkpoint.bind(today.isoformat())
+
+    properties = fetch_database_schema(token, database_id)
+    provisioned = False
+    if aging_mode == "formula" and not is_formula_aging(properties) and not dry_run:
+        properties = provision_aging_formula(token, database_id)
+        provisioned = True
+    elif aging_mode is None:
+        aging_mode = "formula" if is_formula_aging(properties) else "number"
+    if mirror:
+        # Provisioning changes Aging Days on every page without editing them
+        mirror.sync(token, full=True if provisioned else None)
+
+    scanned = 0
+    unchanged = 0
+    updated = 0
+    if aging_mode == "number":
+        if mirror:
+            batches = iter([(mirror.aging_update_pages(today), None)])
+        else:
+            batches = _iter_query_batches(
+                token,
+                database_id,
+                aging_update_filter(today),
+                _property_ids(properties, AGING_PROPERTIES),
+                start_cursor=checkpoint.cursor if checkpoint else None,
             )
 
-    return {"updated": updated, "reminders": reminders}
+        for pages, next_cursor in batches:
+            for page in pages:
+                if checkpoint and page["id"] in checkpoint.done:
+                    continue
+                scanned += 1
+
+                props = page["properties"]
+                last_managed = _last_managed(props)
+                if last_managed is None:
+                    continue
+
+                aging_days = calculate_aging_days(last_managed, today)
+                if props.get("Aging Days", {}).get("number") == aging_days:
+                    unchanged += 1
+                    continue
+
+                if dry_run:
+                    updated += 1
+                    continue
+
+                update_resp = httpx.patch(
+                    f"{BASE_URL}/pages/{page['id']}",
+                    headers=_headers(token),
+                    json={"properties": {"Aging Days": {"number": aging_days}}},
+                    timeout=HTTP_TIMEOUT,
+                )
+                if mirror and page_gone(update_resp):
+                    # Archived in Notion since the last full sync
+                    mirror.remove_page(page["id"])
+                    continue
+                update_resp.raise_for_status()
+                updated += 1
+                if mirror:
+                    mirror.upsert_page(update_resp.json())
+                if checkpoint:
+                    checkpoint.mark_done(page["id"])
+
+            if checkpoint and not dry_run and not mirror:
+                checkpoint.advance(next_cursor)
+
+    reminders = fetch_reminder_candidates(token, database_id, today, properties, mirror)
+    return {
+        "updated": updated,
+        "scanned": scanned,
+        "unchanged": unchanged,
+        "reminders": reminders,
+        "aging_mode": aging_mode,
+    }
 
 
 def send_reminders(
-    slack_client: WebClient,
+    slack_client: "WebClient",
     user_id: str,
     reminders: list[dict],
 ) -> int:
@@ -130,3 +344,104 @@ def send_reminders(
         slack_client.chat_postMessage(channel=user_id, text=text)
         sent += 1
     return sent
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[: limit - 1] + "…"
+
+
+def _reminder_section(r: dict) -> dict:
+    if r.get("slack_url"):
+        theme = link_mrkdwn(r["slack_url"], r["theme"])
+    else:
+        theme = escape_mrkdwn(r["theme"])
+    text = f"*{theme}* ({r['aging_days']}日)"
+    if r.get("next_decision_required"):
+        text += f"\nNext Decision Required: {escape_mrkdwn(r['next_decision_required'])}"
+    return {
+        "type": "section",
+        "text": {"type": "mrkdwn", "text": _truncate(text, DIGEST_SECTION_MAX_CHARS)},
+    }
+
+
+def build_reminder_digests(
+    reminders: list[dict],
+    max_blocks: int = DIGEST_MAX_BLOCKS,
+) -> list[dict]:
+    """Group reminders into Block Kit messages, most stale first.
+
+    Returns list of dicts with: text (notification fallback), blocks, page_ids.
+    """
+    ordered = sorted(reminders, key=lambda r: r["aging_days"], reverse=True)
+    per_message = max_blocks - 1  # one block is reserved for the header
+
+    digests = []
+    for start in range(0, len(ordered), per_message):
+        chunk = ordered[start : start + per_message]
+        header = f"停滞中の議論: {len(ordered)}件"
+        if len(ordered) > per_message:
+            header += f" ({start + 1}-{start + len(chunk)})"
+        digests.append(
+            {
+                "text": header,
+                "blocks": [
+                    {"type": "header", "text": {"type": "plain_text", "text": header}},
+                    *[_reminder_section(r) for r in chunk],
+                ],
+                "page_ids": [r["page_id"] for r in chunk],
+            }
+        )
+    return digests
+
+
+def _post_with_retry(slack_client: "WebClient", sleep, **kwargs) -> dict:
+    """Post a message, waiting out 429 responses using Retry-After."""
+    for attempt in range(DIGEST_MAX_RETRIES + 1):
+        try:
+            return slack_client.chat_postMessage(**kwargs)
+        except slack_errors.SlackApiError as e:
+            if e.response.status_code != 429 or attempt == DIGEST_MAX_RETRIES:
+                raise
+            # Header names are case-insensitive, but not every headers mapping is
+            retry_after = next(
+                (v for k, v in e.response.headers.items() if k.lower() == "retry-after"),
+                DIGEST_POST_INTERVAL,
+            )
+            sleep(float(retry_after))
+    raise RuntimeError("Failed to post reminder digest after retries")
+
+
+def send_reminder_digest(
+    slack_client: "WebClient",
+    user_id: str,
+    reminders: list[dict],
+    interval: float = DIGEST_POST_INTERVAL,
+    sleep=time.sleep,
+) -> list[dict]:
+    """Send reminders as a few digest DMs instead of one DM per discussion.
+
+    Messages are paced by `interval` seconds and retried on rate limits.
+    Returns one dict per message with: ok, ts, page_ids, error.
+    """
+    results = []
+    for i, digest in enumerate(build_reminder_digests(reminders)):
+        if i > 0 and interval > 0:
+            sleep(interval)
+        try:
+            resp = _post_with_retry(
+                slack_client,
+                sleep,
+                channel=user_id,
+                text=digest["text"],
+                blocks=digest["blocks"],
+            )
+            results.append(
+                {"ok": True, "ts": resp.get("ts"), "page_ids": digest["page_ids"], "error": None}
+            )
+        except slack_errors.SlackApiError as e:
+            results.append(
+                {"ok": False, "ts": None, "page_ids": digest["page_ids"], "error": str(e)}
+            )
+    return results
@@ -0,0 +1,101 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from src.storage import data_dir
+
+
+class Checkpoint:
+    """Progress of a resumable batch run, persisted as a JSON file.
+
+    Tracks processed item IDs plus an optional cursor; every update is
+    written atomically so a killed run loses at most the in-flight items.
+    Failed item IDs are kept apart: they are retried by the next run like
+    any other item and outlive finish(), until they succeed.
+    """
+
+    def __init__(self, name: str, scope: str | None = None):
+        self.path: Path = data_dir() / f"{name}.checkpoint.json"
+        self.done: set[str] = set()
+        self.failed: set[str] = set()
+        self.cursor: str | None = None
+        self.scope: str | None = None
+        self.started_at: float = time.time()
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            self.done = set(data.get("done", []))
+            self.failed = set(data.get("failed", []))
+            self.cursor = data.get("cursor")
+            self.scope = data.get("scope")
+            self.started_at = data.get("started_at", self.started_at)
+        if scope is not None:
+            self.bind(scope)
+
+    def bind(self, scope: str) -> None:
+        """Tie progress to `scope` (e.g. the run date a query filter uses).
+
+        Progress saved under another scope cannot be resumed and is dropped.
+        """
+        if self.scope != scope:
+            self.clear()
+            self.scope = scope
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.done) or self.cursor is not None
+
+    def mark_done(self, item_id: str) -> None:
+        self.done.add(item_id)
+        self.failed.discard(item_id)
+        self.save()
+
+    def mark_failed(self, item_id: str) -> None:
+        self.failed.add(item_id)
+        self.save()
+
+    def advance(self, cursor: str | None) -> None:
+        """Move past a fully processed result page.
+
+        IDs done before the new cursor are no longer needed to resume.
+        """
+        self.cursor = cursor
+        self.done = set()
+        self.save()
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "done": sorted(self.done),
+                    "failed": sorted(self.failed),
+                    "cursor": self.cursor,
+                    "scope": self.scope,
+                    "started_at": self.started_at,
+                }
+            )
+        )
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        """Forget progress and failures (run finished or restart requested)."""
+        self.done = set()
+        self.failed = set()
+        self.cursor = None
+        self.started_at = time.time()
+        self.path.unlink(missing_ok=True)
+
+    def finish(self) -> None:
+        """Every item was attempted: the next run starts over.
+
+        Only the failures are kept, so one item that always fails cannot
+        keep the done set (and the skips it causes) alive forever.
+        """
+        if not self.failed:
+            self.clear()
+            return
+        self.done = set()
+        self.cursor = None
+        self.started_at = time.time()
+        self.save()
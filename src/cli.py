@@ -2,13 +2,22 @@ import argparse
 import json
 import os
 import sys
+import time
+from datetime import date
 
 from dotenv import load_dotenv
-from slack_sdk import WebClient
 
-from src.llm_analyzer import analyze_thread
-from src.notion_client import save_to_notion
-from src.slack_client import fetch_slack_thread, parse_slack_thread_url
+# Only lightweight modules at import time: the CLI runs from shell loops, and
+# pydantic models, google-genai, slack_sdk and httpx are imported by the
+# commands that use them (see tests/test_cli.py::TestImportBudget).
+from src.aging import run_aging_update, send_reminder_digest
+from src.checkpoint import Checkpoint
+from src.jobs import JobRunner, JobStore
+from src.notion_mirror import NotionMirror
+from src.notion_schema import ensure_schema, is_formula_aging
+
+REFRESH_CHECKPOINT = "refresh"
+AGING_CHECKPOINT = "aging"
 
 
 def _require_env(key: str) -> str:
@@ -18,50 +27,500 @@ def _require_env(key: str) -> str:
     return value
 
 
+def _search_index():
+    from src.search_index import SearchIndex, embedder_from_config
+
+    return SearchIndex(embedder=embedder_from_config(os.environ.get))
+
+
+def _indexes() -> list:
+    """Local indexes updated with every saved analysis."""
+    from src.concept_index import ConceptIndex
+
+    return [_search_index(), ConceptIndex()]
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="flow-to-stock",
         description="Headless processing for Slack thread -> analysis -> Notion",
+        epilog="Subcommands: refresh, aging, serve-events, search, concepts (run 'flow-to-stock <command> --help')",
     )
     parser.add_argument("slack_url", help="Slack thread URL")
     parser.add_argument("--memo", default=None, help="Optional memo/context")
     parser.add_argument(
         "--model",
-        default="gemini-2.0-flash",
-        help="Gemini model name",
+        default=None,
+        help="Gemini model name (default: GEMINI_MODEL, or per GEMINI_MODEL_ROUTES)",
     )
     parser.add_argument(
         "--no-save",
         action="store_true",
         help="Analyze only (skip Notion save)",
     )
+    parser.add_argument(
+        "--provision-schema",
+        action="store_true",
+        help="Create missing Notion database properties before analysis",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-analyze even if the thread is unchanged since it was last saved",
+    )
+    return parser
+
+
+def build_refresh_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="flow-to-stock refresh",
+        description=(
+            "Re-analyze saved Open/Waiting threads and update Notion. "
+            "Progress is checkpointed; an interrupted run resumes where it stopped."
+        ),
+    )
+    parser.add_argument(
+        "slack_urls",
+        nargs="*",
+        help="Only refresh these Slack thread URLs (default: all open pages)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-analyze even if the thread is unchanged since the last save",
+    )
+    parser.add_argument(
+        "--max-minutes",
+        type=float,
+        default=None,
+        help="Stop starting new items after this many minutes (resume next run)",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the saved checkpoint and process every page again",
+    )
+    return parser
+
+
+def refresh_main(argv: list[str]) -> int:
+    args = build_refresh_parser().parse_args(argv)
+    from slack_sdk import WebClient
+
+    from src.model_router import ModelRouter
+    from src.notion_client import iter_open_pages
+    from src.pipeline import StageLimits, refresh_threads
+    from src.thread_state import ThreadStateStore
+    from src.token_budget import TokenBudget
+
+    try:
+        slack_token = _require_env("SLACK_USER_TOKEN")
+        gemini_api_key = _require_env("GEMINI_API_KEY")
+        notion_token = _require_env("NOTION_TOKEN")
+        notion_db_id = _require_env("NOTION_DATABASE_ID")
+        schema = ensure_schema(notion_token, notion_db_id)
+
+        # Targeted runs (explicit URLs) never touch the nightly checkpoint
+        wanted = set(args.slack_urls)
+        checkpoint = None if wanted else Checkpoint(REFRESH_CHECKPOINT)
+        if checkpoint and args.restart:
+            checkpoint.clear()
+        done = checkpoint.done if checkpoint else set()
+
+        mirror = NotionMirror(notion_db_id)
+        pages = (
+            page
+            for page in iter_open_pages(notion_token, notion_db_id, mirror)
+            if page["page_id"] not in done
+            and (not wanted or page["slack_url"] in wanted)
+        )
+        deadline = (
+            time.monotonic() + args.max_minutes * 60 if args.max_minutes else None
+        )
+
+        summary = {"updated": 0, "skipped": 0, "failed": 0, "total_tokens": 0}
+        results = refresh_threads(
+            pages,
+            WebClient(token=slack_token),
+            gemini_api_key,
+            notion_token,
+            notion_db_id,
+            aging_formula=is_formula_aging(schema),
+            limits=StageLimits.from_config(os.environ.get),
+            state=ThreadStateStore(),
+            force=args.force,
+            deadline=deadline,
+            router=ModelRouter.from_config(os.environ.get),
+            indexes=_indexes(),
+            mirror=mirror,
+            budget=TokenBudget.from_config(os.environ.get),
+        )
+        for page, result, error in results:
+            if error:
+                summary["failed"] += 1
+                if checkpoint:
+                    checkpoint.mark_failed(page["page_id"])
+                print(json.dumps({"slack_url": page["slack_url"], "error": error}, ensure_ascii=False))
+                continue
+
+            if checkpoint:
+                checkpoint.mark_done(page["page_id"])
+            summary["skipped" if result["skipped"] else "updated"] += 1
+            summary["total_tokens"] += result["total_tokens"]
+            print(json.dumps({"slack_url": page["slack_url"], **result}, ensure_ascii=False))
+
+        summary["complete"] = deadline is None or time.monotonic() < deadline
+        if checkpoint and summary["complete"]:
+            checkpoint.finish()
+        print(json.dumps({"summary": summary}, ensure_ascii=False))
+        return 1 if summary["failed"] else 0
+    except Exception as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+
+
+def build_aging_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="flow-to-stock aging",
+        description=(
+            "Update Aging Days and send stale-discussion reminders. "
+            "Progress is checkpointed; a failed run resumes where it stopped."
+        ),
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report what would be updated and reminded without writing or sending",
+    )
+    parser.add_argument(
+        "--no-remind",
+        action="store_true",
+        help="Skip the Slack reminder digest",
+    )
+    parser.add_argument(
+        "--aging-mode",
+        choices=["number", "formula"],
+        default=os.environ.get("NOTION_AGING_MODE") or None,
+        help="Aging Days mode (default: NOTION_AGING_MODE or the database schema)",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the saved checkpoint and start from the first page",
+    )
     return parser
 
 
+def aging_main(argv: list[str]) -> int:
+    args = build_aging_parser().parse_args(argv)
+    started = time.monotonic()
+
+    try:
+        notion_token = _require_env("NOTION_TOKEN")
+        notion_db_id = _require_env("NOTION_DATABASE_ID")
+
+        checkpoint = (
+            None
+            if args.dry_run
+            else Checkpoint(AGING_CHECKPOINT, scope=date.today().isoformat())
+        )
+        if checkpoint and args.restart:
+            checkpoint.clear()
+        resumed = bool(checkpoint and checkpoint.resumed)
+
+        result = run_aging_update(
+            notion_token,
+            notion_db_id,
+            aging_mode=args.aging_mode,
+            checkpoint=checkpoint,
+            dry_run=args.dry_run,
+            mirror=NotionMirror(notion_db_id),
+        )
+        if checkpoint:
+            checkpoint.clear()
+
+        reminders = result["reminders"]
+        for r in reminders:
+            print(json.dumps({"reminder": r}, ensure_ascii=False))
+
+        digests: list[dict] = []
+        user_id = os.environ.get("SLACK_REMINDER_USER_ID", "")
+        if reminders and user_id and not (args.dry_run or args.no_remind):
+            from slack_sdk import WebClient
+
+            slack = WebClient(token=_require_env("SLACK_USER_TOKEN"))
+            digests = send_reminder_digest(slack, user_id, reminders)
+            for d in digests:
+                if not d["ok"]:
+                    print(f"Reminder digest failed: {d['error']}", file=sys.stderr)
+
+        failed_messages = sum(1 for d in digests if not d["ok"])
+        summary = {
+            "aging_mode": result["aging_mode"],
+            "dry_run": args.dry_run,
+            "resumed": resumed,
+            "scanned": result["scanned"],
+            "updated": result["updated"],
+            "unchanged": result["unchanged"],
+            "reminders": len(reminders),
+            "reminder_messages": len(digests) - failed_messages,
+            "reminder_failures": failed_messages,
+            "elapsed_seconds": round(time.monotonic() - started, 2),
+        }
+        print(json.dumps({"summary": summary}, ensure_ascii=False))
+        return 1 if failed_messages else 0
+    except Exception as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+
+
+def build_serve_events_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="flow-to-stock serve-events",
+        description=(
+            "Receive Slack Events API message events and re-analyze saved "
+            "threads when they get new replies."
+        ),
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address")
+    parser.add_argument("--port", type=int, default=3000, help="Listen port")
+    parser.add_argument(
+        "--debounce-seconds",
+        type=float,
+        default=30.0,
+        help="Wait this long after the last reply before re-analyzing a thread",
+    )
+    parser.add_argument(
+        "--max-wait-seconds",
+        type=float,
+        default=300.0,
+        help="Re-analyze a continuously busy thread at least this often",
+    )
+    return parser
+
+
+def serve_events_main(argv: list[str]) -> int:
+    args = build_serve_events_parser().parse_args(argv)
+    from slack_sdk import WebClient
+
+    from src.events import EVENT_JOB, Debouncer, EventReceiver, enqueue_refresh, make_server
+    from src.model_router import ModelRouter
+    from src.pipeline import StageGates, StageLimits, refresh_saved_thread
+    from src.thread_state import ThreadStateStore
+    from src.token_budget import TokenBudget
+
+    try:
+        signing_secret = _require_env("SLACK_SIGNING_SECRET")
+        slack_token = _require_env("SLACK_USER_TOKEN")
+        gemini_api_key = _require_env("GEMINI_API_KEY")
+        notion_token = _require_env("NOTION_TOKEN")
+        notion_db_id = _require_env("NOTION_DATABASE_ID")
+        schema = ensure_schema(notion_token, notion_db_id)
+    except Exception as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+
+    slack = WebClient(token=slack_token)
+    state = ThreadStateStore()
+    limits = StageLimits.from_config(os.environ.get)
+    gates = StageGates(limits)
+    aging_formula = is_formula_aging(schema)
+    router = ModelRouter.from_config(os.environ.get)
+    indexes = _indexes()
+    mirror = NotionMirror(notion_db_id)
+    budget = TokenBudget.from_config(os.environ.get)
+
+    def handle(payload: dict) -> dict:
+        result = refresh_saved_thread(
+            slack,
+            gemini_api_key,
+            notion_token,
+            notion_db_id,
+            payload["slack_url"],
+            aging_formula=aging_formula,
+            gates=gates,
+            state=state,
+            router=router,
+            indexes=indexes,
+            mirror=mirror,
+            budget=budget,
+        )
+        print(json.dumps({"slack_url": payload["slack_url"], **result}, ensure_ascii=False))
+        return result
+
+    runner = JobRunner(JobStore(), {EVENT_JOB: handle}, workers=limits.workers)
+    debouncer = Debouncer(
+        enqueue_refresh(runner.submit_batch),
+        quiet=args.debounce_seconds,
+        max_wait=args.max_wait_seconds,
+    )
+    server = make_server(args.host, args.port, signing_secret, EventReceiver(state, debouncer))
+
+    runner.start()
+    debouncer.start()
+    print(f"Listening for Slack events on {args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        # Pending threads go to the durable queue and run on the next start
+        debouncer.stop()
+        runner.stop(timeout=5)
+    return 0
+
+
+def build_search_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="flow-to-stock search",
+        description=(
+            "Find saved discussions related to a query (theme, key issues, "
+            "new concepts, risk signals) in the local search index."
+        ),
+    )
+    parser.add_argument("query", nargs="?", default="", help="Search text")
+    parser.add_argument("-n", "--limit", type=int, default=10, help="Maximum results")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Index every analysis saved so far (after upgrading or changing embeddings)",
+    )
+    return parser
+
+
+def search_main(argv: list[str]) -> int:
+    args = build_search_parser().parse_args(argv)
+    from src.thread_state import ThreadStateStore
+
+    try:
+        index = _search_index()
+        if args.rebuild:
+            count = index.backfill(ThreadStateStore())
+            print(json.dumps({"indexed": count}, ensure_ascii=False), file=sys.stderr)
+        if args.query:
+            for hit in index.search(args.query, limit=args.limit):
+                print(json.dumps(hit, ensure_ascii=False))
+        return 0
+    except Exception as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+
+
+def build_concepts_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="flow-to-stock concepts",
+        description=(
+            "Concepts across saved discussions: the most frequent ones, or "
+            "the threads that mention one concept."
+        ),
+    )
+    parser.add_argument("concept", nargs="?", default="", help="Concept name")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="Number of top concepts")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Add the concepts of every analysis saved so far",
+    )
+    return parser
+
+
+def concepts_main(argv: list[str]) -> int:
+    args = build_concepts_parser().parse_args(argv)
+    from src.concept_index import ConceptIndex
+    from src.thread_state import ThreadStateStore
+
+    try:
+        index = ConceptIndex()
+        if args.rebuild:
+            count = index.backfill(ThreadStateStore())
+            print(json.dumps({"indexed": count}, ensure_ascii=False), file=sys.stderr)
+        if not args.concept:
+            for stats in index.top(args.limit):
+                print(json.dumps(stats, ensure_ascii=False))
+            return 0
+        stats = index.concept(args.concept)
+        if stats is None:
+            print(f"Unknown concept: {args.concept}", file=sys.stderr)
+            return 1
+        print(json.dumps({**stats, "thread_urls": index.threads(args.concept)}, ensure_ascii=False))
+        return 0
+    except Exception as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+
+
+COMMANDS = {
+    "refresh": refresh_main,
+    "aging": aging_main,
+    "serve-events": serve_events_main,
+    "search": search_main,
+    "concepts": concepts_main,
+}
+
+
 def main(argv: list[str] | None = None) -> int:
     load_dotenv()
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
     parser = build_parser()
     args = parser.parse_args(argv)
+    from slack_sdk import WebClient
+
+    from src.llm_analyzer import TokenUsage, analyze_thread
+    from src.model_router import ModelRouter
+    from src.notion_client import save_to_notion
+    from src.pipeline import (
+        adopt_saved_url,
+        record_thread_state,
+        saved_overflow,
+        unchanged_since_save,
+    )
+    from src.slack_client import fetch_slack_thread, parse_slack_thread_url
+    from src.thread_state import ThreadStateStore
+    from src.token_budget import TokenBudget
 
     try:
         slack_token = _require_env("SLACK_USER_TOKEN")
         gemini_api_key = _require_env("GEMINI_API_KEY")
         notion_token = ""
         notion_db_id = ""
+        schema: dict = {}
         if not args.no_save:
             notion_token = _require_env("NOTION_TOKEN")
             notion_db_id = _require_env("NOTION_DATABASE_ID")
+            # Fail before spending Slack/LLM calls on a result we cannot save
+            schema = ensure_schema(
+                notion_token, notion_db_id, provision=args.provision_schema
+            )
 
         channel_id, thread_ts = parse_slack_thread_url(args.slack_url)
         slack = WebClient(token=slack_token)
         thread = fetch_slack_thread(slack, channel_id, thread_ts, args.slack_url)
 
-        analysis, token_usage = analyze_thread(
-            thread,
-            gemini_api_key,
-            memo=args.memo,
-            model=args.model,
-        )
+        # Any link to an already saved thread reuses its page and, if nothing
+        # changed, its analysis
+        state = None if args.no_save else ThreadStateStore()
+        previous = None
+        if state:
+            adopt_saved_url(state, thread)
+            if not args.force:
+                previous = unchanged_since_save(state, thread, args.memo)
+        if previous:
+            analysis = previous["analysis"]
+            token_usage = TokenUsage(0, 0, 0, route_reason="unchanged since last save")
+        else:
+            analysis, token_usage = analyze_thread(
+                thread,
+                gemini_api_key,
+                memo=args.memo,
+                model=args.model,
+                router=ModelRouter.from_config(os.environ.get),
+                budget=TokenBudget.from_config(os.environ.get),
+            )
 
         print(json.dumps(analysis.model_dump(), ensure_ascii=False, indent=2))
         print(
@@ -70,12 +529,16 @@ def main(argv: list[str] | None = None) -> int:
                     "prompt_tokens": token_usage.prompt_tokens,
                     "completion_tokens": token_usage.completion_tokens,
                     "total_tokens": token_usage.total_tokens,
+                    "model": token_usage.model,
+                    "route_reason": token_usage.route_reason,
                 },
                 ensure_ascii=False,
             )
         )
 
-        if not args.no_save:
+        if previous:
+            print(json.dumps({"notion_page_url": previous["page_url"]}, ensure_ascii=False))
+        elif not args.no_save:
             page_url = save_to_notion(
                 notion_token,
                 notion_db_id,
@@ -83,7 +546,13 @@ def main(argv: list[str] | None = None) -> int:
                 thread.url,
                 thread.channel_name,
                 args.memo,
+                aging_formula=is_formula_aging(schema),
+                mirror=NotionMirror(notion_db_id),
+                overflow=saved_overflow(state, thread),
             )
+            record_thread_state(state, thread, analysis, args.memo, page_url)
+            for index in _indexes():
+                index.record(thread, analysis, page_url)
             print(json.dumps({"notion_page_url": page_url}, ensure_ascii=False))
 
         return 0
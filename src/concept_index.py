@@ -0,0 +1,167 @@
+import threading
+from collections.abc import Iterable
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from src.models import AnalysisResult, SlackThread
+from src.storage import connect
+
+if TYPE_CHECKING:
+    from src.thread_state import ThreadStateStore
+
+CONCEPT_DB = "concepts.sqlite3"
+
+# `concepts` holds the running aggregates, so a lookup is one primary-key
+# read instead of a scan over every saved analysis.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS concepts (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    threads INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS concept_threads (
+    concept_key TEXT NOT NULL,
+    thread_key TEXT NOT NULL,
+    slack_url TEXT NOT NULL,
+    page_url TEXT NOT NULL DEFAULT '',
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (concept_key, thread_key)
+);
+CREATE INDEX IF NOT EXISTS concepts_frequency ON concepts (threads DESC, last_seen DESC);
+"""
+
+
+def concept_key(name: str) -> str:
+    """Case- and whitespace-insensitive identity of a concept."""
+    return " ".join(name.split()).casefold()
+
+
+def _date(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).date().isoformat()
+
+
+def _stats(row) -> dict:
+    return {
+        "name": row["name"],
+        "threads": row["threads"],
+        "first_seen": _date(row["first_seen"]),
+        "last_seen": _date(row["last_seen"]),
+    }
+
+
+class ConceptIndex:
+    """Concept → threads aggregation over saved analyses.
+
+    Dates are the Slack activity of the thread when the concept was seen.
+    A concept stays linked to a thread after a later analysis drops it, so
+    first_seen/last_seen keep the full history.
+    """
+
+    def __init__(self, name: str = CONCEPT_DB):
+        self._conn = connect(name)
+        self._lock = threading.Lock()
+        self._conn.executescript(_SCHEMA)
+
+    def add(
+        self,
+        thread_key: str,
+        concepts: Iterable[str],
+        seen_at: float,
+        slack_url: str,
+        page_url: str = "",
+    ) -> None:
+        names = {concept_key(c): " ".join(c.split()) for c in concepts if c.strip()}
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for key, name in names.items():
+                linked = self._conn.execute(
+                    "SELECT 1 FROM concept_threads WHERE concept_key = ? AND thread_key = ?",
+                    (key, thread_key),
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT INTO concept_threads"
+                    " (concept_key, thread_key, slack_url, page_url, first_seen, last_seen)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (concept_key, thread_key) DO UPDATE SET"
+                    "  slack_url = excluded.slack_url,"
+                    "  page_url = COALESCE(NULLIF(excluded.page_url, ''), page_url),"
+                    "  first_seen = MIN(first_seen, excluded.first_seen),"
+                    "  last_seen = MAX(last_seen, excluded.last_seen)",
+                    (key, thread_key, slack_url, page_url, seen_at, seen_at),
+                )
+                self._conn.execute(
+                    "INSERT INTO concepts (key, name, threads, first_seen, last_seen)"
+                    " VALUES (?, ?, 1, ?, ?)"
+                    " ON CONFLICT (key) DO UPDATE SET"
+                    "  name = excluded.name,"
+                    "  threads = threads + ?,"
+                    "  first_seen = MIN(first_seen, excluded.first_seen),"
+                    "  last_seen = MAX(last_seen, excluded.last_seen)",
+                    (key, name, seen_at, seen_at, 0 if linked else 1),
+                )
+            self._conn.execute("COMMIT")
+
+    def record(self, thread: SlackThread, analysis: AnalysisResult, page_url: str = "") -> None:
+        """Add the concepts of a saved analysis (keyed by thread)."""
+        self.add(
+            f"{thread.channel_id}:{thread.thread_ts}",
+            analysis.new_concepts,
+            thread.last_reply_at.timestamp(),
+            thread.url,
+            page_url,
+        )
+
+    def backfill(self, state: "ThreadStateStore") -> int:
+        """Add the concepts of every analysis in the thread state store. Returns the count."""
+        count = 0
+        for saved in state.iter_saved():
+            self.add(
+                f"{saved['channel_id']}:{saved['thread_ts']}",
+                saved["analysis"].new_concepts,
+                float(saved["last_ts"]),
+                saved["slack_url"],
+                saved["page_url"],
+            )
+            count += 1
+        return count
+
+    def concept(self, name: str) -> dict | None:
+        """Return dict with: name, threads, first_seen, last_seen; None if unseen."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM concepts WHERE key = ?", (concept_key(name),)
+            ).fetchone()
+        return _stats(row) if row else None
+
+    def threads(self, name: str) -> list[dict]:
+        """Threads mentioning a concept, most recent first.
+
+        Returns list of dicts with: slack_url, page_url, first_seen, last_seen.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT slack_url, page_url, first_seen, last_seen FROM concept_threads"
+                " WHERE concept_key = ? ORDER BY last_seen DESC",
+                (concept_key(name),),
+            ).fetchall()
+        return [
+            {
+                "slack_url": r["slack_url"],
+                "page_url": r["page_url"],
+                "first_seen": _date(r["first_seen"]),
+                "last_seen": _date(r["last_seen"]),
+            }
+            for r in rows
+        ]
+
+    def top(self, limit: int = 20) -> list[dict]:
+        """Concepts seen in the most threads (ties: most recent first)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM concepts ORDER BY threads DESC, last_seen DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [_stats(r) for r in rows]
@@ -0,0 +1,220 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.jobs import PRIORITY_BULK
+from src.thread_state import ThreadStateStore
+
+EVENT_JOB = "thread_event"
+
+# Slack rejects replays older than five minutes; so do we.
+MAX_REQUEST_AGE = 300
+DEBOUNCE_SECONDS = 30.0
+DEBOUNCE_MAX_WAIT = 300.0
+FLUSH_INTERVAL = 1.0
+
+
+def sign_request(signing_secret: str, timestamp: str, body: bytes) -> str:
+    """Compute X-Slack-Signature for a body (also used by local senders)."""
+    basestring = b"v0:" + timestamp.encode() + b":" + body
+    return "v0=" + hmac.new(signing_secret.encode(), basestring, hashlib.sha256).hexdigest()
+
+
+def verify_signature(
+    signing_secret: str,
+    timestamp: str,
+    body: bytes,
+    signature: str,
+    now: float | None = None,
+) -> bool:
+    """Check a request's X-Slack-Signature against the signing secret."""
+    try:
+        age = abs((time.time() if now is None else now) - int(timestamp))
+    except (TypeError, ValueError):
+        return False
+    if age > MAX_REQUEST_AGE:
+        return False
+    return hmac.compare_digest(sign_request(signing_secret, timestamp, body), signature or "")
+
+
+def thread_key(event: dict) -> tuple[str, str] | None:
+    """(channel_id, thread_ts) of the thread a message event belongs to.
+
+    Covers new replies and edited/deleted messages; None for anything that is
+    not part of a thread.
+    """
+    if event.get("type") != "message":
+        return None
+    message = event
+    if event.get("subtype") == "message_changed":
+        message = event.get("message", {})
+    elif event.get("subtype") == "message_deleted":
+        message = event.get("previous_message", {})
+    channel_id = event.get("channel")
+    thread_ts = message.get("thread_ts")
+    if not channel_id or not thread_ts:
+        return None
+    return channel_id, thread_ts
+
+
+class Debouncer:
+    """Coalesce bursts of events per key into one call of `on_flush`.
+
+    A key is flushed once it has been quiet for `quiet` seconds, or
+    `max_wait` seconds after its first event so a busy thread still gets
+    refreshed.
+    """
+
+    def __init__(
+        self,
+        on_flush: Callable[[tuple, str], None],
+        quiet: float = DEBOUNCE_SECONDS,
+        max_wait: float = DEBOUNCE_MAX_WAIT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.on_flush = on_flush
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self.clock = clock
+        self._pending: dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def touch(self, key: tuple, value: str) -> None:
+        now = self.clock()
+        with self._lock:
+            entry = self._pending.setdefault(key, {"first": now})
+            entry["last"] = now
+            entry["value"] = value
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush_due(self) -> int:
+        """Flush every key whose wait is over. Returns the number flushed."""
+        now = self.clock()
+        with self._lock:
+            due = [
+                (key, entry["value"])
+                for key, entry in self._pending.items()
+                if now - entry["last"] >= self.quiet or now - entry["first"] >= self.max_wait
+            ]
+            for key, _ in due:
+                del self._pending[key]
+        for key, value in due:
+            self.on_flush(key, value)
+        return len(due)
+
+    def flush_all(self) -> int:
+        with self._lock:
+            due = [(key, entry["value"]) for key, entry in self._pending.items()]
+            self._pending.clear()
+        for key, value in due:
+            self.on_flush(key, value)
+        return len(due)
+
+    def start(self, interval: float = FLUSH_INTERVAL) -> None:
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, args=(interval,), name="event-debouncer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flush loop and flush whatever is still pending."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush_all()
+
+    def _loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.flush_due()
+
+
+class EventReceiver:
+    """Route Slack event payloads for tracked threads into the debouncer."""
+
+    def __init__(self, state: ThreadStateStore, debouncer: Debouncer):
+        self.state = state
+        self.debouncer = debouncer
+
+    def handle(self, payload: dict) -> dict:
+        """Process one Events API payload. Returns the JSON response body."""
+        if payload.get("type") == "url_verification":
+            return {"challenge": payload.get("challenge", "")}
+        if payload.get("type") != "event_callback":
+            return {}
+
+        key = thread_key(payload.get("event", {}))
+        if key is None:
+            return {}
+        slack_url = self.state.tracked_url(*key)
+        if slack_url:
+            self.debouncer.touch(key, slack_url)
+        return {}
+
+
+def enqueue_refresh(submit_batch: Callable[..., str]):
+    """Debouncer callback that queues one refresh job per flushed thread.
+
+    Jobs are keyed by thread, so a thread still waiting in the queue is not
+    queued twice.
+    """
+
+    def on_flush(key: tuple, slack_url: str) -> None:
+        submit_batch(
+            EVENT_JOB,
+            [(slack_url, {"slack_url": slack_url})],
+            priority=PRIORITY_BULK,
+            key=lambda payload: ":".join(key),
+        )
+
+    return on_flush
+
+
+def make_server(
+    host: str, port: int, signing_secret: str, receiver: EventReceiver
+) -> ThreadingHTTPServer:
+    """HTTP server for the Slack Events API request URL (any path)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length)
+            if not verify_signature(
+                signing_secret,
+                self.headers.get("X-Slack-Request-Timestamp", ""),
+                body,
+                self.headers.get("X-Slack-Signature", ""),
+            ):
+                self._reply(401, {"error": "invalid signature"})
+                return
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                self._reply(400, {"error": "invalid JSON"})
+                return
+            self._reply(200, receiver.handle(payload))
+
+        def _reply(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
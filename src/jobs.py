@@ -0,0 +1,332 @@
+import json
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable
+
+from src.storage import connect
+
+JOBS_DB = "jobs.sqlite3"
+POLL_INTERVAL = 1.0
+# Running jobs are leased: their runner renews the lease every
+# HEARTBEAT_INTERVAL; a job whose lease is LEASE_SECONDS old belongs to a
+# dead process and is queued again.
+HEARTBEAT_INTERVAL = 15.0
+LEASE_SECONDS = 60.0
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Folded into an identical pending job; status/result come from that job.
+COALESCED = "coalesced"
+
+# Lower runs first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    label TEXT NOT NULL DEFAULT '',
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id);
+"""
+
+_COLUMNS = {
+    "dedupe_key": "TEXT NOT NULL DEFAULT ''",
+    "priority": f"INTEGER NOT NULL DEFAULT {PRIORITY_BULK}",
+    "coalesced_into": "INTEGER",
+    "owner": "TEXT NOT NULL DEFAULT ''",
+    "heartbeat_at": "REAL NOT NULL DEFAULT 0",
+}
+
+
+def _row_to_job(row) -> dict:
+    return {
+        "id": row["id"],
+        "batch_id": row["batch_id"],
+        "kind": row["kind"],
+        "label": row["label"],
+        "payload": json.loads(row["payload"]),
+        "status": row["status"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "dedupe_key": row["dedupe_key"],
+        "priority": row["priority"],
+        "coalesced_into": row["coalesced_into"],
+    }
+
+
+class JobStore:
+    """Persistent job queue (SQLite) shared by the UI and workers."""
+
+    def __init__(self, name: str = JOBS_DB):
+        self._conn = connect(name)
+        self._lock = threading.Lock()
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, decl in _COLUMNS.items():
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {decl}")
+        self._conn.execute("DROP INDEX IF EXISTS jobs_status")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, id)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (kind, dedupe_key, status)"
+        )
+
+    def submit_batch(
+        self,
+        kind: str,
+        items: list[tuple[str, dict]],
+        priority: int = PRIORITY_BULK,
+        key: Callable[[dict], str] | None = None,
+    ) -> str:
+        """Queue one job per (label, payload). Returns the batch ID.
+
+        With `key`, a payload whose key matches a job of the same kind that
+        is still pending is coalesced into it: the pending job takes the new
+        payload and the higher priority, and this batch gets a COALESCED
+        entry that reports that job's progress.
+        """
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for label, payload in items:
+                dedupe_key = key(payload) if key else ""
+                data = json.dumps(payload, ensure_ascii=False)
+                existing = None
+                if dedupe_key:
+                    existing = self._conn.execute(
+                        "SELECT id FROM jobs WHERE kind = ? AND dedupe_key = ? AND status = ?"
+                        " ORDER BY id LIMIT 1",
+                        (kind, dedupe_key, PENDING),
+                    ).fetchone()
+                if existing:
+                    self._conn.execute(
+                        "UPDATE jobs SET label = ?, payload = ?, priority = MIN(priority, ?),"
+                        " updated_at = ? WHERE id = ?",
+                        (label, data, priority, now, existing["id"]),
+                    )
+                self._conn.execute(
+                    "INSERT INTO jobs (batch_id, kind, label, payload, status, dedupe_key,"
+                    " priority, coalesced_into, created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        batch_id,
+                        kind,
+                        label,
+                        data,
+                        COALESCED if existing else PENDING,
+                        dedupe_key,
+                        priority,
+                        existing["id"] if existing else None,
+                        now,
+                        now,
+                    ),
+                )
+            self._conn.execute("COMMIT")
+        return batch_id
+
+    def claim(self, kinds: Iterable[str] | None = None, owner: str = "") -> dict | None:
+        """Atomically move the next pending job to running and return it.
+
+        Highest priority first, then oldest. Jobs whose dedupe key is
+        already running wait, so one thread is never processed twice at once.
+        Only `kinds` are claimed when given. The job is leased to `owner`
+        (see heartbeat).
+        """
+        query = (
+            "SELECT * FROM jobs WHERE status = ?"
+            " AND (dedupe_key = '' OR dedupe_key NOT IN"
+            " (SELECT dedupe_key FROM jobs WHERE status = ? AND dedupe_key != ''))"
+        )
+        params: list = [PENDING, RUNNING]
+        if kinds is not None:
+            kinds = list(kinds)
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params += kinds
+        query += " ORDER BY priority, id LIMIT 1"
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(query, params).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            now = time.time()
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, heartbeat_at = ?, updated_at = ?"
+                " WHERE id = ?",
+                (RUNNING, owner, now, now, row["id"]),
+            )
+            self._conn.execute("COMMIT")
+        job = _row_to_job(row)
+        job["status"] = RUNNING
+        return job
+
+    def finish(self, job_id: int, result: dict) -> None:
+        self._set_status(job_id, DONE, result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id: int, error: str) -> None:
+        self._set_status(job_id, FAILED, error=error)
+
+    def _set_status(self, job_id: int, status: str, result=None, error=None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+
+    def heartbeat(self, owner: str) -> None:
+        """Renew the lease on every job `owner` is running."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND owner = ?",
+                (time.time(), RUNNING, owner),
+            )
+
+    def requeue_running(
+        self, kinds: Iterable[str] | None = None, lease: float = LEASE_SECONDS
+    ) -> int:
+        """Return jobs left running by a dead process to the queue.
+
+        Only jobs whose lease has not been renewed for `lease` seconds are
+        requeued, so jobs of other live processes sharing the queue keep
+        running. Only `kinds` are requeued when given.
+        """
+        query = "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND heartbeat_at < ?"
+        now = time.time()
+        params: list = [PENDING, now, RUNNING, now - lease]
+        if kinds is not None:
+            kinds = list(kinds)
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params += kinds
+        with self._lock:
+            cur = self._conn.execute(query, params)
+        return cur.rowcount
+
+    def batch(self, batch_id: str) -> list[dict]:
+        """Jobs of a batch; coalesced entries report their target's progress."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT j.*, t.status AS target_status, t.result AS target_result,"
+                " t.error AS target_error"
+                " FROM jobs j LEFT JOIN jobs t ON t.id = j.coalesced_into"
+                " WHERE j.batch_id = ? ORDER BY j.id",
+                (batch_id,),
+            ).fetchall()
+        jobs = []
+        for row in rows:
+            job = _row_to_job(row)
+            if row["target_status"]:
+                job["status"] = row["target_status"]
+                job["result"] = json.loads(row["target_result"]) if row["target_result"] else None
+                job["error"] = row["target_error"]
+            jobs.append(job)
+        return jobs
+
+    def latest_batch_id(self, kind: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT batch_id FROM jobs WHERE kind = ? ORDER BY id DESC LIMIT 1", (kind,)
+            ).fetchone()
+        return row["batch_id"] if row else None
+
+
+def batch_progress(jobs: list[dict]) -> dict:
+    """Summarize a batch: total, done, failed, finished (done + failed)."""
+    done = sum(1 for j in jobs if j["status"] == DONE)
+    failed = sum(1 for j in jobs if j["status"] == FAILED)
+    return {"total": len(jobs), "done": done, "failed": failed, "finished": done + failed}
+
+
+class JobRunner:
+    """Worker threads that drain a JobStore using one handler per job kind."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        handlers: dict[str, Callable[[dict], dict]],
+        workers: int = 2,
+        poll_interval: float = POLL_INTERVAL,
+    ):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.owner = uuid.uuid4().hex
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self.store.requeue_running(self.handlers)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def submit_batch(
+        self,
+        kind: str,
+        items: list[tuple[str, dict]],
+        priority: int = PRIORITY_BULK,
+        key: Callable[[dict], str] | None = None,
+    ) -> str:
+        batch_id = self.store.submit_batch(kind, items, priority=priority, key=key)
+        self._wake.set()
+        return batch_id
+
+    def run_one(self) -> bool:
+        """Process a single pending job. Returns False if the queue was empty."""
+        job = self.store.claim(self.handlers, owner=self.owner)
+        if job is None:
+            return False
+        try:
+            result = self.handlers[job["kind"]](job["payload"])
+        except Exception as e:
+            self.store.fail(job["id"], str(e))
+        else:
+            self.store.finish(job["id"], result)
+        return True
+
+    def _heartbeat(self) -> None:
+        """Keep our jobs leased and pick up those of runners that died."""
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            self.store.heartbeat(self.owner)
+            if self.store.requeue_running(self.handlers):
+                self._wake.set()
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            if not self.run_one():
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
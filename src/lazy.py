@@ -0,0 +1,27 @@
+import importlib
+from types import ModuleType
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    Keeps heavy SDKs (google-genai, slack_sdk, httpx) off the import path of
+    commands that never call them. Attributes set on the stand-in (e.g. by
+    unittest.mock.patch) shadow the module's own.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: ModuleType | None = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
@@ -1,11 +1,25 @@
 import json
 import re
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-from google import genai
 from pydantic import ValidationError
 
-from src.models import AnalysisResult, SlackThread
+from src.lazy import lazy_import
+from src.model_router import DEFAULT_LIMITS, GenerationLimits, ModelRouter, Route
+from src.models import AnalysisResult, SlackMessage, SlackThread
+from src.token_budget import (
+    PROMPT_TOKEN_BUDGET,
+    TokenBudget,
+    estimate_tokens,
+    keep_head_and_tail,
+)
+
+if TYPE_CHECKING:
+    from google import genai
+else:
+    genai = lazy_import("google.genai")
 
 
 @dataclass
@@ -13,6 +27,8 @@ class TokenUsage:
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    model: str = ""
+    route_reason: str = ""
 
 SYSTEM_PROMPT = """You are an expert at analyzing Slack discussions and extracting structured insights.
 
@@ -48,41 +64,112 @@ Rules:
 - Be concise but thorough
 - participants: list every person who spoke, summarize their stance and arguments"""
 
+INCREMENTAL_SYSTEM_PROMPT = SYSTEM_PROMPT + """
 
-def format_thread_for_prompt(thread: SlackThread, memo: str | None = None) -> str:
-    """Format a SlackThread into a text prompt for the LLM."""
-    lines = [f"Channel: #{thread.channel_name}", ""]
+You are given a previous analysis of the thread (as JSON) and only the messages
+posted since then. Update the previous analysis to reflect the new messages and
+output the complete updated JSON object with the same structure. Keep everything
+from the previous analysis that is still valid; revise items the new messages
+resolve or contradict."""
 
-    for msg in thread.messages:
-        ts_str = msg.timestamp.strftime("%Y-%m-%d %H:%M")
-        lines.append(f"[{ts_str}] {msg.user}: {msg.text}")
 
-    if memo:
-        lines.append("")
-        lines.append(f"Additional context from the user: {memo}")
+OMISSION_NOTE = "({} messages omitted here: the thread exceeds the prompt size limit.)"
 
-    return "\n".join(lines)
 
+def _message_line(msg: SlackMessage) -> str:
+    return f"[{msg.timestamp.strftime('%Y-%m-%d %H:%M')}] {msg.user}: {msg.text}"
 
-def analyze_thread(
+
+def iter_prompt_lines(
+    channel_name: str,
+    messages: Iterable[SlackMessage],
+    memo: str | None = None,
+    gaps: dict[int, int] | None = None,
+) -> Iterator[str]:
+    """Yield the prompt lines for `messages`, then the memo.
+
+    `gaps` maps a message index to the number of messages left out just
+    before it (see format_thread_for_prompt); each gap is marked with
+    OMISSION_NOTE.
+    """
+    yield f"Channel: #{channel_name}"
+    yield ""
+
+    for i, msg in enumerate(messages):
+        if gaps and gaps.get(i):
+            yield OMISSION_NOTE.format(gaps[i])
+        yield _message_line(msg)
+
+    if memo:
+        yield ""
+        yield f"Additional context from the user: {memo}"
+
+
+def format_thread_for_prompt(
     thread: SlackThread,
-    api_key: str,
     memo: str | None = None,
-    model: str = "gemini-2.0-flash",
+    max_tokens: int | None = PROMPT_TOKEN_BUDGET,
+) -> str:
+    """Format a SlackThread into a text prompt for the LLM.
+
+    A thread over `max_tokens` keeps its opening messages and its most
+    recent replies (see keep_head_and_tail); every gap, including replies
+    omitted when the thread was fetched, is marked in the prompt.
+    """
+    kept = list(enumerate(thread.messages))
+    if max_tokens is not None:
+        budget = max_tokens - (estimate_tokens(memo) if memo else 0)
+        head, tail, _ = keep_head_and_tail(
+            kept, lambda item: estimate_tokens(_message_line(item[1])), max(budget, 0)
+        )
+        kept = head + tail
+
+    gaps: dict[int, int] = {}
+    previous = -1
+    for position, (index, _) in enumerate(kept):
+        skipped = index - previous - 1
+        if thread.omitted and previous < thread.omitted_at <= index:
+            skipped += thread.omitted
+        if skipped:
+            gaps[position] = skipped
+        previous = index
+
+    return "\n".join(
+        iter_prompt_lines(
+            thread.channel_name,
+            [msg for _, msg in kept],
+            memo,
+            gaps=gaps,
+        )
+    )
+
+
+def _generate_analysis(
+    client: "genai.Client",
+    model: str,
+    prompt_text: str,
+    system_instruction: str,
+    limits: GenerationLimits = DEFAULT_LIMITS,
+    usage: TokenUsage | None = None,
 ) -> tuple[AnalysisResult, TokenUsage]:
-    """Analyze a Slack thread using Gemini and return structured result with token usage."""
-    client = genai.Client(api_key=api_key)
-    prompt_text = format_thread_for_prompt(thread, memo)
+    """Call Gemini and parse the JSON analysis, retrying once on bad output.
 
-    total_usage = TokenUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+    Usage is added to `usage` as each response arrives, so a caller passing
+    one still sees the tokens billed when a later attempt fails.
+    """
+    total_usage = usage or TokenUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+    thinking = None
+    if limits.thinking_budget is not None:
+        thinking = genai.types.ThinkingConfig(thinking_budget=limits.thinking_budget)
 
     for attempt in range(2):
         response = client.models.generate_content(
             model=model,
             contents=prompt_text,
             config=genai.types.GenerateContentConfig(
-                system_instruction=SYSTEM_PROMPT,
-                max_output_tokens=4096,
+                system_instruction=system_instruction,
+                max_output_tokens=limits.max_output_tokens,
+                thinking_config=thinking,
             ),
         )
 
@@ -106,3 +193,141 @@ def analyze_thread(
             raise
 
     raise RuntimeError("Failed to parse LLM response after retries")
+
+
+def _route(thread: SlackThread, model: str | None, router: ModelRouter | None) -> Route:
+    if model:
+        return Route(model, "explicit")
+    return (router or ModelRouter()).route(thread)
+
+
+def _routed_analysis(
+    client: "genai.Client",
+    route: Route,
+    prompt_text: str,
+    system_instruction: str,
+    budget: TokenBudget | None = None,
+    compact: Callable[[int], str] | None = None,
+) -> tuple[AnalysisResult, TokenUsage]:
+    """Generate with `route`, after a pre-flight check against `budget`.
+
+    `compact(max_tokens)` re-formats the prompt within a smaller size; when
+    it is None an over-budget prompt can only be routed or rejected.
+    """
+    plan = None
+    if budget:
+        system_tokens = estimate_tokens(system_instruction)
+        plan = budget.preflight(
+            system_tokens + estimate_tokens(prompt_text), can_compact=compact is not None
+        )
+        if plan.max_tokens is not None:
+            prompt_text = compact(plan.max_tokens - system_tokens)
+            route = Route(route.model, f"{route.reason}; compacted: {plan.reason}")
+        if plan.model:
+            route = Route(plan.model, f"budget overflow: {plan.reason}")
+
+    usage = TokenUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+    try:
+        result, usage = _generate_analysis(
+            client, route.model, prompt_text, system_instruction, route.generation_limits, usage
+        )
+    finally:
+        # On failure, the attempts that did get a response were still billed
+        if plan:
+            budget.settle(plan, usage.total_tokens)
+    usage.model = route.model
+    usage.route_reason = route.reason
+    return result, usage
+
+
+def analyze_thread(
+    thread: SlackThread,
+    api_key: str,
+    memo: str | None = None,
+    model: str | None = None,
+    client: "genai.Client | None" = None,
+    router: ModelRouter | None = None,
+    budget: TokenBudget | None = None,
+) -> tuple[AnalysisResult, TokenUsage]:
+    """Analyze a Slack thread using Gemini and return structured result with token usage.
+
+    Pass a long-lived `client` to reuse its connection pool across calls.
+    Without an explicit `model`, `router` (default rules if None) picks one;
+    the choice is recorded in TokenUsage.model / route_reason. With `budget`,
+    the estimated prompt is checked first: an over-budget thread is cut to
+    its opening and latest messages, routed or rejected (BudgetExceeded).
+    """
+    if client is None:
+        client = genai.Client(api_key=api_key)
+    prompt_text = format_thread_for_prompt(thread, memo)
+    return _routed_analysis(
+        client,
+        _route(thread, model, router),
+        prompt_text,
+        SYSTEM_PROMPT,
+        budget=budget,
+        compact=lambda max_tokens: format_thread_for_prompt(thread, memo, max_tokens),
+    )
+
+
+def new_messages_since(thread: SlackThread, since_ts: str) -> list[SlackMessage]:
+    """Messages posted after the Slack ts `since_ts`."""
+    since = float(since_ts)
+    return [m for m in thread.messages if m.ts and float(m.ts) > since]
+
+
+def format_delta_for_prompt(
+    thread: SlackThread,
+    previous: AnalysisResult,
+    new_messages: list[SlackMessage],
+    memo: str | None = None,
+) -> str:
+    """Format the previous analysis plus only the new replies."""
+    lines = [
+        f"Channel: #{thread.channel_name}",
+        "",
+        "Previous analysis:",
+        previous.model_dump_json(),
+        "",
+        "New messages since the previous analysis:",
+    ]
+
+    lines.extend(_message_line(msg) for msg in new_messages)
+
+    if memo:
+        lines.append("")
+        lines.append(f"Additional context from the user: {memo}")
+
+    return "\n".join(lines)
+
+
+def analyze_thread_incremental(
+    thread: SlackThread,
+    api_key: str,
+    previous: AnalysisResult,
+    since_ts: str,
+    memo: str | None = None,
+    model: str | None = None,
+    client: "genai.Client | None" = None,
+    router: ModelRouter | None = None,
+    budget: TokenBudget | None = None,
+) -> tuple[AnalysisResult, TokenUsage]:
+    """Update a previous analysis using only messages after `since_ts`.
+
+    Prompt size scales with the number of new replies, not the thread length.
+    The model is routed on the whole thread, as for analyze_thread. A delta
+    prompt is never compacted (dropping replies would lose them from the
+    analysis for good); over `budget` it is routed or rejected.
+    """
+    if client is None:
+        client = genai.Client(api_key=api_key)
+    prompt_text = format_delta_for_prompt(
+        thread, previous, new_messages_since(thread, since_ts), memo
+    )
+    return _routed_analysis(
+        client,
+        _route(thread, model, router),
+        prompt_text,
+        INCREMENTAL_SYSTEM_PROMPT,
+        budget=budget,
+    )
@@ -0,0 +1,169 @@
+import json
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from src.models import SlackThread
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# Words that usually mean the thread contains disagreement or open doubts.
+_CONTENTION = re.compile(
+    r"\b(but|however|disagree|concern|worried|not sure|objection|risk)\b"
+    r"|でも|しかし|ただ、|反対|懸念|心配|疑問|違うと思|リスク",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class GenerationLimits:
+    """Output limits of one Gemini call.
+
+    On thinking models (Gemini 2.5) thoughts count against
+    max_output_tokens, so it must leave room for the JSON after the
+    thinking budget. thinking_budget None keeps the model's default.
+    """
+
+    max_output_tokens: int
+    thinking_budget: int | None = None
+
+
+DEFAULT_LIMITS = GenerationLimits(max_output_tokens=4096)
+
+# By model name prefix, longest match wins; other models use DEFAULT_LIMITS.
+MODEL_LIMITS = {
+    "gemini-2.5-pro": GenerationLimits(max_output_tokens=12288, thinking_budget=4096),
+    "gemini-2.5-flash": GenerationLimits(max_output_tokens=8192, thinking_budget=0),
+}
+
+
+def generation_limits(model: str) -> GenerationLimits:
+    prefixes = [p for p in MODEL_LIMITS if model.startswith(p)]
+    return MODEL_LIMITS[max(prefixes, key=len)] if prefixes else DEFAULT_LIMITS
+
+
+@dataclass
+class ThreadFeatures:
+    """Cheap local measurements of a thread's size and complexity."""
+
+    messages: int
+    chars: int
+    participants: int
+    contention: int  # messages with disagreement/concern markers
+
+
+def thread_features(thread: SlackThread) -> ThreadFeatures:
+    return ThreadFeatures(
+        messages=len(thread.messages),
+        chars=sum(len(m.text) for m in thread.messages),
+        participants=len({m.user for m in thread.messages}),
+        contention=sum(1 for m in thread.messages if _CONTENTION.search(m.text)),
+    )
+
+
+@dataclass
+class RoutingRule:
+    """Send threads matching every given bound to `model`.
+
+    Bounds are `min_<feature>` / `max_<feature>` for the ThreadFeatures
+    fields (inclusive). With `any_of`, matching any single bound is enough.
+    `limits` overrides the model's GenerationLimits.
+    """
+
+    name: str
+    model: str
+    bounds: dict[str, int] = field(default_factory=dict)
+    any_of: bool = False
+    limits: GenerationLimits | None = None
+
+    def matches(self, features: ThreadFeatures) -> bool:
+        checks = []
+        for bound, limit in self.bounds.items():
+            kind, _, feature = bound.partition("_")
+            value = getattr(features, feature)
+            checks.append(value >= limit if kind == "min" else value <= limit)
+        if not checks:
+            return True
+        return any(checks) if self.any_of else all(checks)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RoutingRule":
+        bounds = {
+            k: int(v)
+            for k, v in data.items()
+            if k.startswith(("min_", "max_")) and k != "max_output_tokens"
+        }
+        for bound in bounds:
+            if bound.partition("_")[2] not in ThreadFeatures.__dataclass_fields__:
+                raise ValueError(f"Unknown routing bound: {bound}")
+        limits = None
+        if "max_output_tokens" in data or "thinking_budget" in data:
+            defaults = generation_limits(data["model"])
+            limits = GenerationLimits(
+                max_output_tokens=int(data.get("max_output_tokens", defaults.max_output_tokens)),
+                thinking_budget=(
+                    int(data["thinking_budget"])
+                    if data.get("thinking_budget") is not None
+                    else defaults.thinking_budget
+                ),
+            )
+        return cls(
+            name=data.get("name") or data["model"],
+            model=data["model"],
+            bounds=bounds,
+            any_of=bool(data.get("any_of", False)),
+            limits=limits,
+        )
+
+
+@dataclass
+class Route:
+    model: str
+    reason: str
+    limits: GenerationLimits | None = None
+
+    @property
+    def generation_limits(self) -> GenerationLimits:
+        """The rule's limits, else the model's (see MODEL_LIMITS)."""
+        return self.limits or generation_limits(self.model)
+
+
+class ModelRouter:
+    """Pick a Gemini model per thread; first matching rule wins.
+
+    Without rules every thread uses `default_model`.
+    """
+
+    def __init__(
+        self,
+        rules: list[RoutingRule] | None = None,
+        default_model: str = DEFAULT_MODEL,
+    ):
+        self.rules = rules or []
+        self.default_model = default_model
+
+    def route(self, thread: SlackThread) -> Route:
+        features = thread_features(thread)
+        summary = (
+            f"messages={features.messages} chars={features.chars}"
+            f" participants={features.participants} contention={features.contention}"
+        )
+        for rule in self.rules:
+            if rule.matches(features):
+                return Route(rule.model, f"{rule.name} ({summary})", rule.limits)
+        return Route(self.default_model, f"default ({summary})")
+
+    @classmethod
+    def from_config(cls, get: Callable[[str], str]) -> "ModelRouter":
+        """Read GEMINI_MODEL and GEMINI_MODEL_ROUTES via `get` (env, secrets).
+
+        GEMINI_MODEL_ROUTES is a JSON list of rules, e.g.
+        [{"name": "short", "model": "gemini-2.0-flash-lite", "max_messages": 5}]
+        (see .env.example); unset, every thread uses GEMINI_MODEL. A rule may
+        set max_output_tokens / thinking_budget.
+        """
+        routes = get("GEMINI_MODEL_ROUTES")
+        rules = []
+        if routes:
+            rules = [RoutingRule.from_dict(r) for r in json.loads(routes)]
+        return cls(rules, default_model=get("GEMINI_MODEL") or DEFAULT_MODEL)
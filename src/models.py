@@ -1,21 +1,34 @@
+from dataclasses import dataclass
 from datetime import datetime
 
 from pydantic import BaseModel
 
 
-class SlackMessage(BaseModel):
+# Slack data is built internally from already-typed API responses and can run
+# to thousands of messages per thread, so it uses slotted dataclasses rather
+# than validated models. Pydantic is kept for data crossing a boundary (LLM
+# output, Notion/state serialization).
+@dataclass(slots=True)
+class SlackMessage:
     user: str
     text: str
     timestamp: datetime
+    ts: str = ""
 
 
-class SlackThread(BaseModel):
+@dataclass(slots=True)
+class SlackThread:
     channel_name: str
     channel_id: str
     thread_ts: str
     url: str
     messages: list[SlackMessage]
     last_reply_at: datetime
+    # The thread exceeded the prompt budget: `omitted` replies between the
+    # opening messages (messages[:omitted_at]) and the most recent ones were
+    # left out
+    omitted: int = 0
+    omitted_at: int = 0
 
 
 class DiscussionStructure(BaseModel):
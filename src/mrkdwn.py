@@ -0,0 +1,56 @@
+import re
+from collections.abc import Mapping
+
+# One pass over every <...> token: user/channel mentions, special mentions,
+# dates and links. Group 1 is the sigil (@, #, !) or empty for links.
+_TOKEN = re.compile(r"<([@#!]?)([^<>|]*)(?:\|([^<>]*))?>")
+_USER_ID = re.compile(r"<@([UW][A-Z0-9]+)[|>]")
+_CHANNEL_ID = re.compile(r"<#([CG][A-Z0-9]+)[|>]")
+_ENTITIES = re.compile(r"&(amp|lt|gt);")
+_ENTITY_CHARS = {"amp": "&", "lt": "<", "gt": ">"}
+_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+
+def mentioned_ids(text: str) -> tuple[set[str], set[str]]:
+    """User and channel IDs mentioned in `text`, for bulk name resolution."""
+    return set(_USER_ID.findall(text)), set(_CHANNEL_ID.findall(text))
+
+
+def escape_mrkdwn(text: str) -> str:
+    """Escape &, < and > so `text` shows literally in a mrkdwn message."""
+    return text.translate(_ESCAPES)
+
+
+def link_mrkdwn(url: str, label: str) -> str:
+    """<url|label> link; a "|" in the label (it cannot be escaped) becomes "｜"."""
+    return f"<{url}|{escape_mrkdwn(label).replace('|', '｜')}>"
+
+
+def normalize_mrkdwn(
+    text: str,
+    user_names: Mapping[str, str],
+    channel_names: Mapping[str, str],
+) -> str:
+    """Turn Slack mrkdwn markup into plain text for the prompt.
+
+    <@U123> -> @Alice, <#C123|general> -> #general, <!here> -> @here,
+    <https://x|label> -> label, <https://x> -> https://x, and &amp;/&lt;/&gt;
+    are unescaped. Unknown IDs are kept as-is.
+    """
+    if "<" not in text and "&" not in text:
+        return text
+
+    def replace(match: re.Match) -> str:
+        sigil, body, label = match.groups()
+        if sigil == "@":
+            return "@" + user_names.get(body, label or body)
+        if sigil == "#":
+            return "#" + (label or channel_names.get(body, body))
+        if sigil == "!":
+            if label:
+                return label
+            return "@" + body.split("^", 1)[0]
+        return label or body.removeprefix("mailto:")
+
+    text = _TOKEN.sub(replace, text)
+    return _ENTITIES.sub(lambda m: _ENTITY_CHARS[m.group(1)], text)
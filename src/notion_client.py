@@ -1,13 +1,28 @@
+from collections.abc import Iterator
 from datetime import date
+from typing import TYPE_CHECKING
 
-import httpx
-
+from src.lazy import lazy_import
 from src.models import AnalysisResult, ParticipantStance
+from src.notion_mirror import SYNC_MAX_AGE, page_gone
+
+if TYPE_CHECKING:
+    from src.notion_mirror import NotionMirror
+
+httpx = lazy_import("httpx")
 
 NOTION_VERSION = "2022-06-28"
 BASE_URL = "https://api.notion.com/v1"
 HTTP_TIMEOUT = 30.0
 
+# Notion request limits
+RICH_TEXT_MAX_CHARS = 2000  # per text.content object
+RICH_TEXT_MAX_SEGMENTS = 100  # per rich_text array
+CHILDREN_MAX_BLOCKS = 100  # per children array
+
+# Heading of the page body section holding a property's overflow text
+OVERFLOW_HEADING = "{} (続き)"
+
 
 def _headers(token: str) -> dict:
     return {
@@ -17,16 +32,40 @@ def _headers(token: str) -> dict:
     }
 
 
+def _split_text(text: str, limit: int = RICH_TEXT_MAX_CHARS) -> list[str]:
+    """Split text into chunks of at most `limit` chars, preferring line breaks."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", limit // 2, limit) + 1 or limit
+        chunks.append(text[:cut])
+        text = text[cut:]
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+def _rich_text_segments(text: str) -> tuple[list[dict], str]:
+    """Encode text as compliant rich text segments.
+
+    Returns (segments, overflow) where overflow is the text that did not fit
+    into one rich_text array.
+    """
+    chunks = _split_text(text)
+    segments = [{"text": {"content": c}} for c in chunks[:RICH_TEXT_MAX_SEGMENTS]]
+    overflow = "".join(chunks[RICH_TEXT_MAX_SEGMENTS:])
+    return segments, overflow
+
+
 def _rich_text(text: str) -> dict:
     """Create a Notion rich text property value."""
     if not text:
         return {"rich_text": []}
-    return {"rich_text": [{"text": {"content": text}}]}
+    return {"rich_text": _rich_text_segments(text)[0]}
 
 
-def _rich_text_from_list(items: list[str]) -> dict:
-    """Create rich text from a list, newline-separated."""
-    return _rich_text("\n".join(items))
+def _plain_text(parts: list[dict]) -> str:
+    """Join rich text segments back into a string."""
+    return "".join(p.get("text", {}).get("content", "") for p in parts)
 
 
 def _format_participants(participants: list[ParticipantStance]) -> str:
@@ -43,45 +82,99 @@ def _format_participants(participants: list[ParticipantStance]) -> str:
     return "\n".join(lines)
 
 
+def _aging_days(props: dict) -> int:
+    """Read Aging Days from either a number or a formula property."""
+    aging = props.get("Aging Days", {})
+    if "formula" in aging:
+        return aging["formula"].get("number") or 0
+    return aging.get("number") or 0
+
+
+# Rich text properties written by save_to_notion (see _text_properties)
+TEXT_PROPERTIES = (
+    "Next Decision Required",
+    "Next Action",
+    "Owner",
+    "Premises",
+    "Key Issues",
+    "Current State",
+    "Strategic Implications",
+    "Risk Signals",
+    "Participants",
+    "Memo",
+)
+
+
+def _text_properties(result: AnalysisResult, memo: str | None) -> dict[str, str]:
+    """Plain text of every rich text property, keyed by property name."""
+    return {
+        "Next Decision Required": result.next_decision_required,
+        "Next Action": result.suggested_next_action,
+        "Owner": result.suggested_owner,
+        "Premises": "\n".join(result.structure.premises),
+        "Key Issues": "\n".join(result.structure.key_issues),
+        "Current State": "\n".join(result.structure.conclusions_or_current_state),
+        "Strategic Implications": "\n".join(result.strategic_implications),
+        "Risk Signals": "\n".join(result.risk_signals),
+        "Participants": _format_participants(result.participants),
+        "Memo": memo or "",
+    }
+
+
 def build_notion_properties(
     result: AnalysisResult,
     slack_url: str,
     channel_name: str,
     memo: str | None,
     status: str = "Open",
+    aging_formula: bool = False,
 ) -> dict:
-    """Build Notion page properties from analysis result."""
+    """Build Notion page properties from analysis result.
+
+    When `aging_formula` is set, Aging Days is a formula property and is not written.
+    """
     today = date.today().isoformat()
 
     props = {
-        "Title": {"title": [{"text": {"content": result.theme}}]},
+        "Title": {"title": _rich_text_segments(result.theme)[0]},
         "Slack URL": {"url": slack_url},
         "Channel": {"select": {"name": channel_name}},
         "Status": {"select": {"name": status}},
-        "Next Decision Required": _rich_text(result.next_decision_required),
-        "Next Action": _rich_text(result.suggested_next_action),
-        "Owner": _rich_text(result.suggested_owner),
         "Last Managed At": {"date": {"start": today}},
         "Aging Days": {"number": 0},
-        "Premises": _rich_text_from_list(result.structure.premises),
-        "Key Issues": _rich_text_from_list(result.structure.key_issues),
-        "Current State": _rich_text_from_list(
-            result.structure.conclusions_or_current_state
-        ),
         "New Concepts": {
             "multi_select": [{"name": c} for c in result.new_concepts]
         },
-        "Strategic Implications": _rich_text_from_list(
-            result.strategic_implications
-        ),
-        "Risk Signals": _rich_text_from_list(result.risk_signals),
-        "Participants": _rich_text(_format_participants(result.participants)),
-        "Memo": _rich_text(memo) if memo else {"rich_text": []},
     }
+    for name, text in _text_properties(result, memo).items():
+        props[name] = _rich_text(text)
+    if aging_formula:
+        del props["Aging Days"]
 
     return props
 
 
+def build_overflow_blocks(result: AnalysisResult, memo: str | None) -> list[dict]:
+    """Build page body blocks for text that does not fit into its property."""
+    blocks = []
+    for name, text in _text_properties(result, memo).items():
+        overflow = _rich_text_segments(text)[1]
+        if not overflow:
+            continue
+        blocks.append(
+            {
+                "type": "heading_3",
+                "heading_3": {
+                    "rich_text": [{"text": {"content": OVERFLOW_HEADING.format(name)}}]
+                },
+            }
+        )
+        while overflow:
+            segments, overflow = _rich_text_segments(overflow)
+            blocks.append({"type": "paragraph", "paragraph": {"rich_text": segments}})
+    return blocks
+
+
 def find_existing_page(
     token: str, database_id: str, slack_url: str
 ) -> str | None:
@@ -99,6 +192,71 @@ def find_existing_page(
     return None
 
 
+def _append_children(token: str, page_id: str, children: list[dict]) -> None:
+    """Append blocks to a page body, batching up to the per-request limit."""
+    for start in range(0, len(children), CHILDREN_MAX_BLOCKS):
+        resp = httpx.patch(
+            f"{BASE_URL}/blocks/{page_id}/children",
+            headers=_headers(token),
+            json={"children": children[start : start + CHILDREN_MAX_BLOCKS]},
+            timeout=HTTP_TIMEOUT,
+        )
+        resp.raise_for_status()
+
+
+def _overflow_block_ids(token: str, page_id: str) -> list[str]:
+    """IDs of the overflow sections (see build_overflow_blocks) in a page body.
+
+    A section is one of our "(続き)" headings and the paragraphs after it.
+    """
+    headings = {OVERFLOW_HEADING.format(name) for name in TEXT_PROPERTIES}
+    ids = []
+    in_section = False
+    params: dict = {"page_size": CHILDREN_MAX_BLOCKS}
+    while True:
+        resp = httpx.get(
+            f"{BASE_URL}/blocks/{page_id}/children",
+            headers=_headers(token),
+            params=params,
+            timeout=HTTP_TIMEOUT,
+        )
+        resp.raise_for_status()
+        response = resp.json()
+        for block in response.get("results", []):
+            kind = block.get("type")
+            if kind == "heading_3":
+                in_section = _plain_text(block["heading_3"].get("rich_text", [])) in headings
+            elif kind != "paragraph":
+                in_section = False
+            if in_section:
+                ids.append(block["id"])
+        if not response.get("has_more"):
+            return ids
+        params["start_cursor"] = response["next_cursor"]
+
+
+def _replace_overflow_blocks(token: str, page_id: str, children: list[dict]) -> None:
+    """Swap the overflow sections of an existing page for `children`."""
+    for block_id in _overflow_block_ids(token, page_id):
+        resp = httpx.delete(
+            f"{BASE_URL}/blocks/{block_id}",
+            headers=_headers(token),
+            timeout=HTTP_TIMEOUT,
+        )
+        resp.raise_for_status()
+    _append_children(token, page_id, children)
+
+
+def _update_properties(token: str, page_id: str, properties: dict):
+    """PATCH a page's properties. Returns the response, unchecked."""
+    return httpx.patch(
+        f"{BASE_URL}/pages/{page_id}",
+        headers=_headers(token),
+        json={"properties": properties},
+        timeout=HTTP_TIMEOUT,
+    )
+
+
 def save_to_notion(
     token: str,
     database_id: str,
@@ -107,81 +265,180 @@ def save_to_notion(
     channel_name: str,
     memo: str | None,
     status: str = "Open",
+    aging_formula: bool = False,
+    mirror: "NotionMirror | None" = None,
+    overflow: bool | None = None,
 ) -> str:
     """Save analysis result to Notion. Returns the page URL.
 
     Updates existing page if same Slack URL found, otherwise creates new.
+    `overflow` says whether the existing page was saved with overflow
+    blocks, if known (see ThreadStateStore); only when it may have some
+    is its body listed so they can be replaced.
+    With `mirror`, the existing page is looked up locally first and the
+    saved page is written through to the mirror. A mirrored page that was
+    archived or deleted in Notion is dropped from the mirror and the page
+    is looked up (or created) as without one.
     """
-    properties = build_notion_properties(result, slack_url, channel_name, memo, status)
+    properties = build_notion_properties(
+        result, slack_url, channel_name, memo, status, aging_formula
+    )
+    children = build_overflow_blocks(result, memo)
 
-    existing_page_id = find_existing_page(token, database_id, slack_url)
+    existing_page_id = None
+    mirrored = mirror.page_for_url(slack_url) if mirror else None
+    if mirrored:
+        resp = _update_properties(token, mirrored["id"], properties)
+        if page_gone(resp):
+            # Incremental syncs miss archived pages until the next full sync
+            mirror.remove_page(mirrored["id"])
+        else:
+            existing_page_id = mirrored["id"]
+    if not existing_page_id:
+        existing_page_id = find_existing_page(token, database_id, slack_url)
+        if existing_page_id:
+            resp = _update_properties(token, existing_page_id, properties)
 
     if existing_page_id:
-        resp = httpx.patch(
-            f"{BASE_URL}/pages/{existing_page_id}",
-            headers=_headers(token),
-            json={"properties": properties},
-            timeout=HTTP_TIMEOUT,
-        )
         resp.raise_for_status()
+        if mirror:
+            mirror.upsert_page(resp.json())
+        if overflow is False:
+            _append_children(token, existing_page_id, children)
+        else:
+            _replace_overflow_blocks(token, existing_page_id, children)
         return f"https://notion.so/{existing_page_id.replace('-', '')}"
     else:
+        # New pages carry overflow blocks in the create call itself
+        payload = {
+            "parent": {"database_id": database_id},
+            "properties": properties,
+        }
+        if children:
+            payload["children"] = children[:CHILDREN_MAX_BLOCKS]
         resp = httpx.post(
             f"{BASE_URL}/pages",
             headers=_headers(token),
-            json={
-                "parent": {"database_id": database_id},
-                "properties": properties,
-            },
+            json=payload,
             timeout=HTTP_TIMEOUT,
         )
         resp.raise_for_status()
+        if mirror:
+            mirror.upsert_page(resp.json())
         page_id = resp.json()["id"]
+        _append_children(token, page_id, children[CHILDREN_MAX_BLOCKS:])
         return f"https://notion.so/{page_id.replace('-', '')}"
 
 
-def fetch_open_pages(token: str, database_id: str) -> list[dict]:
-    """Fetch Open/Waiting pages from Notion database.
+def _open_page_summary(page: dict) -> dict | None:
+    props = page["properties"]
+    slack_url = props.get("Slack URL", {}).get("url")
+    if not slack_url:
+        return None
 
-    Returns list of dicts with: page_id, title, slack_url, aging_days, status, memo.
+    title = _plain_text(props.get("Title", {}).get("title", [])) or "Untitled"
+
+    aging_days = _aging_days(props)
+    status = props.get("Status", {}).get("select", {}).get("name", "")
+
+    memo = _plain_text(props.get("Memo", {}).get("rich_text", [])) or None
+
+    return {
+        "page_id": page["id"],
+        "title": title,
+        "slack_url": slack_url,
+        "aging_days": aging_days,
+        "status": status,
+        "memo": memo,
+    }
+
+
+def find_page_summary(
+    token: str,
+    database_id: str,
+    slack_url: str,
+    mirror: "NotionMirror | None" = None,
+) -> dict | None:
+    """Look up the saved page for a Slack URL.
+
+    With `mirror`, served locally (synced at most SYNC_MAX_AGE ago) and only
+    pages the mirror lacks are queried. Returns the same dict as
+    fetch_open_pages (any status), or None.
     """
+    if mirror:
+        mirror.sync(token, max_age=SYNC_MAX_AGE)
+        page = mirror.page_for_url(slack_url)
+        if page:
+            return _open_page_summary(page)
     resp = httpx.post(
         f"{BASE_URL}/databases/{database_id}/query",
         headers=_headers(token),
-        json={
+        json={"filter": {"property": "Slack URL", "url": {"equals": slack_url}}},
+        timeout=HTTP_TIMEOUT,
+    )
+    resp.raise_for_status()
+    for page in resp.json().get("results", []):
+        summary = _open_page_summary(page)
+        if summary:
+            return summary
+    return None
+
+
+def iter_open_pages(
+    token: str, database_id: str, mirror: "NotionMirror | None" = None
+) -> Iterator[dict]:
+    """Stream Open/Waiting pages, fetching one Notion result page at a time.
+
+    With `mirror`, only pages edited since the last sync are fetched and the
+    list is read locally.
+    """
+    if mirror:
+        mirror.sync(token)
+        for page in mirror.active_pages():
+            summary = _open_page_summary(page)
+            if summary:
+                yield summary
+        return
+
+    next_cursor = None
+    while True:
+        payload = {
             "filter": {
                 "and": [
                     {"property": "Status", "select": {"does_not_equal": "Done"}},
                     {"property": "Status", "select": {"does_not_equal": "Archived"}},
                 ]
             }
-        },
-    )
-    resp.raise_for_status()
+        }
+        if next_cursor:
+            payload["start_cursor"] = next_cursor
 
-    pages = []
-    for page in resp.json().get("results", []):
-        props = page["properties"]
-        slack_url = props.get("Slack URL", {}).get("url")
-        if not slack_url:
-            continue
+        resp = httpx.post(
+            f"{BASE_URL}/databases/{database_id}/query",
+            headers=_headers(token),
+            json=payload,
+            timeout=HTTP_TIMEOUT,
+        )
+        resp.raise_for_status()
+        response = resp.json()
 
-        title_parts = props.get("Title", {}).get("title", [])
-        title = title_parts[0]["text"]["content"] if title_parts else "Untitled"
+        for page in response.get("results", []):
+            summary = _open_page_summary(page)
+            if summary:
+                yield summary
 
-        aging_days = props.get("Aging Days", {}).get("number", 0)
-        status = props.get("Status", {}).get("select", {}).get("name", "")
+        if not response.get("has_more"):
+            break
+        next_cursor = response.get("next_cursor")
+        if not next_cursor:
+            break
 
-        memo_parts = props.get("Memo", {}).get("rich_text", [])
-        memo = memo_parts[0]["text"]["content"] if memo_parts else None
 
-        pages.append({
-            "page_id": page["id"],
-            "title": title,
-            "slack_url": slack_url,
-            "aging_days": aging_days,
-            "status": status,
-            "memo": memo,
-        })
+def fetch_open_pages(
+    token: str, database_id: str, mirror: "NotionMirror | None" = None
+) -> list[dict]:
+    """Fetch Open/Waiting pages from Notion database.
 
-    return pages
+    Returns list of dicts with: page_id, title, slack_url, aging_days, status, memo.
+    """
+    return list(iter_open_pages(token, database_id, mirror))
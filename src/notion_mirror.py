@@ -0,0 +1,260 @@
+import json
+import threading
+import time
+from datetime import date, timedelta
+
+from src.lazy import lazy_import
+from src.notion_schema import fetch_database_schema
+from src.storage import connect
+
+httpx = lazy_import("httpx")
+
+NOTION_VERSION = "2022-06-28"
+BASE_URL = "https://api.notion.com/v1"
+HTTP_TIMEOUT = 30.0
+
+NOTION_MIRROR_DB = "notion.sqlite3"
+# Incremental syncs cannot see pages removed from the database; a periodic
+# full sync drops them from the mirror.
+FULL_SYNC_INTERVAL = 24 * 3600.0
+# Reads that tolerate slightly stale status (e.g. Slack event refreshes).
+SYNC_MAX_AGE = 60.0
+
+CLOSED_STATUSES = ("Done", "Archived")
+
+# Properties kept per page: everything the list, lookup and aging reads use.
+MIRROR_PROPERTIES = [
+    "Title",
+    "Slack URL",
+    "Status",
+    "Memo",
+    "Next Decision Required",
+    "Last Managed At",
+    "Aging Days",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mirror_pages (
+    page_id TEXT PRIMARY KEY,
+    database_id TEXT NOT NULL,
+    slack_url TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT '',
+    last_managed TEXT NOT NULL DEFAULT '',
+    last_edited_time TEXT NOT NULL DEFAULT '',
+    page TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS mirror_pages_url ON mirror_pages (database_id, slack_url);
+CREATE INDEX IF NOT EXISTS mirror_pages_status ON mirror_pages (database_id, status, last_managed);
+CREATE TABLE IF NOT EXISTS mirror_sync (
+    database_id TEXT PRIMARY KEY,
+    last_edited_time TEXT NOT NULL DEFAULT '',
+    synced_at REAL NOT NULL DEFAULT 0,
+    full_synced_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def _headers(token: str) -> dict:
+    return {
+        "Authorization": f"Bearer {token}",
+        "Notion-Version": NOTION_VERSION,
+        "Content-Type": "application/json",
+    }
+
+
+def _select_name(props: dict, name: str) -> str:
+    return (props.get(name, {}).get("select") or {}).get("name", "")
+
+
+def _date_start(props: dict, name: str) -> str:
+    return ((props.get(name, {}).get("date") or {}).get("start") or "")[:10]
+
+
+def _current_aging(page: dict, today: date) -> dict:
+    """Recompute a formula Aging Days, which changes without page edits."""
+    props = page["properties"]
+    aging = props.get("Aging Days", {})
+    last_managed = _date_start(props, "Last Managed At")
+    if "formula" in aging and last_managed:
+        days = (today - date.fromisoformat(last_managed)).days
+        props["Aging Days"] = {**aging, "formula": {**aging["formula"], "number": days}}
+    return page
+
+
+def page_gone(resp) -> bool:
+    """Whether a page update failed because the page was deleted or archived."""
+    if resp.status_code == 404:
+        return True
+    return resp.status_code == 400 and "archived" in resp.json().get("message", "")
+
+
+class NotionMirror:
+    """Local copy of one Notion database's pages (the properties we read).
+
+    Kept current by incremental syncs (pages edited since the last sync,
+    via a last_edited_time filter and sort) and by writing our own saves
+    through. Pages are returned in Notion's page-object shape, so the
+    existing parsers work on mirror and API results alike.
+    """
+
+    def __init__(self, database_id: str, name: str = NOTION_MIRROR_DB):
+        self.database_id = database_id
+        self._conn = connect(name)
+        self._lock = threading.Lock()
+        self._conn.executescript(_SCHEMA)
+
+    def _sync_state(self):
+        return self._conn.execute(
+            "SELECT * FROM mirror_sync WHERE database_id = ?", (self.database_id,)
+        ).fetchone()
+
+    def _upsert(self, page: dict) -> None:
+        props = page.get("properties", {})
+        kept = {
+            "id": page["id"],
+            "last_edited_time": page.get("last_edited_time", ""),
+            "properties": {k: props[k] for k in MIRROR_PROPERTIES if k in props},
+        }
+        self._conn.execute(
+            "INSERT OR REPLACE INTO mirror_pages"
+            " (page_id, database_id, slack_url, status, last_managed, last_edited_time, page)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                page["id"],
+                self.database_id,
+                props.get("Slack URL", {}).get("url") or "",
+                _select_name(props, "Status"),
+                _date_start(props, "Last Managed At"),
+                kept["last_edited_time"],
+                json.dumps(kept, ensure_ascii=False),
+            ),
+        )
+
+    def upsert_page(self, page: dict) -> None:
+        """Write through a page object returned by a Notion create/update."""
+        if page.get("archived") or page.get("in_trash"):
+            self.remove_page(page["id"])
+            return
+        with self._lock:
+            self._upsert(page)
+
+    def remove_page(self, page_id: str) -> None:
+        """Drop a page found to be archived or deleted in Notion."""
+        with self._lock:
+            self._conn.execute("DELETE FROM mirror_pages WHERE page_id = ?", (page_id,))
+
+    def sync(self, token: str, max_age: float = 0.0, full: bool | None = None) -> dict:
+        """Fetch pages edited since the last sync.
+
+        Skipped when the last sync is younger than `max_age` seconds. A full
+        sync (also removing pages gone from Notion) runs on first use and
+        every FULL_SYNC_INTERVAL, or when `full` is set.
+        Returns dict with: fetched, full, skipped.
+        """
+        now = time.time()
+        with self._lock:
+            state = self._sync_state()
+        if state and max_age and now - state["synced_at"] < max_age:
+            return {"fetched": 0, "full": False, "skipped": True}
+        if full is None:
+            full = not state or now - state["full_synced_at"] >= FULL_SYNC_INTERVAL
+
+        properties = fetch_database_schema(token, self.database_id)
+        params = [
+            ("filter_properties", properties[name]["id"])
+            for name in MIRROR_PROPERTIES
+            if name in properties
+        ]
+        payload: dict = {"sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}]}
+        if not full and state["last_edited_time"]:
+            # Notion rounds last_edited_time to the minute, so re-read that minute
+            payload["filter"] = {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": state["last_edited_time"]},
+            }
+
+        seen: set[str] = set()
+        latest = state["last_edited_time"] if state else ""
+        next_cursor = None
+        while True:
+            if next_cursor:
+                payload["start_cursor"] = next_cursor
+            resp = httpx.post(
+                f"{BASE_URL}/databases/{self.database_id}/query",
+                headers=_headers(token),
+                params=params,
+                json=payload,
+                timeout=HTTP_TIMEOUT,
+            )
+            resp.raise_for_status()
+            response = resp.json()
+            results = response.get("results", [])
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for page in results:
+                    self._upsert(page)
+                    seen.add(page["id"])
+                    latest = max(latest, page.get("last_edited_time", ""))
+                self._conn.execute("COMMIT")
+
+            next_cursor = response.get("next_cursor") if response.get("has_more") else None
+            if not next_cursor:
+                break
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            if full:
+                stored = self._conn.execute(
+                    "SELECT page_id FROM mirror_pages WHERE database_id = ?", (self.database_id,)
+                ).fetchall()
+                self._conn.executemany(
+                    "DELETE FROM mirror_pages WHERE page_id = ?",
+                    [(r["page_id"],) for r in stored if r["page_id"] not in seen],
+                )
+            self._conn.execute(
+                "INSERT INTO mirror_sync (database_id, last_edited_time, synced_at, full_synced_at)"
+                " VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (database_id) DO UPDATE SET"
+                "  last_edited_time = excluded.last_edited_time,"
+                "  synced_at = excluded.synced_at,"
+                "  full_synced_at = MAX(full_synced_at, excluded.full_synced_at)",
+                (self.database_id, latest, now, now if full else 0.0),
+            )
+            self._conn.execute("COMMIT")
+        return {"fetched": len(seen), "full": full, "skipped": False}
+
+    def _pages(self, where: str, params: tuple, today: date | None = None) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT page FROM mirror_pages WHERE database_id = ? AND {where}"
+                " ORDER BY last_edited_time DESC",
+                (self.database_id, *params),
+            ).fetchall()
+        today = today or date.today()
+        return [_current_aging(json.loads(r["page"]), today) for r in rows]
+
+    def page_for_url(self, slack_url: str) -> dict | None:
+        """The page saved for a Slack URL, or None if the mirror has none."""
+        pages = self._pages("slack_url = ?", (slack_url,))
+        return pages[0] if pages else None
+
+    def active_pages(self, today: date | None = None) -> list[dict]:
+        """Pages not Done/Archived (the Open/Waiting list)."""
+        return self._pages("status NOT IN (?, ?)", CLOSED_STATUSES, today)
+
+    def aging_update_pages(self, today: date) -> list[dict]:
+        """Active pages whose Last Managed At is before `today` (see aging_update_filter)."""
+        return self._pages(
+            "status NOT IN (?, ?) AND last_managed != '' AND last_managed < ?",
+            (*CLOSED_STATUSES, today.isoformat()),
+            today,
+        )
+
+    def reminder_pages(self, today: date, stale_days: int) -> list[dict]:
+        """Open pages not managed for `stale_days` days (see reminder_filter)."""
+        threshold = today - timedelta(days=stale_days)
+        return self._pages(
+            "status = 'Open' AND last_managed != '' AND last_managed <= ?",
+            (threshold.isoformat(),),
+            today,
+        )
@@ -0,0 +1,153 @@
+import time
+
+from src.lazy import lazy_import
+
+httpx = lazy_import("httpx")
+
+NOTION_VERSION = "2022-06-28"
+BASE_URL = "https://api.notion.com/v1"
+HTTP_TIMEOUT = 30.0
+SCHEMA_CACHE_TTL = 600.0
+
+# Properties written by build_notion_properties, with their Notion types.
+EXPECTED_PROPERTIES = {
+    "Title": "title",
+    "Slack URL": "url",
+    "Channel": "select",
+    "Status": "select",
+    "Next Decision Required": "rich_text",
+    "Next Action": "rich_text",
+    "Owner": "rich_text",
+    "Last Managed At": "date",
+    "Aging Days": "number",
+    "Premises": "rich_text",
+    "Key Issues": "rich_text",
+    "Current State": "rich_text",
+    "New Concepts": "multi_select",
+    "Strategic Implications": "rich_text",
+    "Risk Signals": "rich_text",
+    "Participants": "rich_text",
+    "Memo": "rich_text",
+}
+
+# Aging Days may also be a formula (see NOTION_AGING_MODE).
+ALTERNATIVE_TYPES = {"Aging Days": {"formula"}}
+
+STATUS_OPTIONS = ["Open", "Waiting", "Done", "Archived"]
+
+_schema_cache: dict[str, tuple[float, dict]] = {}
+
+
+class SchemaError(ValueError):
+    """The Notion database does not match the properties this tool writes."""
+
+    def __init__(self, problems: list[str]):
+        self.problems = problems
+        super().__init__("Notion database schema mismatch: " + "; ".join(problems))
+
+
+def _headers(token: str) -> dict:
+    return {
+        "Authorization": f"Bearer {token}",
+        "Notion-Version": NOTION_VERSION,
+        "Content-Type": "application/json",
+    }
+
+
+def cache_schema(database_id: str, properties: dict) -> None:
+    _schema_cache[database_id] = (time.monotonic(), properties)
+
+
+def clear_schema_cache() -> None:
+    _schema_cache.clear()
+
+
+def fetch_database_schema(
+    token: str, database_id: str, refresh: bool = False
+) -> dict:
+    """Return database properties keyed by name, cached per database ID."""
+    cached = _schema_cache.get(database_id)
+    if cached and not refresh and time.monotonic() - cached[0] < SCHEMA_CACHE_TTL:
+        return cached[1]
+
+    resp = httpx.get(
+        f"{BASE_URL}/databases/{database_id}",
+        headers=_headers(token),
+        timeout=HTTP_TIMEOUT,
+    )
+    resp.raise_for_status()
+    properties = resp.json().get("properties", {})
+    cache_schema(database_id, properties)
+    return properties
+
+
+def is_formula_aging(properties: dict) -> bool:
+    """True if Aging Days is a formula derived from Last Managed At."""
+    return properties.get("Aging Days", {}).get("type") == "formula"
+
+
+def validate_schema(properties: dict) -> list[str]:
+    """Return a list of problems (missing or mistyped properties)."""
+    problems = []
+    for name, expected_type in EXPECTED_PROPERTIES.items():
+        prop = properties.get(name)
+        if prop is None:
+            problems.append(f"missing property '{name}' ({expected_type})")
+            continue
+        allowed = {expected_type} | ALTERNATIVE_TYPES.get(name, set())
+        if prop.get("type") not in allowed:
+            problems.append(
+                f"property '{name}' is {prop.get('type')}, expected {expected_type}"
+            )
+    return problems
+
+
+def _property_definition(name: str, prop_type: str) -> dict:
+    if name == "Status":
+        return {"select": {"options": [{"name": o} for o in STATUS_OPTIONS]}}
+    return {prop_type: {}}
+
+
+def provision_missing_properties(
+    token: str, database_id: str, properties: dict
+) -> dict:
+    """Create missing properties in one database update.
+
+    Mistyped properties are left untouched (changing them could lose data),
+    and a database can only have one title, so Title is never created.
+    Returns the updated schema properties.
+    """
+    missing = {
+        name: _property_definition(name, prop_type)
+        for name, prop_type in EXPECTED_PROPERTIES.items()
+        if name not in properties and prop_type != "title"
+    }
+    if not missing:
+        return properties
+
+    resp = httpx.patch(
+        f"{BASE_URL}/databases/{database_id}",
+        headers=_headers(token),
+        json={"properties": missing},
+        timeout=HTTP_TIMEOUT,
+    )
+    resp.raise_for_status()
+    properties = resp.json().get("properties", {})
+    cache_schema(database_id, properties)
+    return properties
+
+
+def ensure_schema(token: str, database_id: str, provision: bool = False) -> dict:
+    """Validate (and optionally provision) the database schema.
+
+    Call before any expensive analysis. Returns the schema properties;
+    raises SchemaError if the database cannot hold an analysis result.
+    """
+    properties = fetch_database_schema(token, database_id)
+    if provision and validate_schema(properties):
+        properties = provision_missing_properties(token, database_id, properties)
+
+    problems = validate_schema(properties)
+    if problems:
+        raise SchemaError(problems)
+    return properties
@@ -0,0 +1,357 @@
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from src.llm_analyzer import (
+    TokenUsage,
+    analyze_thread,
+    analyze_thread_incremental,
+    new_messages_since,
+)
+from src.model_router import ModelRouter
+from src.models import AnalysisResult, SlackThread
+from src.notion_client import build_overflow_blocks, find_page_summary, save_to_notion
+from src.slack_client import fetch_slack_thread, parse_slack_thread_url
+from src.thread_state import ThreadStateStore, thread_fingerprint
+from src.token_budget import TokenBudget
+
+if TYPE_CHECKING:
+    from slack_sdk import WebClient
+
+    from src.concept_index import ConceptIndex
+    from src.notion_mirror import NotionMirror
+    from src.search_index import SearchIndex
+
+# Fall back to a full analysis when most of the thread is new anyway.
+INCREMENTAL_MAX_NEW_RATIO = 0.5
+
+# Pages in these statuses are no longer refreshed automatically.
+CLOSED_STATUSES = ("Done", "Archived")
+
+
+@dataclass
+class StageLimits:
+    """Maximum concurrent calls per pipeline stage."""
+
+    slack: int = 4
+    llm: int = 2
+    notion: int = 3
+
+    @property
+    def workers(self) -> int:
+        """Enough threads to keep every stage saturated."""
+        return self.slack + self.llm + self.notion
+
+    @classmethod
+    def from_config(cls, get: Callable[[str], str]) -> "StageLimits":
+        """Read REFRESH_{SLACK,LLM,NOTION}_CONCURRENCY via `get` (env, secrets)."""
+        defaults = cls()
+        return cls(
+            slack=int(get("REFRESH_SLACK_CONCURRENCY") or defaults.slack),
+            llm=int(get("REFRESH_LLM_CONCURRENCY") or defaults.llm),
+            notion=int(get("REFRESH_NOTION_CONCURRENCY") or defaults.notion),
+        )
+
+
+class StageGates:
+    """Semaphores enforcing StageLimits across threads."""
+
+    def __init__(self, limits: StageLimits):
+        self.limits = limits
+        self.slack = threading.BoundedSemaphore(limits.slack)
+        self.llm = threading.BoundedSemaphore(limits.llm)
+        self.notion = threading.BoundedSemaphore(limits.notion)
+
+
+def refresh_job_key(payload: dict) -> str:
+    """Queue dedupe key for a refresh job: one pending job per Slack thread."""
+    channel_id, thread_ts = parse_slack_thread_url(payload["slack_url"])
+    return f"{channel_id}:{thread_ts}"
+
+
+def analyze_with_state(
+    thread: SlackThread,
+    api_key: str,
+    memo: str | None = None,
+    state: ThreadStateStore | None = None,
+    gemini=None,
+    router: ModelRouter | None = None,
+    budget: TokenBudget | None = None,
+) -> tuple[AnalysisResult, TokenUsage]:
+    """Analyze a thread, sending only new replies when a previous analysis exists."""
+    previous = state.get(thread.channel_id, thread.thread_ts) if state else None
+    if previous:
+        delta = new_messages_since(thread, previous["last_ts"])
+        if delta and len(delta) <= len(thread.messages) * INCREMENTAL_MAX_NEW_RATIO:
+            return analyze_thread_incremental(
+                thread,
+                api_key,
+                previous["analysis"],
+                previous["last_ts"],
+                memo=memo,
+                client=gemini,
+                router=router,
+                budget=budget,
+            )
+    return analyze_thread(
+        thread, api_key, memo=memo, client=gemini, router=router, budget=budget
+    )
+
+
+def record_thread_state(
+    state: ThreadStateStore,
+    thread: SlackThread,
+    analysis: AnalysisResult,
+    memo: str | None = None,
+    page_url: str = "",
+) -> None:
+    """Remember the saved analysis, the last message it covers and its fingerprint."""
+    if thread.messages and thread.messages[-1].ts:
+        state.put(
+            thread.channel_id,
+            thread.thread_ts,
+            thread.messages[-1].ts,
+            analysis,
+            fingerprint=thread_fingerprint(thread, memo),
+            page_url=page_url,
+            slack_url=thread.url,
+            overflow=bool(build_overflow_blocks(analysis, memo)),
+        )
+
+
+def saved_overflow(state: ThreadStateStore, thread: SlackThread) -> bool | None:
+    """Whether the thread's page was saved with overflow blocks; None if unknown."""
+    previous = state.get(thread.channel_id, thread.thread_ts)
+    return previous["overflow"] if previous else None
+
+
+def adopt_saved_url(state: ThreadStateStore, thread: SlackThread) -> None:
+    """Save a thread under the Slack URL its page was first saved with.
+
+    Link variants (reply permalinks, other workspace hostnames) parse to the
+    same (channel_id, thread_ts), the key of the thread state store, so they
+    update that page instead of creating a second one.
+    """
+    saved_url = state.tracked_url(thread.channel_id, thread.thread_ts)
+    if saved_url:
+        thread.url = saved_url
+
+
+def unchanged_since_save(
+    state: ThreadStateStore, thread: SlackThread, memo: str | None = None
+) -> dict | None:
+    """Return the saved state if the thread is unchanged since the last save."""
+    previous = state.get(thread.channel_id, thread.thread_ts)
+    if previous and previous["fingerprint"] == thread_fingerprint(thread, memo):
+        return previous
+    return None
+
+
+def refresh_thread(
+    slack: "WebClient",
+    api_key: str,
+    notion_token: str,
+    database_id: str,
+    slack_url: str,
+    memo: str | None = None,
+    status: str = "Open",
+    aging_formula: bool = False,
+    gemini=None,
+    gates: StageGates | None = None,
+    state: ThreadStateStore | None = None,
+    force: bool = False,
+    router: ModelRouter | None = None,
+    indexes: Sequence["SearchIndex | ConceptIndex"] = (),
+    mirror: "NotionMirror | None" = None,
+    budget: TokenBudget | None = None,
+    saved_url: str | None = None,
+) -> dict:
+    """Fetch, re-analyze and save one Slack thread.
+
+    With `gates`, each stage waits for a slot so concurrent callers stay
+    within the per-stage limits. With `state`, threads unchanged since their
+    last save are skipped (unless `force`), and threads analyzed before are
+    updated incrementally from their new replies. The saved analysis is
+    recorded in each of `indexes` (search, concepts) and written through to
+    `mirror`. With `budget`, analyses are checked against the token budget
+    before the Gemini call (see analyze_thread). `saved_url` is the Slack URL
+    an existing Notion page was saved under; the thread is saved under it
+    rather than its parent permalink, so that page is updated.
+    Returns dict with: theme, page_url, total_tokens, model, skipped.
+    """
+    channel_id, thread_ts = parse_slack_thread_url(slack_url)
+    with gates.slack if gates else nullcontext():
+        thread = fetch_slack_thread(slack, channel_id, thread_ts, slack_url)
+
+    if saved_url:
+        thread.url = saved_url
+    elif state:
+        adopt_saved_url(state, thread)
+    if state and not force:
+        previous = unchanged_since_save(state, thread, memo)
+        if previous:
+            return {
+                "theme": previous["analysis"].theme,
+                "page_url": previous["page_url"],
+                "total_tokens": 0,
+                "model": "",
+                "skipped": True,
+            }
+    with gates.llm if gates else nullcontext():
+        analysis, token_usage = analyze_with_state(
+            thread,
+            api_key,
+            memo=memo,
+            state=state,
+            gemini=gemini,
+            router=router,
+            budget=budget,
+        )
+    with gates.notion if gates else nullcontext():
+        page_url = save_to_notion(
+            notion_token,
+            database_id,
+            analysis,
+            thread.url,
+            thread.channel_name,
+            memo,
+            status,
+            aging_formula=aging_formula,
+            mirror=mirror,
+            overflow=saved_overflow(state, thread) if state else None,
+        )
+    if state:
+        record_thread_state(state, thread, analysis, memo, page_url)
+    for index in indexes:
+        index.record(thread, analysis, page_url)
+    return {
+        "theme": analysis.theme,
+        "page_url": page_url,
+        "total_tokens": token_usage.total_tokens,
+        "model": token_usage.model,
+        "skipped": False,
+    }
+
+
+def refresh_saved_thread(
+    slack: "WebClient",
+    api_key: str,
+    notion_token: str,
+    database_id: str,
+    slack_url: str,
+    aging_formula: bool = False,
+    gemini=None,
+    gates: StageGates | None = None,
+    state: ThreadStateStore | None = None,
+    router: ModelRouter | None = None,
+    indexes: Sequence["SearchIndex | ConceptIndex"] = (),
+    mirror: "NotionMirror | None" = None,
+    budget: TokenBudget | None = None,
+) -> dict:
+    """Refresh a thread using the memo and status stored on its Notion page.
+
+    For triggers that only know the Slack URL (e.g. Slack events). Threads
+    without a page, or whose page is Done/Archived, are skipped.
+    Returns dict with: theme, page_url, total_tokens, model, skipped.
+    """
+    with gates.notion if gates else nullcontext():
+        page = find_page_summary(notion_token, database_id, slack_url, mirror=mirror)
+    if page is None or page["status"] in CLOSED_STATUSES:
+        return {"theme": "", "page_url": "", "total_tokens": 0, "model": "", "skipped": True}
+    return refresh_thread(
+        slack,
+        api_key,
+        notion_token,
+        database_id,
+        slack_url,
+        memo=page["memo"],
+        status=page["status"] or "Open",
+        aging_formula=aging_formula,
+        gemini=gemini,
+        gates=gates,
+        state=state,
+        router=router,
+        indexes=indexes,
+        mirror=mirror,
+        budget=budget,
+        saved_url=slack_url,
+    )
+
+
+def refresh_threads(
+    pages: Iterable[dict],
+    slack: "WebClient",
+    api_key: str,
+    notion_token: str,
+    database_id: str,
+    aging_formula: bool = False,
+    gemini=None,
+    limits: StageLimits | None = None,
+    state: ThreadStateStore | None = None,
+    force: bool = False,
+    deadline: float | None = None,
+    router: ModelRouter | None = None,
+    indexes: Sequence["SearchIndex | ConceptIndex"] = (),
+    mirror: "NotionMirror | None" = None,
+    budget: TokenBudget | None = None,
+) -> Iterator[tuple[dict, dict | None, str | None]]:
+    """Refresh pages concurrently, yielding (page, result, error) as each completes.
+
+    `pages` are fetch_open_pages dicts (slack_url, memo, status). They are
+    consumed lazily with a bounded number in flight, so a streamed page list
+    is never fully materialized. No new page is started once `deadline`
+    (a time.monotonic() value) has passed.
+    """
+    limits = limits or StageLimits()
+    gates = StageGates(limits)
+    max_in_flight = limits.workers * 2
+    pending_pages = iter(pages)
+
+    with ThreadPoolExecutor(max_workers=limits.workers) as pool:
+        in_flight: dict[Future, dict] = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < max_in_flight:
+                if deadline is not None and time.monotonic() >= deadline:
+                    exhausted = True
+                    break
+                page = next(pending_pages, None)
+                if page is None:
+                    exhausted = True
+                    break
+                future = pool.submit(
+                    refresh_thread,
+                    slack,
+                    api_key,
+                    notion_token,
+                    database_id,
+                    page["slack_url"],
+                    memo=page.get("memo"),
+                    status=page.get("status", "Open"),
+                    aging_formula=aging_formula,
+                    gemini=gemini,
+                    gates=gates,
+                    state=state,
+                    force=force,
+                    router=router,
+                    indexes=indexes,
+                    mirror=mirror,
+                    budget=budget,
+                    saved_url=page["slack_url"],
+                )
+                in_flight[future] = page
+
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                page = in_flight.pop(future)
+                try:
+                    yield page, future.result(), None
+                except Exception as e:
+                    yield page, None, str(e)
@@ -0,0 +1,275 @@
+import re
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src.lazy import lazy_import
+from src.models import AnalysisResult, SlackThread
+from src.storage import connect
+
+if TYPE_CHECKING:
+    from src.thread_state import ThreadStateStore
+
+genai = lazy_import("google.genai")
+
+SEARCH_DB = "search.sqlite3"
+HASHING_DIM = 1024
+GEMINI_EMBEDDING_MODEL = "text-embedding-004"
+EMBED_BATCH_SIZE = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_docs (
+    key TEXT PRIMARY KEY,
+    slack_url TEXT NOT NULL,
+    page_url TEXT NOT NULL DEFAULT '',
+    theme TEXT NOT NULL,
+    text TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS search_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_WORD = re.compile(r"\w+")
+
+
+def analysis_text(analysis: AnalysisResult) -> str:
+    """The fields searched: theme, key issues, new concepts and risk signals."""
+    return "\n".join(
+        [
+            analysis.theme,
+            *analysis.structure.key_issues,
+            *analysis.new_concepts,
+            *analysis.risk_signals,
+        ]
+    )
+
+
+class HashingEmbedder:
+    """Local bag-of-features embedding via the hashing trick.
+
+    ASCII words are features as-is; other scripts (Japanese has no spaces)
+    contribute character bigrams. No model, no network, deterministic.
+    """
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> Iterable[str]:
+        for word in _WORD.findall(text.lower()):
+            if word.isascii():
+                yield word
+            elif len(word) == 1:
+                yield word
+            else:
+                for i in range(len(word) - 1):
+                    yield word[i : i + 2]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode())
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(vectors)
+
+
+class GeminiEmbedder:
+    """Gemini embedding model; better recall, but one API call per batch."""
+
+    def __init__(self, client, model: str = GEMINI_EMBEDDING_MODEL):
+        self.client = client
+        self.model = model
+        self.name = f"gemini-{model}"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        response = self.client.models.embed_content(model=self.model, contents=texts)
+        vectors = np.array([e.values for e in response.embeddings], dtype=np.float32)
+        return _normalize(vectors)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def embedder_from_config(get: Callable[[str], str], gemini_client=None):
+    """Read SEARCH_EMBEDDINGS / SEARCH_EMBEDDING_MODEL via `get` (env, secrets).
+
+    The default is the local HashingEmbedder; SEARCH_EMBEDDINGS=gemini uses
+    Gemini embeddings (with `gemini_client`, or one made from GEMINI_API_KEY).
+    """
+    if (get("SEARCH_EMBEDDINGS") or "").lower() != "gemini":
+        return HashingEmbedder()
+    client = gemini_client or genai.Client(api_key=get("GEMINI_API_KEY"))
+    return GeminiEmbedder(client, get("SEARCH_EMBEDDING_MODEL") or GEMINI_EMBEDDING_MODEL)
+
+
+class SearchIndex:
+    """Saved analyses with their embeddings; brute-force cosine search.
+
+    Vectors live in SQLite and in an in-memory matrix that is updated in
+    place on every upsert. Before each search, rows written since the last
+    load (e.g. by the CLI or another process) are read in; nothing is
+    re-embedded.
+    """
+
+    def __init__(self, name: str = SEARCH_DB, embedder=None):
+        self.embedder = embedder or HashingEmbedder()
+        self._conn = connect(name)
+        self._lock = threading.Lock()
+        self._conn.executescript(_SCHEMA)
+        self._keys: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._loaded_at = 0.0
+        self._load()
+
+    def _load(self) -> None:
+        row = self._conn.execute(
+            "SELECT value FROM search_meta WHERE key = 'embedder'"
+        ).fetchone()
+        if row is not None and row["value"] != self.embedder.name:
+            self._reembed()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO search_meta (key, value) VALUES ('embedder', ?)",
+            (self.embedder.name,),
+        )
+
+        rows = self._conn.execute(
+            "SELECT key, vector, updated_at FROM search_docs"
+        ).fetchall()
+        self._keys = [r["key"] for r in rows]
+        self._rows = {key: i for i, key in enumerate(self._keys)}
+        if rows:
+            self._matrix = np.stack([np.frombuffer(r["vector"], dtype=np.float32) for r in rows])
+            self._loaded_at = max(r["updated_at"] for r in rows)
+        else:
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def _refresh(self) -> None:
+        """Read in rows written since the last load. Caller holds the lock."""
+        rows = self._conn.execute(
+            "SELECT key, vector, updated_at FROM search_docs WHERE updated_at > ?",
+            (self._loaded_at,),
+        ).fetchall()
+        for r in rows:
+            self._set_vector(r["key"], np.frombuffer(r["vector"], dtype=np.float32))
+            self._loaded_at = max(self._loaded_at, r["updated_at"])
+
+    def _set_vector(self, key: str, vector: np.ndarray) -> None:
+        if key in self._rows:
+            self._matrix[self._rows[key]] = vector
+        elif self._keys:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+            self._matrix = np.vstack([self._matrix, vector])
+        else:
+            self._rows[key] = 0
+            self._keys.append(key)
+            self._matrix = vector[np.newaxis, :].copy()
+
+    def _reembed(self) -> None:
+        """Recompute every stored vector after the embedder changed.
+
+        Texts are embedded EMBED_BATCH_SIZE at a time, which keeps each
+        Gemini request within its batch limit.
+        """
+        rows = self._conn.execute("SELECT key, text FROM search_docs").fetchall()
+        for start in range(0, len(rows), EMBED_BATCH_SIZE):
+            batch = rows[start : start + EMBED_BATCH_SIZE]
+            vectors = self.embedder.embed([r["text"] for r in batch])
+            self._conn.executemany(
+                "UPDATE search_docs SET vector = ? WHERE key = ?",
+                [(v.tobytes(), r["key"]) for r, v in zip(batch, vectors)],
+            )
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def upsert(
+        self, key: str, slack_url: str, theme: str, text: str, page_url: str = ""
+    ) -> None:
+        vector = self.embedder.embed([text])[0]
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_docs"
+                " (key, slack_url, page_url, theme, text, vector, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, slack_url, page_url, theme, text, vector.tobytes(), time.time()),
+            )
+            self._set_vector(key, vector)
+
+    def record(self, thread: SlackThread, analysis: AnalysisResult, page_url: str = "") -> None:
+        """Index a saved analysis (keyed by thread)."""
+        self.upsert(
+            f"{thread.channel_id}:{thread.thread_ts}",
+            thread.url,
+            analysis.theme,
+            analysis_text(analysis),
+            page_url,
+        )
+
+    def backfill(self, state: "ThreadStateStore") -> int:
+        """Index every analysis in the thread state store. Returns the count."""
+        count = 0
+        for saved in state.iter_saved():
+            self.upsert(
+                f"{saved['channel_id']}:{saved['thread_ts']}",
+                saved["slack_url"],
+                saved["analysis"].theme,
+                analysis_text(saved["analysis"]),
+                saved["page_url"],
+            )
+            count += 1
+        return count
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """Most similar saved analyses.
+
+        Returns list of dicts with: score, theme, slack_url, page_url.
+        """
+        if limit < 1:
+            raise ValueError(f"Search limit must be at least 1, got {limit}")
+        # Embedding may be a network call; never hold the lock for it
+        vector = self.embedder.embed([query])[0]
+        with self._lock:
+            self._refresh()
+            if not self._keys:
+                return []
+            scores = self._matrix @ vector
+            keys = self._keys
+        limit = min(limit, len(keys))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        hits = [(keys[i], float(scores[i])) for i in top if scores[i] > 0]
+        if not hits:
+            return []
+
+        with self._lock:
+            rows = {
+                r["key"]: r
+                for r in self._conn.execute(
+                    f"SELECT key, theme, slack_url, page_url FROM search_docs"
+                    f" WHERE key IN ({', '.join('?' * len(hits))})",
+                    [key for key, _ in hits],
+                )
+            }
+        return [
+            {
+                "score": round(score, 4),
+                "theme": rows[key]["theme"],
+                "slack_url": rows[key]["slack_url"],
+                "page_url": rows[key]["page_url"],
+            }
+            for key, score in hits
+        ]
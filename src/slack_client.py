@@ -1,9 +1,33 @@
 import re
+import threading
+import weakref
+from collections.abc import Iterable, Iterator
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qs, urlsplit
 
-from slack_sdk import WebClient
-
+from src.lazy import lazy_import
 from src.models import SlackMessage, SlackThread
+from src.mrkdwn import mentioned_ids, normalize_mrkdwn
+from src.slack_content import ContentExtractor
+from src.token_budget import (
+    LINE_OVERHEAD_TOKENS,
+    PROMPT_TOKEN_BUDGET,
+    estimate_tokens,
+    keep_head_and_tail,
+)
+
+if TYPE_CHECKING:
+    from slack_sdk import WebClient
+
+slack_errors = lazy_import("slack_sdk.errors")
+
+REPLIES_PAGE_SIZE = 200
+
+_ARCHIVES_URL = re.compile(r"slack\.com/archives/([A-Z0-9]+)/p(\d{7,})")
+# Web client links: app.slack.com/client/<team>/<channel>/thread/<channel>-<ts>
+_CLIENT_URL = re.compile(r"slack\.com/client/[A-Z0-9]+/([A-Z0-9]+)/thread/[A-Z0-9]+-(\d+\.\d+)")
+_TS = re.compile(r"\d+\.\d+")
 
 
 def parse_slack_thread_url(url: str) -> tuple[str, str]:
@@ -11,78 +35,245 @@ def parse_slack_thread_url(url: str) -> tuple[str, str]:
 
     URL format: https://<workspace>.slack.com/archives/<channel_id>/p<timestamp>
     The p-prefixed timestamp has no dot; insert dot 6 chars from end.
+    Reply permalinks carry the parent in `?thread_ts=`, which wins; web
+    client thread links are accepted too. Links to a reply without
+    `thread_ts` are resolved to the parent when the thread is fetched.
     """
-    pattern = r"slack\.com/archives/([A-Z0-9]+)/p(\d+)"
-    match = re.search(pattern, url)
+    match = _CLIENT_URL.search(url)
+    if match:
+        return match.group(1), match.group(2)
+
+    match = _ARCHIVES_URL.search(url)
     if not match:
         raise ValueError(f"Invalid Slack thread URL: {url}")
 
     channel_id = match.group(1)
     raw_ts = match.group(2)
     thread_ts = f"{raw_ts[:-6]}.{raw_ts[-6:]}"
+    parent_ts = parse_qs(urlsplit(url).query).get("thread_ts", [""])[0]
+    if _TS.fullmatch(parent_ts):
+        thread_ts = parent_ts
     return channel_id, thread_ts
 
 
-def fetch_slack_thread(
-    client: WebClient,
+def thread_url(url: str, channel_id: str, thread_ts: str) -> str:
+    """The parent-message permalink of a thread, on the host of `url`.
+
+    Query strings and reply timestamps are dropped, so every link variant
+    of one thread maps to the same URL within a workspace.
+    """
+    host = urlsplit(url).hostname or ""
+    if not host.endswith(".slack.com") or host == "app.slack.com":
+        host = "slack.com"
+    return f"https://{host}/archives/{channel_id}/p{thread_ts.replace('.', '')}"
+
+
+def iter_reply_pages(
+    client: "WebClient",
     channel_id: str,
     thread_ts: str,
-    url: str,
-) -> SlackThread:
-    """Fetch a Slack thread and return structured data."""
-    channel_info = client.conversations_info(channel=channel_id)
-    channel_name = channel_info["channel"]["name"]
+    page_size: int = REPLIES_PAGE_SIZE,
+) -> Iterator[list[dict]]:
+    """Yield raw conversations.replies messages one API page at a time.
+
+    If `thread_ts` is a reply, the replies of its parent are yielded.
+    """
+    cursor = None
+    resolved = False
+    while True:
+        kwargs = {"channel": channel_id, "ts": thread_ts, "limit": page_size}
+        if cursor:
+            kwargs["cursor"] = cursor
+        replies = client.conversations_replies(**kwargs)
+        messages = replies["messages"]
+        parent_ts = messages[0].get("thread_ts") if messages and not resolved else None
+        resolved = True
+        if parent_ts and parent_ts != thread_ts:
+            thread_ts = parent_ts
+            continue
+        yield messages
+        cursor = (replies.get("response_metadata") or {}).get("next_cursor")
+        if not replies.get("has_more") or not cursor:
+            break
+
+
+class NameCache:
+    """User and channel display names, looked up once per ID.
 
-    replies = client.conversations_replies(channel=channel_id, ts=thread_ts)
-    raw_messages = replies["messages"]
+    Shared by every fetch made with the same WebClient (see name_cache), so
+    batch refreshes do not repeat users.info / conversations.info calls.
+    """
+
+    def __init__(self):
+        self.users: dict[str, str] = {}
+        self.channels: dict[str, str] = {}
+        self._lock = threading.Lock()
 
-    user_cache: dict[str, str] = {}
+    def resolve_users(self, client: "WebClient", user_ids: Iterable[str]) -> dict[str, str]:
+        """Return {user_id: name}, looking up IDs not cached yet.
 
-    def get_user_name(user_id: str) -> str:
-        if user_id not in user_cache:
-            user_info = client.users_info(user=user_id)
-            user_obj = user_info.get("user", {})
+        A failed lookup (e.g. rate limited) yields the ID as the name but is
+        not cached, so a later fetch tries again.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        with self._lock:
+            missing = [u for u in user_ids if u not in self.users]
+        for user_id in missing:
+            try:
+                user_obj = client.users_info(user=user_id).get("user", {})
+            except slack_errors.SlackApiError:
+                continue
             profile = user_obj.get("profile", {})
-            user_cache[user_id] = (
+            name = (
                 user_obj.get("real_name")
                 or profile.get("display_name")
                 or user_obj.get("name")
                 or user_id
             )
-        return user_cache[user_id]
-
-    messages = []
-    for msg in raw_messages:
-        user_id = msg.get("user")
-        if user_id:
-            user_name = get_user_name(user_id)
-        else:
-            user_name = (
-                msg.get("username")
-                or msg.get("bot_profile", {}).get("name")
-                or msg.get("bot_id")
-                or "Unknown"
-            )
+            with self._lock:
+                self.users[user_id] = name
+        with self._lock:
+            return {u: self.users.get(u, u) for u in user_ids}
+
+    def resolve_channels(
+        self, client: "WebClient", channel_ids: Iterable[str], raise_errors: bool = False
+    ) -> dict[str, str]:
+        """Return {channel_id: name}, looking up IDs not cached yet.
+
+        Failed lookups are handled as in resolve_users, or raised with
+        `raise_errors`.
+        """
+        channel_ids = list(dict.fromkeys(channel_ids))
+        with self._lock:
+            missing = [c for c in channel_ids if c not in self.channels]
+        for channel_id in missing:
+            try:
+                name = client.conversations_info(channel=channel_id)["channel"]["name"]
+            except slack_errors.SlackApiError:
+                if raise_errors:
+                    raise
+                continue
+            with self._lock:
+                self.channels[channel_id] = name
+        with self._lock:
+            return {c: self.channels.get(c, c) for c in channel_ids}
 
-        ts = msg.get("ts")
-        if not ts:
-            continue
 
-        messages.append(
-            SlackMessage(
+_name_caches: "weakref.WeakKeyDictionary[WebClient, NameCache]" = weakref.WeakKeyDictionary()
+_name_caches_lock = threading.Lock()
+
+
+def name_cache(client: "WebClient") -> NameCache:
+    """The NameCache shared by all fetches through `client`."""
+    with _name_caches_lock:
+        cache = _name_caches.get(client)
+        if cache is None:
+            cache = _name_caches[client] = NameCache()
+        return cache
+
+
+def iter_thread_messages(
+    client: "WebClient",
+    channel_id: str,
+    thread_ts: str,
+    page_size: int = REPLIES_PAGE_SIZE,
+) -> Iterator[SlackMessage]:
+    """Stream a thread's messages, fetching the next page only when needed.
+
+    Attachment, block and file text is appended to each message within the
+    ContentExtractor byte budgets. Authors and mentioned users/channels of
+    each page are resolved in bulk through the shared NameCache, and text
+    is normalized from mrkdwn.
+    """
+    names = name_cache(client)
+    extractor = ContentExtractor(client)
+
+    for page in iter_reply_pages(client, channel_id, thread_ts, page_size):
+        extras = extractor.page_extras(page)
+        raw_texts: list[str] = []
+        user_ids: set[str] = set()
+        channel_ids: set[str] = set()
+        for msg in page:
+            text = msg.get("text", "")
+            if msg.get("ts") in extras:
+                text = f"{text}\n{extras[msg['ts']]}" if text else extras[msg["ts"]]
+            raw_texts.append(text)
+            if msg.get("user"):
+                user_ids.add(msg["user"])
+            mentioned_users, mentioned_channels = mentioned_ids(text)
+            user_ids |= mentioned_users
+            channel_ids |= mentioned_channels
+        users = names.resolve_users(client, user_ids)
+        channels = names.resolve_channels(client, channel_ids)
+
+        for msg, raw_text in zip(page, raw_texts):
+            ts = msg.get("ts")
+            if not ts:
+                continue
+
+            user_id = msg.get("user")
+            if user_id:
+                user_name = users[user_id]
+            else:
+                user_name = (
+                    msg.get("username")
+                    or msg.get("bot_profile", {}).get("name")
+                    or msg.get("bot_id")
+                    or "Unknown"
+                )
+
+            yield SlackMessage(
                 user=user_name,
-                text=msg.get("text", ""),
+                text=normalize_mrkdwn(raw_text, users, channels),
                 timestamp=datetime.fromtimestamp(float(ts), tz=timezone.utc),
+                ts=ts,
             )
-        )
+
+
+def _message_tokens(msg: SlackMessage) -> int:
+    return estimate_tokens(msg.user) + estimate_tokens(msg.text) + LINE_OVERHEAD_TOKENS
+
+
+def fetch_slack_thread(
+    client: "WebClient",
+    channel_id: str,
+    thread_ts: str,
+    url: str,
+    max_tokens: int | None = PROMPT_TOKEN_BUDGET,
+) -> SlackThread:
+    """Fetch a Slack thread and return structured data.
+
+    When the messages' estimated prompt size exceeds `max_tokens` (None: no
+    limit), replies in the middle are dropped: the opening messages and the
+    most recent ones are kept, so the last reply (and with it last_ts and
+    the fingerprint) always reflects the live thread.
+    A reply's ts is resolved to the parent's, and the URL to the parent's
+    permalink (see thread_url).
+    """
+    names = name_cache(client)
+    # The channel name becomes a Notion select option; never save the ID instead
+    channel_name = names.resolve_channels(client, [channel_id], raise_errors=True)[channel_id]
+
+    stream = iter_thread_messages(client, channel_id, thread_ts)
+    omitted = 0
+    if max_tokens is None:
+        messages = list(stream)
+        head: list[SlackMessage] = messages
+    else:
+        head, tail, omitted = keep_head_and_tail(stream, _message_tokens, max_tokens)
+        messages = head + tail
 
     last_reply_at = messages[-1].timestamp if messages else datetime.now(tz=timezone.utc)
+    if messages and messages[0].ts:
+        thread_ts = messages[0].ts
 
     return SlackThread(
         channel_name=channel_name,
         channel_id=channel_id,
         thread_ts=thread_ts,
-        url=url,
+        url=thread_url(url, channel_id, thread_ts),
         messages=messages,
         last_reply_at=last_reply_at,
+        omitted=omitted,
+        omitted_at=len(head) if omitted else 0,
     )
@@ -0,0 +1,206 @@
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from src.lazy import lazy_import
+from src.storage import data_dir
+
+if TYPE_CHECKING:
+    from slack_sdk import WebClient
+
+httpx = lazy_import("httpx")
+
+# Extra text (attachments, blocks, files) kept per message and per thread.
+MESSAGE_EXTRA_MAX_BYTES = 4_000
+THREAD_EXTRA_MAX_BYTES = 40_000
+# Bytes read from one file download; the rest is never transferred.
+FILE_MAX_BYTES = 16_000
+FILE_DOWNLOAD_CONCURRENCY = 4
+FILE_CACHE_DIR = "files"
+HTTP_TIMEOUT = 30.0
+
+TEXT_FILETYPES = {
+    "text", "markdown", "post", "csv", "tsv", "json", "yaml", "xml", "html",
+    "sql", "shell", "python", "javascript", "typescript", "go", "java",
+    "ruby", "rust", "kotlin", "swift", "c", "cpp", "csharp", "php", "diff",
+}
+
+
+def clip_bytes(text: str, max_bytes: int) -> str:
+    """Cut `text` to at most `max_bytes` UTF-8 bytes without splitting a character."""
+    data = text.encode()
+    if len(data) <= max_bytes:
+        return text
+    return data[:max_bytes].decode(errors="ignore")
+
+
+def _is_text_file(file: dict) -> bool:
+    return file.get("mimetype", "").startswith("text/") or file.get("filetype") in TEXT_FILETYPES
+
+
+def _cache_path(file_id: str):
+    path = data_dir() / FILE_CACHE_DIR
+    path.mkdir(exist_ok=True)
+    return path / f"{file_id}.txt"
+
+
+def _download_text(token: str, url: str, max_bytes: int) -> str:
+    """Read at most `max_bytes` of a private Slack file."""
+    chunks = []
+    size = 0
+    with httpx.stream(
+        "GET",
+        url,
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=HTTP_TIMEOUT,
+        follow_redirects=True,
+    ) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_bytes():
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                break
+    return b"".join(chunks)[:max_bytes].decode(errors="ignore")
+
+
+def file_text(token: str | None, file: dict, max_bytes: int = FILE_MAX_BYTES) -> str:
+    """Text content of a Slack file, from the disk cache when possible.
+
+    Only text-like files are downloaded; others (and files we cannot
+    download) fall back to Slack's preview, if any.
+    """
+    file_id = file.get("id")
+    url = file.get("url_private_download") or file.get("url_private")
+    if not (file_id and url and token and _is_text_file(file)):
+        return file.get("preview", "")
+
+    cached = _cache_path(file_id)
+    if cached.exists():
+        return cached.read_text(encoding="utf-8")
+    text = _download_text(token, url, max_bytes)
+    tmp = cached.with_suffix(".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(cached)
+    return text
+
+
+def fetch_file_texts(
+    token: str | None,
+    files: Iterable[dict],
+    workers: int = FILE_DOWNLOAD_CONCURRENCY,
+) -> dict[str, str]:
+    """Download text files concurrently (at most `workers` at a time).
+
+    Returns {file_id: text}; a failed download yields the file's preview.
+    """
+    unique = {f["id"]: f for f in files if f.get("id")}
+    if not unique:
+        return {}
+
+    def load(file: dict) -> str:
+        try:
+            return file_text(token, file)
+        except httpx.HTTPError:
+            return file.get("preview", "")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(unique, pool.map(load, unique.values())))
+
+
+def _block_texts(blocks: list[dict]) -> Iterable[str]:
+    # rich_text blocks duplicate msg["text"]; other layouts (bots, apps) do not
+    for block in blocks:
+        kind = block.get("type")
+        if kind in ("section", "header"):
+            if block.get("text", {}).get("text"):
+                yield block["text"]["text"]
+            for field in block.get("fields", []):
+                if field.get("text"):
+                    yield field["text"]
+        elif kind == "context":
+            for element in block.get("elements", []):
+                if element.get("text"):
+                    yield element["text"]
+
+
+def _attachment_texts(attachment: dict) -> Iterable[str]:
+    title = attachment.get("title") or attachment.get("author_name")
+    body = attachment.get("text") or attachment.get("fallback") or ""
+    header = f"[Attachment: {title}]" if title else "[Attachment]"
+    lines = [attachment.get("pretext", ""), body]
+    lines += [f"{f.get('title', '')}: {f.get('value', '')}" for f in attachment.get("fields", [])]
+    content = "\n".join(line for line in lines if line)
+    if content or title:
+        yield f"{header} {content}".rstrip()
+    if attachment.get("message_blocks"):
+        for shared in attachment["message_blocks"]:
+            yield from _block_texts(shared.get("message", {}).get("blocks", []))
+
+
+def message_extras(msg: dict, file_texts: dict[str, str]) -> list[str]:
+    """Extra text sections of one raw Slack message, before budgets."""
+    main_text = msg.get("text", "")
+    sections = [t for t in _block_texts(msg.get("blocks", [])) if t not in main_text]
+    for attachment in msg.get("attachments", []):
+        sections.extend(_attachment_texts(attachment))
+    for file in msg.get("files", []):
+        if file.get("mode") == "tombstone":
+            continue
+        name = file.get("title") or file.get("name") or file.get("id", "")
+        content = file_texts.get(file.get("id", ""), "") or file.get("preview", "")
+        sections.append(f"[File: {name}]\n{content}".rstrip())
+    return sections
+
+
+class ContentExtractor:
+    """Per-thread extraction of attachments, blocks and files under byte budgets."""
+
+    def __init__(
+        self,
+        client: "WebClient",
+        message_max_bytes: int = MESSAGE_EXTRA_MAX_BYTES,
+        thread_max_bytes: int = THREAD_EXTRA_MAX_BYTES,
+    ):
+        self.token = getattr(client, "token", None)
+        self.message_max_bytes = message_max_bytes
+        self.remaining = thread_max_bytes
+
+    def _downloads(self, msg: dict) -> list[dict]:
+        return [f for f in msg.get("files", []) if f.get("mode") != "tombstone"]
+
+    def page_extras(self, page: list[dict]) -> dict[str, str]:
+        """Return {ts: extra text} for one page of raw messages.
+
+        Files are downloaded concurrently in batches covering only as many
+        messages as the remaining thread budget could take; once it is
+        spent, later messages get no extras (and no downloads).
+        """
+        extras: dict[str, str] = {}
+        pending = list(page)
+        while pending and self.remaining > 0:
+            batch: list[dict] = []
+            planned = 0
+            for msg in pending:
+                if batch and planned >= self.remaining:
+                    break
+                batch.append(msg)
+                text_files = [f for f in self._downloads(msg) if _is_text_file(f)]
+                planned += len(text_files) * min(FILE_MAX_BYTES, self.message_max_bytes)
+            pending = pending[len(batch) :]
+            texts = fetch_file_texts(
+                self.token, [f for msg in batch for f in self._downloads(msg)]
+            )
+
+            for msg in batch:
+                if self.remaining <= 0:
+                    break
+                sections = message_extras(msg, texts)
+                if not sections or not msg.get("ts"):
+                    continue
+                extra = clip_bytes(
+                    "\n".join(sections), min(self.message_max_bytes, self.remaining)
+                )
+                self.remaining -= len(extra.encode())
+                extras[msg["ts"]] = extra
+        return extras
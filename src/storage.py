@@ -0,0 +1,31 @@
+import os
+import sqlite3
+from pathlib import Path
+
+DATA_DIR_ENV = "FLOW_TO_STOCK_DATA_DIR"
+# Under the home directory, so the UI, CLI, cron jobs and serve-events share
+# one job queue, thread state and mirror wherever they are started from.
+DEFAULT_DATA_DIR = ".flow-to-stock"
+
+
+def data_dir() -> Path:
+    """Directory for local state (job queue, caches, indexes)."""
+    path = Path(os.environ.get(DATA_DIR_ENV) or Path.home() / DEFAULT_DATA_DIR).expanduser()
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def connect(name: str) -> sqlite3.Connection:
+    """Open a SQLite database in the data directory.
+
+    Connections may be shared across threads; callers serialize writes.
+    """
+    conn = sqlite3.connect(
+        data_dir() / name,
+        timeout=30.0,
+        check_same_thread=False,
+        isolation_level=None,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
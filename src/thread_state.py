@@ -0,0 +1,137 @@
+import hashlib
+import threading
+import time
+from collections.abc import Iterator
+
+from src.models import AnalysisResult, SlackThread
+from src.storage import connect
+
+THREAD_STATE_DB = "threads.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS thread_state (
+    channel_id TEXT NOT NULL,
+    thread_ts TEXT NOT NULL,
+    last_ts TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    fingerprint TEXT NOT NULL DEFAULT '',
+    page_url TEXT NOT NULL DEFAULT '',
+    slack_url TEXT NOT NULL DEFAULT '',
+    overflow INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (channel_id, thread_ts)
+);
+"""
+
+
+def thread_fingerprint(thread: SlackThread, memo: str | None = None) -> str:
+    """Hash of the thread content (and memo) that the analysis was based on.
+
+    Changes when a reply is added, edited or deleted, or the memo changes.
+    """
+    digest = hashlib.sha256((memo or "").encode())
+    for msg in thread.messages:
+        digest.update(f"\x00{msg.ts}\x1f{msg.user}\x1f{msg.text}".encode())
+    last_ts = thread.messages[-1].ts if thread.messages else ""
+    return f"{last_ts}:{digest.hexdigest()}"
+
+
+class ThreadStateStore:
+    """Last saved analysis per Slack thread, for incremental re-analysis."""
+
+    def __init__(self, name: str = THREAD_STATE_DB):
+        self._conn = connect(name)
+        self._lock = threading.Lock()
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(thread_state)")}
+        for column in ("fingerprint", "page_url", "slack_url"):
+            if column not in columns:
+                self._conn.execute(
+                    f"ALTER TABLE thread_state ADD COLUMN {column} TEXT NOT NULL DEFAULT ''"
+                )
+        if "overflow" not in columns:
+            # Unknown for pages saved before: assume they may have overflow blocks
+            self._conn.execute(
+                "ALTER TABLE thread_state ADD COLUMN overflow INTEGER NOT NULL DEFAULT 1"
+            )
+
+    def get(self, channel_id: str, thread_ts: str) -> dict | None:
+        """Return dict with: last_ts, analysis (AnalysisResult), fingerprint,
+        page_url, slack_url, overflow (page saved with overflow blocks); None
+        if unseen."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM thread_state WHERE channel_id = ? AND thread_ts = ?",
+                (channel_id, thread_ts),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "last_ts": row["last_ts"],
+            "analysis": AnalysisResult.model_validate_json(row["analysis"]),
+            "fingerprint": row["fingerprint"],
+            "page_url": row["page_url"],
+            "slack_url": row["slack_url"],
+            "overflow": bool(row["overflow"]),
+        }
+
+    def iter_saved(self) -> Iterator[dict]:
+        """Every saved thread: channel_id, thread_ts, last_ts, analysis, slack_url, page_url."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT channel_id, thread_ts, last_ts, analysis, slack_url, page_url"
+                " FROM thread_state"
+            ).fetchall()
+        for row in rows:
+            yield {
+                "channel_id": row["channel_id"],
+                "thread_ts": row["thread_ts"],
+                "last_ts": row["last_ts"],
+                "analysis": AnalysisResult.model_validate_json(row["analysis"]),
+                "slack_url": row["slack_url"],
+                "page_url": row["page_url"],
+            }
+
+    def tracked_url(self, channel_id: str, thread_ts: str) -> str | None:
+        """Slack URL of a saved thread, or None if the thread is not tracked."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT slack_url FROM thread_state WHERE channel_id = ? AND thread_ts = ?",
+                (channel_id, thread_ts),
+            ).fetchone()
+        if row is None or not row["slack_url"]:
+            return None
+        return row["slack_url"]
+
+    def put(
+        self,
+        channel_id: str,
+        thread_ts: str,
+        last_ts: str,
+        analysis: AnalysisResult,
+        fingerprint: str = "",
+        page_url: str = "",
+        slack_url: str = "",
+        overflow: bool = True,
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thread_state"
+                " (channel_id, thread_ts, last_ts, analysis, fingerprint, page_url,"
+                " slack_url, overflow, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    channel_id,
+                    thread_ts,
+                    last_ts,
+                    analysis.model_dump_json(),
+                    fingerprint,
+                    page_url,
+                    slack_url,
+                    int(overflow),
+                    time.time(),
+                ),
+            )
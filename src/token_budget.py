@@ -0,0 +1,221 @@
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from datetime import date
+from typing import TypeVar
+
+from src.storage import connect
+
+# Default cap on the estimated size of a thread prompt. Longer threads keep
+# their opening messages and most recent replies (see keep_head_and_tail);
+# every Slack page is still fetched, since the latest replies come last.
+PROMPT_TOKEN_BUDGET = 200_000
+# "[YYYY-MM-DD HH:MM] " prefix and separators of one prompt line
+LINE_OVERHEAD_TOKENS = 8
+# Share of an over-budget thread's tokens kept for its opening messages; the
+# rest goes to the most recent replies.
+HEAD_TOKEN_SHARE = 0.3
+
+USAGE_DB = "usage.sqlite3"
+# Reserved per analysis for the response (max_output_tokens of a call).
+OUTPUT_TOKEN_RESERVE = 4096
+# Compacting below this leaves too little of a thread to be worth analyzing.
+MIN_COMPACT_TOKENS = 2_000
+OVERFLOW_ACTIONS = ("compact", "route", "reject")
+DEFAULT_OVERFLOW_MODEL = "gemini-2.0-flash-lite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_usage (
+    day TEXT PRIMARY KEY,
+    tokens INTEGER NOT NULL
+);
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate for Gemini.
+
+    About four ASCII characters per token; Japanese and other non-ASCII
+    characters count as one token each, which errs on the high side.
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+T = TypeVar("T")
+
+
+def keep_head_and_tail(
+    items: Iterable[T],
+    cost: Callable[[T], int],
+    max_tokens: int,
+    head_share: float = HEAD_TOKEN_SHARE,
+) -> tuple[list[T], list[T], int]:
+    """Keep the opening items and the most recent ones within `max_tokens`.
+
+    `items` is consumed in one pass holding at most the kept items, so a
+    streamed source is never fully materialized. The first and the last
+    item are always kept. Returns (head, tail, number of items dropped
+    between them).
+    """
+    head: list[T] = []
+    tail: deque[tuple[T, int]] = deque()
+    head_budget = int(max_tokens * head_share)
+    head_used = tail_used = omitted = 0
+    for item in items:
+        item_cost = cost(item)
+        if not tail and (not head or head_used + item_cost <= head_budget):
+            head.append(item)
+            head_used += item_cost
+            continue
+        tail.append((item, item_cost))
+        tail_used += item_cost
+        while len(tail) > 1 and head_used + tail_used > max_tokens:
+            tail_used -= tail.popleft()[1]
+            omitted += 1
+    return head, [item for item, _ in tail], omitted
+
+
+class BudgetExceeded(RuntimeError):
+    """An analysis would exceed the per-request or per-day token budget."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(f"Token budget exceeded: {reason}")
+
+
+@dataclass
+class Preflight:
+    """Outcome of TokenBudget.preflight for one analysis.
+
+    `max_tokens` asks the caller to re-format the prompt within that many
+    tokens; `model` routes the call to another model. `reserved` is the
+    amount held against the daily budget until settle().
+    """
+
+    estimate: int
+    reserved: int = 0
+    max_tokens: int | None = None
+    model: str | None = None
+    reason: str = ""
+
+
+class TokenBudget:
+    """Per-request and per-day limits on Gemini tokens, checked before a call.
+
+    Daily usage lives in SQLite, so concurrent workers and separate runs
+    (cron refreshes, the UI) share one budget. Each pre-flight reserves its
+    estimate up front; settle() replaces it with the reported usage.
+    Without limits, usage is still counted.
+    """
+
+    def __init__(
+        self,
+        per_request: int | None = None,
+        per_day: int | None = None,
+        overflow: str = "compact",
+        overflow_model: str = DEFAULT_OVERFLOW_MODEL,
+        name: str = USAGE_DB,
+        today: Callable[[], date] = date.today,
+    ):
+        if overflow not in OVERFLOW_ACTIONS:
+            raise ValueError(
+                f"Unknown token budget overflow action {overflow!r};"
+                f" expected one of {', '.join(OVERFLOW_ACTIONS)}"
+            )
+        self.per_request = per_request
+        self.per_day = per_day
+        self.overflow = overflow
+        self.overflow_model = overflow_model
+        self.today = today
+        self._conn = connect(name)
+        self._lock = threading.Lock()
+        self._conn.executescript(_SCHEMA)
+
+    def _add(self, tokens: int) -> None:
+        self._conn.execute(
+            "INSERT INTO daily_usage (day, tokens) VALUES (?, ?)"
+            " ON CONFLICT (day) DO UPDATE SET tokens = MAX(0, tokens + excluded.tokens)",
+            (self.today().isoformat(), tokens),
+        )
+
+    def _used(self) -> int:
+        row = self._conn.execute(
+            "SELECT tokens FROM daily_usage WHERE day = ?", (self.today().isoformat(),)
+        ).fetchone()
+        return row["tokens"] if row else 0
+
+    def used_today(self) -> int:
+        """Tokens used (and reserved by calls in flight) today."""
+        with self._lock:
+            return self._used()
+
+    def preflight(self, prompt_tokens: int, can_compact: bool = True) -> Preflight:
+        """Check an estimated prompt against the budgets and reserve it.
+
+        A prompt over the budget is compacted to what remains, routed to
+        `overflow_model` (per-request limit only) or rejected, per `overflow`.
+        Raises BudgetExceeded when it cannot be brought within budget.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                plan = self._plan(prompt_tokens, can_compact)
+                self._add(plan.reserved)
+            finally:
+                self._conn.execute("COMMIT")
+        return plan
+
+    def _plan(self, prompt_tokens: int, can_compact: bool) -> Preflight:
+        allowed = self.per_request
+        reason = f"{prompt_tokens} estimated prompt tokens > per-request budget {allowed}"
+        daily_only = False
+        if self.per_day is not None:
+            remaining = self.per_day - self._used() - OUTPUT_TOKEN_RESERVE
+            if allowed is None or remaining < allowed:
+                allowed = max(remaining, 0)
+                daily_only = True
+                reason = (
+                    f"{prompt_tokens} estimated prompt tokens > {allowed} left"
+                    f" of the daily budget {self.per_day}"
+                )
+
+        if allowed is None or prompt_tokens <= allowed:
+            return Preflight(prompt_tokens, reserved=prompt_tokens + OUTPUT_TOKEN_RESERVE)
+        if self.overflow == "compact" and can_compact and allowed >= MIN_COMPACT_TOKENS:
+            return Preflight(
+                prompt_tokens,
+                reserved=allowed + OUTPUT_TOKEN_RESERVE,
+                max_tokens=allowed,
+                reason=reason,
+            )
+        if self.overflow == "route" and not daily_only:
+            return Preflight(
+                prompt_tokens,
+                reserved=prompt_tokens + OUTPUT_TOKEN_RESERVE,
+                model=self.overflow_model,
+                reason=reason,
+            )
+        raise BudgetExceeded(reason)
+
+    def settle(self, plan: Preflight, total_tokens: int) -> None:
+        """Replace the reservation of `plan` with the tokens actually used."""
+        with self._lock:
+            self._add(total_tokens - plan.reserved)
+
+    @classmethod
+    def from_config(cls, get: Callable[[str], str]) -> "TokenBudget":
+        """Read TOKEN_BUDGET_PER_REQUEST / TOKEN_BUDGET_PER_DAY /
+        TOKEN_BUDGET_OVERFLOW / TOKEN_BUDGET_OVERFLOW_MODEL via `get` (env, secrets).
+
+        Unset limits are not enforced.
+        """
+        per_request = get("TOKEN_BUDGET_PER_REQUEST")
+        per_day = get("TOKEN_BUDGET_PER_DAY")
+        return cls(
+            per_request=int(per_request) if per_request else None,
+            per_day=int(per_day) if per_day else None,
+            overflow=(get("TOKEN_BUDGET_OVERFLOW") or "compact").lower(),
+            overflow_model=get("TOKEN_BUDGET_OVERFLOW_MODEL") or DEFAULT_OVERFLOW_MODEL,
+        )
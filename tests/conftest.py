@@ -0,0 +1,16 @@
+import pytest
+
+from src.notion_schema import clear_schema_cache
+from src.storage import DATA_DIR_ENV
+
+
+@pytest.fixture(autouse=True)
+def _clear_schema_cache():
+    clear_schema_cache()
+    yield
+    clear_schema_cache()
+
+
+@pytest.fixture(autouse=True)
+def _isolated_data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(DATA_DIR_ENV, str(tmp_path / "data"))
@@ -1,7 +1,21 @@
 from datetime import date
 from unittest.mock import patch, MagicMock
 
-from src.aging import HTTP_TIMEOUT, calculate_aging_days, run_aging_update, send_reminders
+import pytest
+from slack_sdk.errors import SlackApiError
+
+from src.aging import (
+    AGING_FORMULA,
+    DIGEST_MAX_BLOCKS,
+    DIGEST_SECTION_MAX_CHARS,
+    HTTP_TIMEOUT,
+    build_reminder_digests,
+    calculate_aging_days,
+    run_aging_update,
+    send_reminder_digest,
+    send_reminders,
+)
+from src.checkpoint import Checkpoint
 
 
 class TestCalculateAgingDays:
@@ -30,16 +44,44 @@ def _make_page(page_id, status, last_managed, theme="Test", next_decision="Decid
     }
 
 
+def _query_resp(pages, has_more=False, next_cursor=None):
+    resp = MagicMock()
+    resp.json.return_value = {
+        "results": pages,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    }
+    resp.raise_for_status = MagicMock()
+    return resp
+
+
+def _schema_resp(aging_type="number"):
+    resp = MagicMock()
+    resp.json.return_value = {
+        "properties": {
+            "Title": {"id": "title", "type": "title"},
+            "Status": {"id": "st%3A", "type": "select"},
+            "Next Decision Required": {"id": "ndr1", "type": "rich_text"},
+            "Slack URL": {"id": "url1", "type": "url"},
+            "Last Managed At": {"id": "lma1", "type": "date"},
+            "Aging Days": {"id": "age1", "type": aging_type},
+            "Premises": {"id": "pre1", "type": "rich_text"},
+        }
+    }
+    resp.raise_for_status = MagicMock()
+    return resp
+
+
 class TestRunAgingUpdate:
     @patch("src.aging.httpx.patch")
     @patch("src.aging.httpx.post")
-    def test_updates_aging_days(self, mock_post, mock_patch):
-        query_resp = MagicMock()
-        query_resp.json.return_value = {
-            "results": [_make_page("p1", "Open", "2026-02-06")],
-        }
-        query_resp.raise_for_status = MagicMock()
-        mock_post.return_value = query_resp
+    @patch("src.notion_schema.httpx.get")
+    def test_updates_aging_days(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp()
+        mock_post.side_effect = [
+            _query_resp([_make_page("p1", "Open", "2026-02-06")]),
+            _query_resp([]),
+        ]
 
         update_resp = MagicMock()
         update_resp.raise_for_status = MagicMock()
@@ -50,22 +92,26 @@ class TestRunAgingUpdate:
         mock_patch.assert_called_once()
         call_json = mock_patch.call_args[1]["json"]
         assert call_json["properties"]["Aging Days"]["number"] == 7
+        assert mock_get.call_args.kwargs["timeout"] == HTTP_TIMEOUT
         assert mock_post.call_args.kwargs["timeout"] == HTTP_TIMEOUT
         assert mock_patch.call_args.kwargs["timeout"] == HTTP_TIMEOUT
 
     @patch("src.aging.httpx.patch")
     @patch("src.aging.httpx.post")
-    def test_returns_reminder_candidates(self, mock_post, mock_patch):
-        query_resp = MagicMock()
-        query_resp.json.return_value = {
-            "results": [
-                _make_page("p1", "Open", "2026-02-01"),
-                _make_page("p2", "Waiting", "2026-02-01"),
-                _make_page("p3", "Open", "2026-02-12"),
-            ],
-        }
-        query_resp.raise_for_status = MagicMock()
-        mock_post.return_value = query_resp
+    @patch("src.notion_schema.httpx.get")
+    def test_returns_reminder_candidates(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp()
+        mock_post.side_effect = [
+            _query_resp(
+                [
+                    _make_page("p1", "Open", "2026-02-01"),
+                    _make_page("p2", "Waiting", "2026-02-01"),
+                    _make_page("p3", "Open", "2026-02-12"),
+                ]
+            ),
+            # Notion applies the Open + Aging >= 7 filter server-side
+            _query_resp([_make_page("p1", "Open", "2026-02-01")]),
+        ]
 
         update_resp = MagicMock()
         update_resp.raise_for_status = MagicMock()
@@ -73,30 +119,50 @@ class TestRunAgingUpdate:
 
         result = run_aging_update("test-token", "db-id", today=date(2026, 2, 13))
         assert result["updated"] == 3
-        # Open + Aging >= 7 のみリマインド対象
         assert len(result["reminders"]) == 1
         assert result["reminders"][0]["page_id"] == "p1"
+        assert result["reminders"][0]["aging_days"] == 12
 
     @patch("src.aging.httpx.patch")
     @patch("src.aging.httpx.post")
-    def test_handles_notion_query_pagination(self, mock_post, mock_patch):
-        first_query = MagicMock()
-        first_query.json.return_value = {
-            "results": [_make_page("p1", "Open", "2026-02-06")],
-            "has_more": True,
-            "next_cursor": "cursor-1",
-        }
-        first_query.raise_for_status = MagicMock()
+    @patch("src.notion_schema.httpx.get")
+    def test_pushes_filters_to_notion(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp()
+        mock_post.side_effect = [_query_resp([]), _query_resp([])]
 
-        second_query = MagicMock()
-        second_query.json.return_value = {
-            "results": [_make_page("p2", "Open", "2026-02-05")],
-            "has_more": False,
-            "next_cursor": None,
-        }
-        second_query.raise_for_status = MagicMock()
+        run_aging_update("test-token", "db-id", today=date(2026, 2, 13))
+
+        aging_call, reminder_call = mock_post.call_args_list
+        aging_filter = aging_call.kwargs["json"]["filter"]["and"]
+        assert {"property": "Last Managed At", "date": {"before": "2026-02-13"}} in aging_filter
+        assert aging_call.kwargs["params"] == [
+            ("filter_properties", "lma1"),
+            ("filter_properties", "age1"),
+        ]
+
+        reminder_filter = reminder_call.kwargs["json"]["filter"]["and"]
+        assert {"property": "Status", "select": {"equals": "Open"}} in reminder_filter
+        assert {
+            "property": "Last Managed At",
+            "date": {"on_or_before": "2026-02-06"},
+        } in reminder_filter
+        projected = [value for _, value in reminder_call.kwargs["params"]]
+        assert "pre1" not in projected
+        assert "age1" not in projected
+        mock_patch.assert_not_called()
 
-        mock_post.side_effect = [first_query, second_query]
+    @patch("src.aging.httpx.patch")
+    @patch("src.aging.httpx.post")
+    @patch("src.notion_schema.httpx.get")
+    def test_handles_notion_query_pagination(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp()
+        mock_post.side_effect = [
+            _query_resp(
+                [_make_page("p1", "Open", "2026-02-06")], has_more=True, next_cursor="cursor-1"
+            ),
+            _query_resp([_make_page("p2", "Open", "2026-02-05")]),
+            _query_resp([]),
+        ]
 
         update_resp = MagicMock()
         update_resp.raise_for_status = MagicMock()
@@ -104,10 +170,151 @@ class TestRunAgingUpdate:
 
         result = run_aging_update("test-token", "db-id", today=date(2026, 2, 13))
         assert result["updated"] == 2
-        assert mock_post.call_count == 2
+        assert mock_post.call_count == 3
+        assert mock_post.call_args_list[1].kwargs["json"]["start_cursor"] == "cursor-1"
         assert mock_patch.call_count == 2
 
 
+class TestAgingCheckpoint:
+    @patch("src.aging.httpx.patch")
+    @patch("src.aging.httpx.post")
+    @patch("src.notion_schema.httpx.get")
+    def test_resumes_from_cursor_and_skips_done_pages(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp()
+        update_resp = MagicMock()
+        update_resp.raise_for_status = MagicMock()
+        mock_patch.side_effect = [update_resp, update_resp, RuntimeError("notion down")]
+        mock_post.side_effect = [
+            _query_resp(
+                [_make_page("p1", "Open", "2026-02-06"), _make_page("p2", "Open", "2026-02-06")],
+                has_more=True,
+                next_cursor="cursor-1",
+            ),
+            _query_resp(
+                [_make_page("p3", "Open", "2026-02-06"), _make_page("p4", "Open", "2026-02-06")]
+            ),
+        ]
+
+        checkpoint = Checkpoint("aging")
+        with pytest.raises(RuntimeError):
+            run_aging_update("test-token", "db-id", today=date(2026, 2, 13), checkpoint=checkpoint)
+
+        # first result page completed, p3 in flight when the run died
+        resumed = Checkpoint("aging")
+        assert resumed.cursor == "cursor-1"
+        assert resumed.done == set()
+
+        mock_patch.reset_mock()
+        mock_patch.side_effect = None
+        mock_patch.return_value = update_resp
+        mock_post.side_effect = [
+            _query_resp(
+                [_make_page("p3", "Open", "2026-02-06"), _make_page("p4", "Open", "2026-02-06")]
+            ),
+            _query_resp([]),
+        ]
+        result = run_aging_update("test-token", "db-id", today=date(2026, 2, 13), checkpoint=resumed)
+        assert result["updated"] == 2
+        assert mock_post.call_args_list[-2].kwargs["json"]["start_cursor"] == "cursor-1"
+
+    @patch("src.aging.httpx.patch")
+    @patch("src.aging.httpx.post")
+    @patch("src.notion_schema.httpx.get")
+    def test_skips_pages_already_done_in_current_batch(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp()
+        update_resp = MagicMock()
+        update_resp.raise_for_status = MagicMock()
+        mock_patch.return_value = update_resp
+        mock_post.side_effect = [
+            _query_resp(
+                [_make_page("p1", "Open", "2026-02-06"), _make_page("p2", "Open", "2026-02-06")]
+            ),
+            _query_resp([]),
+        ]
+
+        checkpoint = Checkpoint("aging", scope="2026-02-13")
+        checkpoint.mark_done("p1")
+        result = run_aging_update("test-token", "db-id", today=date(2026, 2, 13), checkpoint=checkpoint)
+        assert result["updated"] == 1
+        assert mock_patch.call_args.args[0].endswith("/pages/p2")
+
+    @patch("src.aging.httpx.patch")
+    @patch("src.aging.httpx.post")
+    @patch("src.notion_schema.httpx.get")
+    def test_checkpoint_from_another_day_is_dropped(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp()
+        mock_post.side_effect = [_query_resp([]), _query_resp([])]
+        checkpoint = Checkpoint("aging", scope="2026-02-12")
+        checkpoint.advance("cursor-from-yesterday")
+
+        run_aging_update("test-token", "db-id", today=date(2026, 2, 13), checkpoint=checkpoint)
+
+        assert "start_cursor" not in mock_post.call_args_list[0].kwargs["json"]
+        assert Checkpoint("aging").scope == "2026-02-13"
+
+    @patch("src.aging.httpx.patch")
+    @patch("src.aging.httpx.post")
+    @patch("src.notion_schema.httpx.get")
+    def test_dry_run_writes_nothing(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp()
+        mock_post.side_effect = [
+            _query_resp([_make_page("p1", "Open", "2026-02-06")]),
+            _query_resp([_make_page("p1", "Open", "2026-02-06")]),
+        ]
+
+        result = run_aging_update("test-token", "db-id", today=date(2026, 2, 13), dry_run=True)
+        assert result["updated"] == 1
+        assert result["scanned"] == 1
+        assert len(result["reminders"]) == 1
+        mock_patch.assert_not_called()
+
+
+class TestFormulaAging:
+    @patch("src.aging.httpx.patch")
+    @patch("src.aging.httpx.post")
+    @patch("src.notion_schema.httpx.get")
+    def test_formula_schema_skips_page_writes(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp(aging_type="formula")
+        mock_post.return_value = _query_resp([_make_page("p1", "Open", "2026-02-01")])
+
+        result = run_aging_update("test-token", "db-id", today=date(2026, 2, 13))
+        assert result["aging_mode"] == "formula"
+        assert result["updated"] == 0
+        assert len(result["reminders"]) == 1
+        assert mock_post.call_count == 1  # reminder query only
+        mock_patch.assert_not_called()
+
+    @patch("src.aging.httpx.patch")
+    @patch("src.aging.httpx.post")
+    @patch("src.notion_schema.httpx.get")
+    def test_formula_mode_provisions_property(self, mock_get, mock_post, mock_patch):
+        mock_get.return_value = _schema_resp(aging_type="number")
+        mock_patch.return_value = _schema_resp(aging_type="formula")
+        mock_post.return_value = _query_resp([])
+
+        result = run_aging_update(
+            "test-token", "db-id", today=date(2026, 2, 13), aging_mode="formula"
+        )
+        assert result["updated"] == 0
+        mock_patch.assert_called_once()
+        assert mock_patch.call_args.args[0].endswith("/databases/db-id")
+        expression = mock_patch.call_args.kwargs["json"]["properties"]["Aging Days"]
+        assert expression == {"formula": {"expression": AGING_FORMULA}}
+
+    @patch("src.aging.httpx.patch")
+    @patch("src.aging.httpx.post")
+    @patch("src.notion_schema.httpx.get")
+    def test_number_mode_skips_unchanged_pages(self, mock_get, mock_post, mock_patch):
+        page = _make_page("p1", "Waiting", "2026-02-06")
+        page["properties"]["Aging Days"] = {"number": 7}
+        mock_get.return_value = _schema_resp()
+        mock_post.side_effect = [_query_resp([page]), _query_resp([])]
+
+        result = run_aging_update("test-token", "db-id", today=date(2026, 2, 13))
+        assert result["updated"] == 0
+        mock_patch.assert_not_called()
+
+
 class TestSendReminders:
     def test_sends_dm_for_each_reminder(self):
         slack_client = MagicMock()
@@ -136,3 +343,116 @@ class TestSendReminders:
         sent = send_reminders(slack_client, "U001", [])
         assert sent == 0
         slack_client.chat_postMessage.assert_not_called()
+
+
+def _make_reminder(page_id, aging_days):
+    return {
+        "page_id": page_id,
+        "theme": f"Theme {page_id}",
+        "next_decision_required": "Decide",
+        "aging_days": aging_days,
+        "slack_url": f"https://slack.com/{page_id}",
+    }
+
+
+def _rate_limited_error(retry_after="2", header="Retry-After"):
+    response = MagicMock()
+    response.status_code = 429
+    response.headers = {header: retry_after}
+    return SlackApiError("ratelimited", response)
+
+
+class TestBuildReminderDigests:
+    def test_sorts_by_aging_days_descending(self):
+        digests = build_reminder_digests(
+            [_make_reminder("p1", 8), _make_reminder("p2", 30), _make_reminder("p3", 12)]
+        )
+        assert len(digests) == 1
+        assert digests[0]["page_ids"] == ["p2", "p3", "p1"]
+
+    def test_splits_under_block_limit(self):
+        reminders = [_make_reminder(f"p{i}", 7 + i) for i in range(120)]
+        digests = build_reminder_digests(reminders)
+        assert len(digests) == 3
+        assert all(len(d["blocks"]) <= DIGEST_MAX_BLOCKS for d in digests)
+        assert sum(len(d["page_ids"]) for d in digests) == 120
+
+    def test_truncates_long_section_text(self):
+        reminder = _make_reminder("p1", 9)
+        reminder["next_decision_required"] = "x" * 5000
+        digests = build_reminder_digests([reminder])
+        section = digests[0]["blocks"][1]
+        assert len(section["text"]["text"]) <= DIGEST_SECTION_MAX_CHARS
+
+    def test_escapes_titles_in_links(self):
+        reminder = _make_reminder("p1", 9)
+        reminder["theme"] = "R&D <v2> | 予算"
+        reminder["next_decision_required"] = "a < b"
+        text = build_reminder_digests([reminder])[0]["blocks"][1]["text"]["text"]
+        assert text.startswith("*<https://slack.com/p1|R&amp;D &lt;v2&gt; ｜ 予算>*")
+        assert "a &lt; b" in text
+
+
+class TestSendReminderDigest:
+    def test_sends_one_message_for_small_batch(self):
+        slack_client = MagicMock()
+        slack_client.chat_postMessage.return_value = {"ok": True, "ts": "1.0"}
+        sleep = MagicMock()
+
+        results = send_reminder_digest(
+            slack_client, "U001", [_make_reminder("p1", 10), _make_reminder("p2", 8)], sleep=sleep
+        )
+        assert slack_client.chat_postMessage.call_count == 1
+        assert results == [{"ok": True, "ts": "1.0", "page_ids": ["p1", "p2"], "error": None}]
+        sleep.assert_not_called()
+
+    def test_paces_multiple_messages(self):
+        slack_client = MagicMock()
+        slack_client.chat_postMessage.return_value = {"ok": True, "ts": "1.0"}
+        sleep = MagicMock()
+
+        reminders = [_make_reminder(f"p{i}", 7 + i) for i in range(60)]
+        results = send_reminder_digest(slack_client, "U001", reminders, interval=1.5, sleep=sleep)
+        assert len(results) == 2
+        sleep.assert_called_once_with(1.5)
+
+    def test_retries_after_rate_limit(self):
+        slack_client = MagicMock()
+        slack_client.chat_postMessage.side_effect = [
+            _rate_limited_error("3"),
+            {"ok": True, "ts": "2.0"},
+        ]
+        sleep = MagicMock()
+
+        results = send_reminder_digest(slack_client, "U001", [_make_reminder("p1", 10)], sleep=sleep)
+        assert results[0]["ok"] is True
+        sleep.assert_called_once_with(3.0)
+
+    def test_reads_lowercase_retry_after(self):
+        slack_client = MagicMock()
+        slack_client.chat_postMessage.side_effect = [
+            _rate_limited_error("4", header="retry-after"),
+            {"ok": True, "ts": "2.0"},
+        ]
+        sleep = MagicMock()
+
+        send_reminder_digest(slack_client, "U001", [_make_reminder("p1", 10)], sleep=sleep)
+        sleep.assert_called_once_with(4.0)
+
+    def test_reports_failed_message(self):
+        response = MagicMock()
+        response.status_code = 400
+        response.headers = {}
+        slack_client = MagicMock()
+        slack_client.chat_postMessage.side_effect = SlackApiError("channel_not_found", response)
+
+        results = send_reminder_digest(
+            slack_client, "U001", [_make_reminder("p1", 10)], sleep=MagicMock()
+        )
+        assert results[0]["ok"] is False
+        assert "channel_not_found" in results[0]["error"]
+
+    def test_sends_nothing_for_empty_list(self):
+        slack_client = MagicMock()
+        assert send_reminder_digest(slack_client, "U001", []) == []
+        slack_client.chat_postMessage.assert_not_called()
@@ -1,9 +1,16 @@
+import subprocess
+import sys
 from datetime import datetime, timezone
-from unittest.mock import MagicMock, patch
+from pathlib import Path
+from unittest.mock import ANY, MagicMock, patch
 
-from src.cli import main
+from src.checkpoint import Checkpoint
+from src.cli import AGING_CHECKPOINT, REFRESH_CHECKPOINT, main
 from src.llm_analyzer import TokenUsage
 from src.models import AnalysisResult, DiscussionStructure, SlackMessage, SlackThread
+from src.notion_schema import SchemaError
+from src.storage import data_dir
+from src.thread_state import THREAD_STATE_DB
 
 
 def _make_thread() -> SlackThread:
@@ -49,11 +56,11 @@ class TestCli:
         },
         clear=False,
     )
-    @patch("src.cli.WebClient")
-    @patch("src.cli.fetch_slack_thread")
-    @patch("src.cli.parse_slack_thread_url")
-    @patch("src.cli.analyze_thread")
-    @patch("src.cli.save_to_notion")
+    @patch("slack_sdk.WebClient")
+    @patch("src.slack_client.fetch_slack_thread")
+    @patch("src.slack_client.parse_slack_thread_url")
+    @patch("src.llm_analyzer.analyze_thread")
+    @patch("src.notion_client.save_to_notion")
     def test_main_no_save(
         self,
         mock_save,
@@ -83,6 +90,7 @@ class TestCli:
         assert "Test Theme" in out
         assert '"total_tokens": 30' in out
         mock_save.assert_not_called()
+        assert not (data_dir() / THREAD_STATE_DB).exists()
 
     @patch.dict(
         "os.environ",
@@ -94,11 +102,12 @@ class TestCli:
         },
         clear=False,
     )
-    @patch("src.cli.WebClient")
-    @patch("src.cli.fetch_slack_thread")
-    @patch("src.cli.parse_slack_thread_url")
-    @patch("src.cli.analyze_thread")
-    @patch("src.cli.save_to_notion")
+    @patch("src.cli.ensure_schema")
+    @patch("slack_sdk.WebClient")
+    @patch("src.slack_client.fetch_slack_thread")
+    @patch("src.slack_client.parse_slack_thread_url")
+    @patch("src.llm_analyzer.analyze_thread")
+    @patch("src.notion_client.save_to_notion")
     def test_main_with_save(
         self,
         mock_save,
@@ -106,7 +115,9 @@ class TestCli:
         mock_parse,
         mock_fetch,
         mock_webclient,
+        mock_ensure_schema,
     ):
+        mock_ensure_schema.return_value = {}
         mock_parse.return_value = ("C01234ABC", "1705312200.123456")
         thread = _make_thread()
         analysis = _make_analysis()
@@ -129,4 +140,332 @@ class TestCli:
             thread.url,
             thread.channel_name,
             None,
+            aging_formula=False,
+            mirror=ANY,
+            overflow=None,
         )
+
+    @patch.dict(
+        "os.environ",
+        {
+            "SLACK_USER_TOKEN": "xoxp-test",
+            "GEMINI_API_KEY": "gemini-test",
+            "NOTION_TOKEN": "notion-test",
+            "NOTION_DATABASE_ID": "db-test",
+        },
+        clear=False,
+    )
+    @patch("src.cli.ensure_schema")
+    @patch("src.slack_client.fetch_slack_thread")
+    @patch("src.llm_analyzer.analyze_thread")
+    def test_schema_error_stops_before_analysis(
+        self, mock_analyze, mock_fetch, mock_ensure_schema, capsys
+    ):
+        mock_ensure_schema.side_effect = SchemaError(["missing property 'Memo' (rich_text)"])
+
+        code = main(
+            ["https://workspace.slack.com/archives/C01234ABC/p1705312200123456"]
+        )
+        assert code == 1
+        assert "Memo" in capsys.readouterr().err
+        mock_fetch.assert_not_called()
+        mock_analyze.assert_not_called()
+
+    @patch.dict(
+        "os.environ",
+        {
+            "SLACK_USER_TOKEN": "xoxp-test",
+            "GEMINI_API_KEY": "gemini-test",
+            "NOTION_TOKEN": "notion-test",
+            "NOTION_DATABASE_ID": "db-test",
+        },
+        clear=False,
+    )
+    @patch("src.cli.ensure_schema")
+    @patch("slack_sdk.WebClient")
+    @patch("src.slack_client.fetch_slack_thread")
+    @patch("src.llm_analyzer.analyze_thread")
+    @patch("src.notion_client.save_to_notion")
+    def test_unchanged_thread_is_not_reanalyzed(
+        self, mock_save, mock_analyze, mock_fetch, mock_webclient, mock_ensure_schema, capsys
+    ):
+        mock_ensure_schema.return_value = {}
+        thread = _make_thread()
+        thread.messages[0].ts = "1705312200.123456"
+        mock_fetch.return_value = thread
+        mock_analyze.return_value = (_make_analysis(), TokenUsage(10, 20, 30))
+        mock_save.return_value = "https://notion.so/page"
+
+        url = "https://workspace.slack.com/archives/C01234ABC/p1705312200123456"
+        assert main([url]) == 0
+        reply_link = url.replace("p1705312200123456", "p1705312299000000") + (
+            "?thread_ts=1705312200.123456&cid=C01234ABC"
+        )
+        assert main([reply_link]) == 0
+
+        assert mock_fetch.call_args.args[1:3] == ("C01234ABC", "1705312200.123456")
+        mock_analyze.assert_called_once()
+        mock_save.assert_called_once()
+        assert capsys.readouterr().out.count('"notion_page_url": "https://notion.so/page"') == 2
+
+
+_NOTION_ENV = {
+    "SLACK_USER_TOKEN": "xoxp-test",
+    "GEMINI_API_KEY": "gemini-test",
+    "NOTION_TOKEN": "notion-test",
+    "NOTION_DATABASE_ID": "db-test",
+}
+
+
+def _open_page(n: int, status: str = "Open", memo: str | None = None) -> dict:
+    return {
+        "page_id": f"p{n}",
+        "title": f"Item {n}",
+        "slack_url": f"https://s/{n}",
+        "aging_days": 0,
+        "status": status,
+        "memo": memo,
+    }
+
+
+def _refresh_result(tokens: int = 30, skipped: bool = False) -> dict:
+    return {
+        "theme": "A",
+        "page_url": "https://notion.so/1",
+        "total_tokens": tokens,
+        "skipped": skipped,
+    }
+
+
+@patch.dict("os.environ", _NOTION_ENV, clear=False)
+@patch("src.cli.ensure_schema", MagicMock(return_value={}))
+@patch("slack_sdk.WebClient", MagicMock())
+class TestRefreshCommand:
+    @patch("src.notion_client.iter_open_pages")
+    @patch("src.pipeline.refresh_thread")
+    def test_refreshes_open_pages_and_reports_skips(self, mock_refresh, mock_pages, capsys):
+        mock_pages.return_value = iter([_open_page(1), _open_page(2, "Waiting", "m")])
+        mock_refresh.side_effect = lambda *args, **kwargs: _refresh_result(
+            0 if kwargs["status"] == "Waiting" else 30, skipped=kwargs["status"] == "Waiting"
+        )
+
+        code = main(["refresh"])
+        out = capsys.readouterr().out
+        assert code == 0
+        assert '"updated": 1, "skipped": 1, "failed": 0, "total_tokens": 30' in out
+        waiting_call = next(
+            c for c in mock_refresh.call_args_list if c.kwargs["status"] == "Waiting"
+        )
+        assert waiting_call.kwargs["memo"] == "m"
+
+    @patch("src.notion_client.iter_open_pages")
+    @patch("src.pipeline.refresh_thread")
+    def test_filters_by_url_and_forces(self, mock_refresh, mock_pages):
+        mock_pages.return_value = iter([_open_page(1), _open_page(2)])
+        mock_refresh.return_value = _refresh_result(5)
+
+        code = main(["refresh", "https://s/2", "--force"])
+        assert code == 0
+        mock_refresh.assert_called_once()
+        assert mock_refresh.call_args.args[4] == "https://s/2"
+        assert mock_refresh.call_args.kwargs["force"] is True
+
+    @patch("src.notion_client.iter_open_pages")
+    @patch("src.pipeline.refresh_thread")
+    def test_failures_do_not_keep_the_checkpoint_alive(self, mock_refresh, mock_pages, capsys):
+        def refresh(*args, **kwargs):
+            if args[4] == "https://s/2":
+                raise RuntimeError("slack down")
+            return _refresh_result()
+
+        mock_refresh.side_effect = refresh
+        mock_pages.side_effect = lambda *a: iter([_open_page(1), _open_page(2), _open_page(3)])
+
+        assert main(["refresh"]) == 1
+        assert "slack down" in capsys.readouterr().out
+        checkpoint = Checkpoint(REFRESH_CHECKPOINT)
+        assert not checkpoint.resumed
+        assert checkpoint.failed == {"p2"}
+
+        # The next run attempts every page again, not only the failed one
+        mock_refresh.reset_mock()
+        assert main(["refresh"]) == 1
+        assert mock_refresh.call_count == 3
+
+        mock_refresh.side_effect = None
+        mock_refresh.return_value = _refresh_result()
+        assert main(["refresh"]) == 0
+        assert not Checkpoint(REFRESH_CHECKPOINT).path.exists()
+
+    @patch("src.notion_client.iter_open_pages")
+    @patch("src.pipeline.refresh_thread")
+    def test_restart_ignores_checkpoint(self, mock_refresh, mock_pages):
+        checkpoint = Checkpoint(REFRESH_CHECKPOINT)
+        checkpoint.mark_done("p1")
+        mock_pages.return_value = iter([_open_page(1), _open_page(2)])
+        mock_refresh.return_value = _refresh_result()
+
+        assert main(["refresh", "--restart"]) == 0
+        assert mock_refresh.call_count == 2
+
+    @patch("src.notion_client.iter_open_pages")
+    @patch("src.pipeline.refresh_thread")
+    def test_stops_at_time_budget(self, mock_refresh, mock_pages, capsys):
+        mock_pages.return_value = iter([_open_page(1), _open_page(2)])
+        mock_refresh.return_value = _refresh_result()
+
+        assert main(["refresh", "--max-minutes", "0.0000001"]) == 0
+        out = capsys.readouterr().out
+        assert '"complete": false' in out
+        mock_refresh.assert_not_called()
+
+
+def _aging_result(**overrides) -> dict:
+    result = {
+        "updated": 3,
+        "scanned": 5,
+        "unchanged": 2,
+        "reminders": [
+            {
+                "page_id": "p1",
+                "theme": "Stale",
+                "next_decision_required": "Decide",
+                "aging_days": 9,
+                "slack_url": "https://s/1",
+            }
+        ],
+        "aging_mode": "number",
+    }
+    result.update(overrides)
+    return result
+
+
+@patch.dict("os.environ", {**_NOTION_ENV, "SLACK_REMINDER_USER_ID": "U001"}, clear=False)
+class TestAgingCommand:
+    @patch("slack_sdk.WebClient", MagicMock())
+    @patch("src.cli.send_reminder_digest")
+    @patch("src.cli.run_aging_update")
+    def test_runs_update_and_sends_digest(self, mock_run, mock_digest, capsys):
+        mock_run.return_value = _aging_result()
+        mock_digest.return_value = [{"ok": True, "ts": "1.0", "page_ids": ["p1"], "error": None}]
+
+        assert main(["aging"]) == 0
+        out = capsys.readouterr().out
+        assert '"updated": 3' in out
+        assert '"reminder_messages": 1' in out
+        assert mock_run.call_args.kwargs["checkpoint"] is not None
+        assert mock_run.call_args.kwargs["dry_run"] is False
+        mock_digest.assert_called_once()
+
+    @patch("src.cli.send_reminder_digest")
+    @patch("src.cli.run_aging_update")
+    def test_dry_run_sends_nothing(self, mock_run, mock_digest, capsys):
+        mock_run.return_value = _aging_result()
+
+        assert main(["aging", "--dry-run"]) == 0
+        out = capsys.readouterr().out
+        assert '"dry_run": true' in out
+        assert '"theme": "Stale"' in out
+        assert mock_run.call_args.kwargs["checkpoint"] is None
+        mock_digest.assert_not_called()
+
+    @patch("src.cli.send_reminder_digest")
+    @patch("src.cli.run_aging_update")
+    def test_keeps_checkpoint_when_run_fails(self, mock_run, mock_digest, capsys):
+        def fail(*args, checkpoint, **kwargs):
+            checkpoint.advance("cursor-9")
+            raise RuntimeError("notion down")
+
+        mock_run.side_effect = fail
+        assert main(["aging", "--no-remind"]) == 1
+        assert "notion down" in capsys.readouterr().err
+        assert Checkpoint(AGING_CHECKPOINT).cursor == "cursor-9"
+
+        mock_run.side_effect = None
+        mock_run.return_value = _aging_result()
+        assert main(["aging", "--no-remind"]) == 0
+        assert '"resumed": true' in capsys.readouterr().out
+        assert not Checkpoint(AGING_CHECKPOINT).resumed
+        mock_digest.assert_not_called()
+
+
+class TestSearchCommand:
+    def test_rebuild_indexes_saved_analyses_and_searches(self, capsys):
+        from src.thread_state import ThreadStateStore
+
+        analysis = _make_analysis()
+        ThreadStateStore().put(
+            "C01", "1.0", "2.0", analysis, page_url="https://notion/1", slack_url="https://slack/1"
+        )
+
+        assert main(["search", "--rebuild", analysis.theme]) == 0
+
+        captured = capsys.readouterr()
+        assert '"indexed": 1' in captured.err
+        assert '"page_url": "https://notion/1"' in captured.out
+
+    def test_no_results_on_empty_index(self, capsys):
+        assert main(["search", "anything"]) == 0
+        assert capsys.readouterr().out == ""
+
+
+class TestConceptsCommand:
+    def test_rebuild_and_lookup(self, capsys):
+        from src.thread_state import ThreadStateStore
+
+        analysis = _make_analysis()
+        ThreadStateStore().put(
+            "C01", "1770076800.0", "1770076800.0", analysis, slack_url="https://slack/1"
+        )
+        concept = analysis.new_concepts[0]
+
+        assert main(["concepts", "--rebuild", concept]) == 0
+
+        captured = capsys.readouterr()
+        assert '"indexed": 1' in captured.err
+        assert '"threads": 1' in captured.out
+        assert '"slack_url": "https://slack/1"' in captured.out
+
+    def test_unknown_concept(self, capsys):
+        assert main(["concepts", "nothing"]) == 1
+        assert "Unknown concept" in capsys.readouterr().err
+
+
+# SDKs that must stay off the import path of `--help` and argument errors.
+_HEAVY_MODULES = ["google.genai", "slack_sdk", "httpx", "pydantic"]
+
+
+def _loaded_after(code: str) -> list[str]:
+    script = (
+        "import sys\n"
+        f"{code}\n"
+        f"print('loaded:' + ','.join(m for m in {_HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        text=True,
+        cwd=Path(__file__).resolve().parent.parent,
+        check=True,
+    )
+    loaded = result.stdout.rpartition("loaded:")[2].strip()
+    return [m for m in loaded.split(",") if m]
+
+
+class TestImportBudget:
+    def test_importing_cli_loads_no_sdks(self):
+        assert _loaded_after("import src.cli") == []
+
+    def test_help_loads_no_sdks(self):
+        code = (
+            "from src.cli import main\n"
+            "for argv in (['--help'], ['refresh', '--help'], ['aging', '--help']):\n"
+            "    try:\n"
+            "        main(argv)\n"
+            "    except SystemExit:\n"
+            "        pass"
+        )
+        assert _loaded_after(code) == []
+
+    def test_analyzer_defers_genai_until_first_call(self):
+        assert "google.genai" not in _loaded_after("import src.llm_analyzer, src.pipeline")
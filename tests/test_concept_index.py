@@ -0,0 +1,84 @@
+from datetime import datetime, timezone
+
+from src.concept_index import ConceptIndex, concept_key
+from src.models import AnalysisResult, DiscussionStructure, SlackThread
+from src.thread_state import ThreadStateStore
+
+
+def _make_analysis(concepts: list[str]) -> AnalysisResult:
+    return AnalysisResult(
+        theme="Theme",
+        structure=DiscussionStructure(
+            premises=[], key_issues=[], conclusions_or_current_state=[]
+        ),
+        next_decision_required="Decide",
+        suggested_next_action="Act",
+        suggested_owner="Alice",
+        new_concepts=concepts,
+        strategic_implications=[],
+        risk_signals=[],
+    )
+
+
+def _make_thread(ts: str, day: int) -> SlackThread:
+    return SlackThread(
+        channel_id="C01",
+        channel_name="general",
+        thread_ts=ts,
+        messages=[],
+        url=f"https://slack/{ts}",
+        last_reply_at=datetime(2026, 2, day, tzinfo=timezone.utc),
+    )
+
+
+class TestConceptKey:
+    def test_ignores_case_and_spacing(self):
+        assert concept_key("  Usage  Based Pricing ") == concept_key("usage based pricing")
+
+
+class TestConceptIndex:
+    def test_aggregates_across_threads(self):
+        index = ConceptIndex()
+        index.record(_make_thread("1.0", 3), _make_analysis(["RAG", "Pricing"]), "https://notion/1")
+        index.record(_make_thread("2.0", 10), _make_analysis(["rag"]))
+
+        assert index.concept("Rag") == {
+            "name": "rag",
+            "threads": 2,
+            "first_seen": "2026-02-03",
+            "last_seen": "2026-02-10",
+        }
+        assert [t["slack_url"] for t in index.threads("RAG")] == [
+            "https://slack/2.0",
+            "https://slack/1.0",
+        ]
+        assert index.concept("unknown") is None
+
+    def test_resaving_a_thread_does_not_double_count(self):
+        index = ConceptIndex()
+        index.record(_make_thread("1.0", 3), _make_analysis(["RAG"]), "https://notion/1")
+        index.record(_make_thread("1.0", 5), _make_analysis(["RAG", "RAG"]))
+
+        assert index.concept("RAG")["threads"] == 1
+        assert index.concept("RAG")["last_seen"] == "2026-02-05"
+        assert index.threads("RAG")[0]["page_url"] == "https://notion/1"
+
+    def test_top_orders_by_frequency(self):
+        index = ConceptIndex()
+        index.record(_make_thread("1.0", 3), _make_analysis(["RAG", "Pricing"]))
+        index.record(_make_thread("2.0", 4), _make_analysis(["RAG"]))
+        index.record(_make_thread("3.0", 5), _make_analysis(["Hiring"]))
+
+        assert [c["name"] for c in index.top()] == ["RAG", "Hiring", "Pricing"]
+        assert len(index.top(limit=1)) == 1
+
+    def test_backfill_from_thread_state(self):
+        state = ThreadStateStore()
+        state.put(
+            "C01", "1.0", "1770076800.000100", _make_analysis(["RAG"]), slack_url="https://slack/1"
+        )
+
+        index = ConceptIndex()
+
+        assert index.backfill(state) == 1
+        assert index.concept("RAG")["first_seen"] == "2026-02-03"
@@ -0,0 +1,168 @@
+import json
+import threading
+import time
+
+import httpx
+
+from src.events import (
+    EVENT_JOB,
+    Debouncer,
+    EventReceiver,
+    enqueue_refresh,
+    make_server,
+    sign_request,
+    thread_key,
+    verify_signature,
+)
+from src.jobs import JobStore
+from src.models import AnalysisResult, DiscussionStructure
+from src.thread_state import ThreadStateStore
+
+SECRET = "signing-secret"
+URL = "https://workspace.slack.com/archives/C01/p1705312200123456"
+
+
+def _make_analysis() -> AnalysisResult:
+    return AnalysisResult(
+        theme="Theme",
+        structure=DiscussionStructure(
+            premises=[], key_issues=[], conclusions_or_current_state=[]
+        ),
+        next_decision_required="Decide",
+        suggested_next_action="Alice by Friday",
+        suggested_owner="Alice",
+        new_concepts=[],
+        strategic_implications=[],
+        risk_signals=[],
+    )
+
+
+def _reply_event(thread_ts: str = "1705312200.123456", ts: str = "1705312300.000001") -> dict:
+    return {
+        "type": "event_callback",
+        "event": {"type": "message", "channel": "C01", "thread_ts": thread_ts, "ts": ts},
+    }
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestSignature:
+    def test_accepts_valid_and_rejects_tampered_or_stale(self):
+        body = b'{"type":"event_callback"}'
+        ts = str(int(time.time()))
+        signature = sign_request(SECRET, ts, body)
+
+        assert verify_signature(SECRET, ts, body, signature)
+        assert not verify_signature(SECRET, ts, body + b" ", signature)
+        assert not verify_signature("other", ts, body, signature)
+        assert not verify_signature(SECRET, ts, body, signature, now=time.time() + 600)
+        assert not verify_signature(SECRET, "", body, signature)
+
+
+class TestThreadKey:
+    def test_reply_edit_and_delete(self):
+        assert thread_key({"type": "message", "channel": "C01", "thread_ts": "1.0"}) == ("C01", "1.0")
+        assert thread_key({
+            "type": "message", "subtype": "message_changed", "channel": "C01",
+            "message": {"thread_ts": "1.0"},
+        }) == ("C01", "1.0")
+        assert thread_key({
+            "type": "message", "subtype": "message_deleted", "channel": "C01",
+            "previous_message": {"thread_ts": "1.0"},
+        }) == ("C01", "1.0")
+
+    def test_ignores_top_level_messages_and_other_events(self):
+        assert thread_key({"type": "message", "channel": "C01", "ts": "1.0"}) is None
+        assert thread_key({"type": "reaction_added", "channel": "C01"}) is None
+
+
+class TestDebouncer:
+    def test_coalesces_burst_until_quiet(self):
+        clock = FakeClock()
+        flushed = []
+        debouncer = Debouncer(lambda k, v: flushed.append((k, v)), quiet=30, max_wait=300, clock=clock)
+
+        for i in range(5):
+            clock.now = i * 10
+            debouncer.touch(("C01", "1.0"), URL)
+            assert debouncer.flush_due() == 0
+
+        clock.now = 40 + 30
+        assert debouncer.flush_due() == 1
+        assert flushed == [(("C01", "1.0"), URL)]
+        assert debouncer.pending() == 0
+
+    def test_max_wait_flushes_busy_thread(self):
+        clock = FakeClock()
+        flushed = []
+        debouncer = Debouncer(lambda k, v: flushed.append(k), quiet=30, max_wait=60, clock=clock)
+
+        for t in range(0, 61, 10):
+            clock.now = t
+            debouncer.touch(("C01", "1.0"), URL)
+        assert debouncer.flush_due() == 1
+
+    def test_stop_flushes_pending(self):
+        flushed = []
+        debouncer = Debouncer(lambda k, v: flushed.append(k), quiet=30)
+        debouncer.touch(("C01", "1.0"), URL)
+        debouncer.stop()
+        assert flushed == [("C01", "1.0")]
+
+
+class TestEventReceiver:
+    def test_url_verification(self):
+        receiver = EventReceiver(ThreadStateStore(), Debouncer(lambda k, v: None))
+        assert receiver.handle({"type": "url_verification", "challenge": "abc"}) == {"challenge": "abc"}
+
+    def test_only_tracked_threads_are_debounced(self):
+        state = ThreadStateStore()
+        state.put("C01", "1705312200.123456", "1705312200.123456", _make_analysis(), slack_url=URL)
+        debouncer = Debouncer(lambda k, v: None)
+        receiver = EventReceiver(state, debouncer)
+
+        receiver.handle(_reply_event(thread_ts="9.0"))
+        assert debouncer.pending() == 0
+        receiver.handle(_reply_event())
+        assert debouncer.pending() == 1
+
+
+class TestServer:
+    def test_signed_burst_becomes_one_queued_job(self):
+        state = ThreadStateStore()
+        state.put("C01", "1705312200.123456", "1705312200.123456", _make_analysis(), slack_url=URL)
+        store = JobStore()
+        clock = FakeClock()
+        debouncer = Debouncer(enqueue_refresh(store.submit_batch), quiet=30, clock=clock)
+        server = make_server("127.0.0.1", 0, SECRET, EventReceiver(state, debouncer))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = f"http://127.0.0.1:{server.server_port}/slack/events"
+
+        def send(payload: dict, secret: str = SECRET) -> httpx.Response:
+            body = json.dumps(payload).encode()
+            ts = str(int(time.time()))
+            return httpx.post(endpoint, content=body, headers={
+                "X-Slack-Request-Timestamp": ts,
+                "X-Slack-Signature": sign_request(secret, ts, body),
+            })
+
+        try:
+            assert send(_reply_event(), secret="wrong").status_code == 401
+            for i in range(3):
+                assert send(_reply_event(ts=f"1705312300.00000{i}")).status_code == 200
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        clock.now = 30
+        assert debouncer.flush_due() == 1
+        job = store.claim()
+        assert job["kind"] == EVENT_JOB
+        assert job["payload"] == {"slack_url": URL}
+        assert store.claim() is None
@@ -0,0 +1,153 @@
+import time
+
+from src.jobs import (
+    COALESCED,
+    DONE,
+    FAILED,
+    PENDING,
+    PRIORITY_INTERACTIVE,
+    JobRunner,
+    JobStore,
+    batch_progress,
+)
+
+
+def _key(payload: dict) -> str:
+    return payload["thread"]
+
+
+class TestJobStore:
+    def test_submit_and_claim_in_order(self):
+        store = JobStore()
+        batch_id = store.submit_batch("refresh", [("A", {"n": 1}), ("B", {"n": 2})])
+
+        first = store.claim()
+        second = store.claim()
+        assert first["payload"] == {"n": 1}
+        assert second["payload"] == {"n": 2}
+        assert store.claim() is None
+        assert [j["batch_id"] for j in (first, second)] == [batch_id, batch_id]
+
+    def test_jobs_persist_across_store_instances(self):
+        batch_id = JobStore().submit_batch("refresh", [("A", {"n": 1})])
+
+        jobs = JobStore().batch(batch_id)
+        assert len(jobs) == 1
+        assert jobs[0]["status"] == PENDING
+
+    def test_requeue_running_jobs(self):
+        store = JobStore()
+        batch_id = store.submit_batch("refresh", [("A", {})])
+        store.claim()
+
+        assert store.requeue_running(lease=0) == 1
+        assert store.batch(batch_id)[0]["status"] == PENDING
+
+    def test_leased_jobs_of_live_runners_are_not_requeued(self):
+        store = JobStore()
+        store.submit_batch("refresh", [("A", {})])
+        store.submit_batch("event", [("B", {})])
+        store.claim(["refresh"], owner="ui")
+        store.claim(["event"], owner="events")
+
+        assert store.requeue_running() == 0
+        assert store.requeue_running(["refresh"], lease=0) == 1
+        store.heartbeat("events")
+        assert store.requeue_running(["event"], lease=60) == 0
+
+    def test_latest_batch_id(self):
+        store = JobStore()
+        store.submit_batch("refresh", [("A", {})])
+        latest = store.submit_batch("refresh", [("B", {})])
+        assert store.latest_batch_id("refresh") == latest
+        assert store.latest_batch_id("other") is None
+
+
+    def test_coalesces_pending_duplicates(self):
+        store = JobStore()
+        first = store.submit_batch("refresh", [("A", {"thread": "C1:1", "memo": "old"})], key=_key)
+        second = store.submit_batch("refresh", [("A", {"thread": "C1:1", "memo": "new"})], key=_key)
+
+        job = store.claim()
+        assert job["payload"]["memo"] == "new"
+        assert store.claim() is None
+        assert store.batch(second)[0]["coalesced_into"] == job["id"]
+
+        store.finish(job["id"], {"ok": True})
+        for batch_id in (first, second):
+            jobs = store.batch(batch_id)
+            assert (jobs[0]["status"], jobs[0]["result"]) == (DONE, {"ok": True})
+
+    def test_running_job_is_not_coalesced_or_run_twice(self):
+        store = JobStore()
+        store.submit_batch("refresh", [("A", {"thread": "C1:1"})], key=_key)
+        running = store.claim()
+        batch_id = store.submit_batch("refresh", [("A", {"thread": "C1:1"})], key=_key)
+
+        assert store.batch(batch_id)[0]["status"] == PENDING
+        assert store.claim() is None
+        store.finish(running["id"], {})
+        assert store.claim()["batch_id"] == batch_id
+
+    def test_interactive_jobs_run_first(self):
+        store = JobStore()
+        store.submit_batch("refresh", [("bulk", {"thread": "C1:1"}), ("bulk", {"thread": "C1:2"})], key=_key)
+        store.submit_batch("refresh", [("click", {"thread": "C1:3"})], priority=PRIORITY_INTERACTIVE, key=_key)
+
+        assert store.claim()["label"] == "click"
+
+    def test_coalescing_raises_priority(self):
+        store = JobStore()
+        store.submit_batch("refresh", [("A", {"thread": "C1:1"}), ("B", {"thread": "C1:2"})], key=_key)
+        batch_id = store.submit_batch(
+            "refresh", [("B", {"thread": "C1:2"})], priority=PRIORITY_INTERACTIVE, key=_key
+        )
+
+        assert store.claim()["label"] == "B"
+        assert store.batch(batch_id)[0]["status"] != COALESCED
+
+    def test_claim_only_handled_kinds(self):
+        store = JobStore()
+        store.submit_batch("other", [("A", {})])
+        assert store.claim(["refresh"]) is None
+        assert store.claim(["other"])["kind"] == "other"
+
+
+class TestJobRunner:
+    def test_run_one_records_result_and_error(self):
+        store = JobStore()
+
+        def handler(payload):
+            if payload["fail"]:
+                raise ValueError("boom")
+            return {"ok": True}
+
+        runner = JobRunner(store, {"refresh": handler})
+        batch_id = runner.submit_batch(
+            "refresh", [("A", {"fail": False}), ("B", {"fail": True})]
+        )
+        assert runner.run_one()
+        assert runner.run_one()
+        assert not runner.run_one()
+
+        jobs = store.batch(batch_id)
+        assert jobs[0]["status"] == DONE
+        assert jobs[0]["result"] == {"ok": True}
+        assert jobs[1]["status"] == FAILED
+        assert jobs[1]["error"] == "boom"
+        assert batch_progress(jobs) == {"total": 2, "done": 1, "failed": 1, "finished": 2}
+
+    def test_background_workers_drain_queue(self):
+        store = JobStore()
+        runner = JobRunner(store, {"refresh": lambda p: {"n": p["n"]}}, workers=3, poll_interval=0.01)
+        runner.start()
+        try:
+            batch_id = runner.submit_batch("refresh", [(str(i), {"n": i}) for i in range(10)])
+            deadline = time.monotonic() + 5
+            while batch_progress(store.batch(batch_id))["finished"] < 10:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        finally:
+            runner.stop(timeout=1)
+
+        assert sorted(j["result"]["n"] for j in store.batch(batch_id)) == list(range(10))
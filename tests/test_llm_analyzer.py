@@ -2,8 +2,21 @@ import json
 from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
 
-from src.llm_analyzer import TokenUsage, analyze_thread, format_thread_for_prompt
-from src.models import AnalysisResult, SlackMessage, SlackThread
+import pytest
+
+from src.llm_analyzer import (
+    INCREMENTAL_SYSTEM_PROMPT,
+    OMISSION_NOTE,
+    TokenUsage,
+    analyze_thread,
+    analyze_thread_incremental,
+    format_thread_for_prompt,
+    iter_prompt_lines,
+    new_messages_since,
+)
+from src.model_router import ModelRouter, RoutingRule
+from src.models import AnalysisResult, DiscussionStructure, SlackMessage, SlackThread
+from src.token_budget import BudgetExceeded, TokenBudget
 
 
 class TestFormatThreadForPrompt:
@@ -51,6 +64,28 @@ class TestFormatThreadForPrompt:
         result = format_thread_for_prompt(thread, memo="Important context here")
         assert "Important context here" in result
 
+    def test_marks_gaps_and_ends_with_memo(self):
+        messages = _thread_with_ts(["first", "latest"]).messages
+
+        lines = list(iter_prompt_lines("general", messages, memo="memo", gaps={1: 3}))
+
+        assert lines[3] == OMISSION_NOTE.format(3)
+        assert lines[4].endswith("latest")
+        assert lines[-1] == "Additional context from the user: memo"
+
+    def test_over_budget_thread_keeps_opening_and_latest_messages(self):
+        thread = _thread_with_ts([f"message {i} " + "x" * 400 for i in range(30)])
+        thread.omitted, thread.omitted_at = 5, 10
+
+        prompt = format_thread_for_prompt(thread, max_tokens=1000)
+
+        assert "message 0 " in prompt
+        assert "message 29 " in prompt
+        assert "message 15 " not in prompt
+        # the gap covers the messages dropped here plus those omitted at fetch time
+        kept = sum(f"message {i} " in prompt for i in range(30))
+        assert OMISSION_NOTE.format(30 - kept + 5) in prompt
+
 
 class TestAnalyzeThread:
     def _make_thread(self):
@@ -187,3 +222,170 @@ class TestAnalyzeThread:
         assert result.theme == "Recovered"
         assert mock_client.models.generate_content.call_count == 2
         assert usage.total_tokens == 600
+
+    @patch("src.llm_analyzer.genai.Client")
+    def test_reuses_given_client(self, mock_client_cls):
+        client = MagicMock()
+        client.models.generate_content.return_value = self._mock_response(
+            {
+                "theme": "Reused",
+                "structure": {
+                    "premises": [],
+                    "key_issues": [],
+                    "conclusions_or_current_state": [],
+                },
+                "next_decision_required": "Decide",
+                "suggested_next_action": "Alice by Friday",
+                "suggested_owner": "Alice",
+                "new_concepts": [],
+                "strategic_implications": [],
+                "risk_signals": [],
+            }
+        )
+
+        result, _ = analyze_thread(self._make_thread(), api_key="test-key", client=client)
+        assert result.theme == "Reused"
+        mock_client_cls.assert_not_called()
+
+
+def _thread_with_ts(texts: list[str]) -> SlackThread:
+    messages = [
+        SlackMessage(
+            user="Alice" if i % 2 == 0 else "Bob",
+            text=text,
+            timestamp=datetime(2026, 1, 15, 10, i, 0, tzinfo=timezone.utc),
+            ts=f"17053122{i:02d}.000100",
+        )
+        for i, text in enumerate(texts)
+    ]
+    return SlackThread(
+        channel_name="general",
+        channel_id="C01234ABC",
+        thread_ts=messages[0].ts,
+        url="https://workspace.slack.com/archives/C01234ABC/p1705312200000100",
+        messages=messages,
+        last_reply_at=messages[-1].timestamp,
+    )
+
+
+class TestIncrementalAnalysis:
+    def _previous(self) -> AnalysisResult:
+        return AnalysisResult(
+            theme="Previous Theme",
+            structure=DiscussionStructure(
+                premises=[], key_issues=["REST vs GraphQL"], conclusions_or_current_state=[]
+            ),
+            next_decision_required="Choose API style",
+            suggested_next_action="Alice decides by Friday",
+            suggested_owner="Alice",
+            new_concepts=[],
+            strategic_implications=[],
+            risk_signals=[],
+        )
+
+    def test_new_messages_since(self):
+        thread = _thread_with_ts(["a", "b", "c", "d"])
+        delta = new_messages_since(thread, thread.messages[1].ts)
+        assert [m.text for m in delta] == ["c", "d"]
+
+    @patch("src.llm_analyzer.genai.Client")
+    def test_sends_previous_state_and_only_new_messages(self, mock_client_cls):
+        mock_client = MagicMock()
+        mock_client_cls.return_value = mock_client
+        updated = self._previous().model_dump()
+        updated["theme"] = "Updated Theme"
+        response = MagicMock()
+        response.text = json.dumps(updated)
+        response.usage_metadata.prompt_token_count = 50
+        response.usage_metadata.candidates_token_count = 100
+        response.usage_metadata.total_token_count = 150
+        mock_client.models.generate_content.return_value = response
+
+        thread = _thread_with_ts(["old message one", "old message two", "GraphQL it is"])
+        result, usage = analyze_thread_incremental(
+            thread, "test-key", self._previous(), since_ts=thread.messages[1].ts
+        )
+        assert result.theme == "Updated Theme"
+        assert usage.total_tokens == 150
+
+        kwargs = mock_client.models.generate_content.call_args.kwargs
+        assert "GraphQL it is" in kwargs["contents"]
+        assert "old message" not in kwargs["contents"]
+        assert "Previous Theme" in kwargs["contents"]
+        assert kwargs["config"].system_instruction == INCREMENTAL_SYSTEM_PROMPT
+
+
+class TestModelRouting:
+    def _mock_client(self) -> MagicMock:
+        client = MagicMock()
+        response = MagicMock()
+        response.text = json.dumps(TestIncrementalAnalysis()._previous().model_dump())
+        response.usage_metadata.prompt_token_count = 1
+        response.usage_metadata.candidates_token_count = 1
+        response.usage_metadata.total_token_count = 2
+        client.models.generate_content.return_value = response
+        return client
+
+    def test_router_choice_is_used_and_recorded(self):
+        client = self._mock_client()
+        router = ModelRouter([RoutingRule("tiny", "light-model", {"max_messages": 3})])
+
+        _, usage = analyze_thread(_thread_with_ts(["hi", "ok"]), "key", client=client, router=router)
+
+        assert client.models.generate_content.call_args.kwargs["model"] == "light-model"
+        assert usage.model == "light-model"
+        assert usage.route_reason.startswith("tiny")
+
+    def test_thinking_model_gets_its_output_limits(self):
+        client = self._mock_client()
+
+        analyze_thread(_thread_with_ts(["hi"]), "key", model="gemini-2.5-pro", client=client)
+
+        config = client.models.generate_content.call_args.kwargs["config"]
+        assert config.max_output_tokens == 12288
+        assert config.thinking_config.thinking_budget == 4096
+
+    def test_explicit_model_skips_routing(self):
+        client = self._mock_client()
+
+        _, usage = analyze_thread(_thread_with_ts(["hi"]), "key", model="pinned", client=client)
+
+        assert client.models.generate_content.call_args.kwargs["model"] == "pinned"
+        assert usage.route_reason == "explicit"
+
+
+class TestBudgetPreflight:
+    def _thread(self) -> SlackThread:
+        return _thread_with_ts([f"message {i} " + "x" * 400 for i in range(30)])
+
+    def test_over_budget_thread_is_compacted(self):
+        client = TestModelRouting()._mock_client()
+        budget = TokenBudget(per_request=2_600)
+
+        _, usage = analyze_thread(self._thread(), "key", client=client, budget=budget)
+
+        contents = client.models.generate_content.call_args.kwargs["contents"]
+        assert "message 0 " in contents
+        assert "message 29 " in contents
+        assert "messages omitted here" in contents
+        assert "compacted" in usage.route_reason
+        assert budget.used_today() == usage.total_tokens
+
+    def test_rejected_thread_is_never_sent(self):
+        client = TestModelRouting()._mock_client()
+        budget = TokenBudget(per_request=2_600, overflow="reject")
+
+        with pytest.raises(BudgetExceeded):
+            analyze_thread(self._thread(), "key", client=client, budget=budget)
+        client.models.generate_content.assert_not_called()
+        assert budget.used_today() == 0
+
+    def test_failed_analysis_is_charged_for_billed_attempts(self):
+        client = TestModelRouting()._mock_client()
+        client.models.generate_content.return_value.text = "not json"
+        budget = TokenBudget(per_day=100_000)
+
+        with pytest.raises(json.JSONDecodeError):
+            analyze_thread(_thread_with_ts(["hi"]), "key", client=client, budget=budget)
+        assert client.models.generate_content.call_count == 2
+        assert budget.used_today() == 4
@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from src.model_router import (
+    DEFAULT_LIMITS,
+    DEFAULT_MODEL,
+    ModelRouter,
+    RoutingRule,
+    generation_limits,
+    thread_features,
+)
+from src.models import SlackMessage, SlackThread
+
+ENV_EXAMPLE = Path(__file__).resolve().parent.parent / ".env.example"
+
+
+def _example_router() -> ModelRouter:
+    """Router configured with the GEMINI_MODEL_ROUTES example in .env.example."""
+    for line in ENV_EXAMPLE.read_text(encoding="utf-8").splitlines():
+        key, _, value = line.lstrip("# ").partition("=")
+        if key == "GEMINI_MODEL_ROUTES":
+            return ModelRouter.from_config({"GEMINI_MODEL_ROUTES": value}.get)
+    raise AssertionError("no GEMINI_MODEL_ROUTES example")
+
+
+def _make_thread(texts: list[str], users: list[str] | None = None) -> SlackThread:
+    users = users or ["Alice"] * len(texts)
+    messages = [
+        SlackMessage(
+            user=user,
+            text=text,
+            timestamp=datetime(2026, 1, 15, 10, 0, 0, tzinfo=timezone.utc),
+        )
+        for user, text in zip(users, texts)
+    ]
+    return SlackThread(
+        channel_name="general",
+        channel_id="C01",
+        thread_ts="1.0",
+        url="https://workspace.slack.com/archives/C01/p1000000",
+        messages=messages,
+        last_reply_at=messages[-1].timestamp,
+    )
+
+
+class TestThreadFeatures:
+    def test_counts_size_participants_and_contention(self):
+        thread = _make_thread(
+            ["Let's use REST", "But GraphQL is simpler", "その案には懸念があります"],
+            users=["Alice", "Bob", "Alice"],
+        )
+        features = thread_features(thread)
+        assert features.messages == 3
+        assert features.participants == 2
+        assert features.contention == 2
+        assert features.chars == sum(len(m.text) for m in thread.messages)
+
+
+class TestModelRouter:
+    def test_no_routing_by_default(self):
+        for router in (ModelRouter(), ModelRouter.from_config({}.get)):
+            assert router.route(_make_thread(["x"] * 50)).model == DEFAULT_MODEL
+
+    def test_example_rules(self):
+        router = _example_router()
+        assert router.route(_make_thread(["Deploy done", "Thanks"])).model == "gemini-2.0-flash-lite"
+        assert router.route(_make_thread(["x"] * 50)).model == "gemini-2.5-pro"
+
+        medium = router.route(_make_thread(["ok"] * 10))
+        assert medium.model == DEFAULT_MODEL
+        assert medium.reason.startswith("default (messages=10")
+
+    def test_contentious_short_thread_is_not_routed_to_light_model(self):
+        route = _example_router().route(_make_thread(["Ship it", "However, I disagree"]))
+        assert route.model == DEFAULT_MODEL
+
+    def test_from_config(self):
+        config = {
+            "GEMINI_MODEL": "base",
+            "GEMINI_MODEL_ROUTES": '[{"name": "tiny", "model": "light", "max_messages": 1}]',
+        }
+        router = ModelRouter.from_config(lambda key: config.get(key, ""))
+        assert router.route(_make_thread(["a"])).model == "light"
+        assert router.route(_make_thread(["a", "b"])).model == "base"
+
+    def test_empty_routes_disable_routing(self):
+        router = ModelRouter.from_config({"GEMINI_MODEL_ROUTES": "[]"}.get)
+        assert router.route(_make_thread(["a"])).model == DEFAULT_MODEL
+
+    def test_rejects_unknown_bound(self):
+        with pytest.raises(ValueError):
+            RoutingRule.from_dict({"model": "m", "max_words": 3})
+
+
+class TestGenerationLimits:
+    def test_thinking_models_leave_room_for_the_answer(self):
+        pro = _example_router().route(_make_thread(["x"] * 50)).generation_limits
+        assert pro.thinking_budget is not None
+        assert pro.max_output_tokens - pro.thinking_budget >= DEFAULT_LIMITS.max_output_tokens
+        assert generation_limits("gemini-2.5-flash-lite").thinking_budget == 0
+        assert generation_limits("gemini-2.0-flash") == DEFAULT_LIMITS
+
+    def test_rule_overrides_limits(self):
+        rule = RoutingRule.from_dict(
+            {"model": "gemini-2.5-pro", "min_messages": 2, "max_output_tokens": 20000}
+        )
+        assert rule.bounds == {"min_messages": 2}
+        assert rule.limits.max_output_tokens == 20000
+        assert rule.limits.thinking_budget == generation_limits("gemini-2.5-pro").thinking_budget
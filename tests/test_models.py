@@ -20,6 +20,10 @@ class TestSlackMessage:
         assert msg.text == "Hello world"
         assert msg.timestamp == datetime(2026, 1, 15, 10, 30, 0)
 
+    def test_messages_are_slotted(self):
+        msg = SlackMessage(user="alice", text="Hi", timestamp=datetime(2026, 1, 15))
+        assert not hasattr(msg, "__dict__")
+
 
 class TestSlackThread:
     def test_create_thread(self):
@@ -0,0 +1,42 @@
+from src.mrkdwn import escape_mrkdwn, link_mrkdwn, mentioned_ids, normalize_mrkdwn
+
+USERS = {"U001": "Alice", "U002": "Bob"}
+CHANNELS = {"C001": "general"}
+
+
+class TestMentionedIds:
+    def test_collects_user_and_channel_ids(self):
+        text = "<@U001> and <@U002|bob> see <#C001> and <#C002|random> <@U001>"
+        assert mentioned_ids(text) == ({"U001", "U002"}, {"C001", "C002"})
+
+
+class TestNormalizeMrkdwn:
+    def test_mentions(self):
+        text = "<@U001> ask <@U999> in <#C001> or <#C002|random>"
+        assert normalize_mrkdwn(text, USERS, CHANNELS) == "@Alice ask @U999 in #general or #random"
+
+    def test_links(self):
+        text = "see <https://example.com/a?b=1|the spec> and <https://example.com> or <mailto:a@b.com|a@b.com>"
+        assert normalize_mrkdwn(text, USERS, CHANNELS) == (
+            "see the spec and https://example.com or a@b.com"
+        )
+
+    def test_special_mentions_and_dates(self):
+        text = "<!here> <!channel> <!subteam^S01|@backend> <!date^1700000000^{date}|Nov 14>"
+        assert normalize_mrkdwn(text, USERS, CHANNELS) == "@here @channel @backend Nov 14"
+
+    def test_unescapes_entities_after_markup(self):
+        assert normalize_mrkdwn("a &lt;b&gt; &amp;lt; <@U001>", USERS, CHANNELS) == "a <b> &lt; @Alice"
+
+    def test_plain_text_unchanged(self):
+        assert normalize_mrkdwn("日本語のテキスト", USERS, CHANNELS) == "日本語のテキスト"
+
+
+class TestEscapeMrkdwn:
+    def test_round_trips_through_normalize(self):
+        text = "a <b> & c"
+        assert escape_mrkdwn(text) == "a &lt;b&gt; &amp; c"
+        assert normalize_mrkdwn(escape_mrkdwn(text), USERS, CHANNELS) == text
+
+    def test_link_label_cannot_split_the_link(self):
+        assert link_mrkdwn("https://x", "a|b") == "<https://x|a｜b>"
@@ -3,8 +3,12 @@ from unittest.mock import patch, MagicMock
 from src.models import AnalysisResult, DiscussionStructure
 from src.notion_client import (
     HTTP_TIMEOUT,
+    RICH_TEXT_MAX_CHARS,
+    RICH_TEXT_MAX_SEGMENTS,
     build_notion_properties,
+    build_overflow_blocks,
     fetch_open_pages,
+    iter_open_pages,
     find_existing_page,
     save_to_notion,
 )
@@ -84,6 +88,52 @@ class TestBuildNotionProperties:
         )
         assert props["Memo"]["rich_text"] == []
 
+    def test_omits_aging_days_for_formula_aging(self):
+        props = build_notion_properties(
+            result=self._make_result(),
+            slack_url="https://slack.com/archives/C01/p123",
+            channel_name="general",
+            memo=None,
+            aging_formula=True,
+        )
+        assert "Aging Days" not in props
+        assert props["Last Managed At"]["date"]["start"]
+
+    def test_splits_long_rich_text_into_segments(self):
+        result = self._make_result()
+        result.structure.key_issues = ["issue " + "x" * 1500 for _ in range(4)]
+        props = build_notion_properties(
+            result=result,
+            slack_url="https://slack.com/archives/C01/p123",
+            channel_name="general",
+            memo=None,
+        )
+        segments = props["Key Issues"]["rich_text"]
+        assert len(segments) > 1
+        assert all(len(seg["text"]["content"]) <= RICH_TEXT_MAX_CHARS for seg in segments)
+        joined = "".join(seg["text"]["content"] for seg in segments)
+        assert joined == "\n".join(result.structure.key_issues)
+
+    def test_caps_rich_text_array_and_overflows_to_blocks(self):
+        memo = "m" * (RICH_TEXT_MAX_CHARS * (RICH_TEXT_MAX_SEGMENTS + 3))
+        props = build_notion_properties(
+            result=self._make_result(),
+            slack_url="https://slack.com/archives/C01/p123",
+            channel_name="general",
+            memo=memo,
+        )
+        assert len(props["Memo"]["rich_text"]) == RICH_TEXT_MAX_SEGMENTS
+
+        blocks = build_overflow_blocks(self._make_result(), memo)
+        assert blocks[0]["type"] == "heading_3"
+        overflow = "".join(
+            seg["text"]["content"] for seg in blocks[1]["paragraph"]["rich_text"]
+        )
+        assert len(overflow) == RICH_TEXT_MAX_CHARS * 3
+
+    def test_no_overflow_blocks_for_short_text(self):
+        assert build_overflow_blocks(self._make_result(), "short memo") == []
+
 
 class TestFindExistingPage:
     @patch("src.notion_client.httpx.post")
@@ -147,9 +197,11 @@ class TestSaveToNotion:
         assert mock_post.call_count == 2
         assert "newpageid" in url
 
+    @patch("src.notion_client.httpx.get")
     @patch("src.notion_client.httpx.patch")
     @patch("src.notion_client.httpx.post")
-    def test_updates_existing_page(self, mock_post, mock_patch):
+    def test_updates_existing_page(self, mock_post, mock_patch, mock_get):
+        mock_get.return_value.json.return_value = {"results": [], "has_more": False}
         # find_existing_page returns a result
         query_resp = MagicMock()
         query_resp.json.return_value = {"results": [{"id": "existing-id"}]}
@@ -168,6 +220,97 @@ class TestSaveToNotion:
         mock_patch.assert_called_once()
         assert mock_post.call_count == 1  # only query, no create
 
+    @patch("src.notion_client.httpx.post")
+    def test_creates_page_with_overflow_children_in_one_call(self, mock_post):
+        query_resp = MagicMock()
+        query_resp.json.return_value = {"results": []}
+        query_resp.raise_for_status = MagicMock()
+        create_resp = MagicMock()
+        create_resp.json.return_value = {"id": "new-page-id"}
+        create_resp.raise_for_status = MagicMock()
+        mock_post.side_effect = [query_resp, create_resp]
+
+        memo = "m" * (RICH_TEXT_MAX_CHARS * (RICH_TEXT_MAX_SEGMENTS + 1))
+        save_to_notion(
+            "test-token", "db-id", self._make_result(),
+            "https://slack.com/test", "general", memo,
+        )
+        assert mock_post.call_count == 2
+        create_json = mock_post.call_args.kwargs["json"]
+        assert [b["type"] for b in create_json["children"]] == ["heading_3", "paragraph"]
+
+    @patch("src.notion_client.httpx.get")
+    @patch("src.notion_client.httpx.patch")
+    @patch("src.notion_client.httpx.post")
+    def test_appends_overflow_children_in_one_batch(self, mock_post, mock_patch, mock_get):
+        mock_get.return_value.json.return_value = {"results": [], "has_more": False}
+        query_resp = MagicMock()
+        query_resp.json.return_value = {"results": [{"id": "existing-id"}]}
+        query_resp.raise_for_status = MagicMock()
+        mock_post.return_value = query_resp
+        update_resp = MagicMock()
+        update_resp.raise_for_status = MagicMock()
+        mock_patch.return_value = update_resp
+
+        result = self._make_result()
+        result.risk_signals = ["r" * RICH_TEXT_MAX_CHARS] * (RICH_TEXT_MAX_SEGMENTS + 2)
+        memo = "m" * (RICH_TEXT_MAX_CHARS * (RICH_TEXT_MAX_SEGMENTS + 1))
+        save_to_notion(
+            "test-token", "db-id", result,
+            "https://slack.com/test", "general", memo,
+        )
+        assert mock_patch.call_count == 2  # properties + one children append
+        children_call = mock_patch.call_args_list[1]
+        assert children_call.args[0].endswith("/blocks/existing-id/children")
+        assert len(children_call.kwargs["json"]["children"]) == 4
+
+    @patch("src.notion_client.httpx.delete")
+    @patch("src.notion_client.httpx.get")
+    @patch("src.notion_client.httpx.patch")
+    @patch("src.notion_client.httpx.post")
+    def test_replaces_previous_overflow_children(
+        self, mock_post, mock_patch, mock_get, mock_delete
+    ):
+        mock_post.return_value.json.return_value = {"results": [{"id": "existing-id"}]}
+
+        def heading(block_id, text):
+            rich_text = [{"text": {"content": text}}]
+            return {"id": block_id, "type": "heading_3", "heading_3": {"rich_text": rich_text}}
+
+        mock_get.return_value.json.return_value = {
+            "results": [
+                {"id": "user-note", "type": "paragraph", "paragraph": {"rich_text": []}},
+                heading("h1", "Memo (続き)"),
+                {"id": "p1", "type": "paragraph", "paragraph": {"rich_text": []}},
+                heading("h2", "Notes"),
+                {"id": "p2", "type": "paragraph", "paragraph": {"rich_text": []}},
+            ],
+            "has_more": False,
+        }
+
+        memo = "m" * (RICH_TEXT_MAX_CHARS * (RICH_TEXT_MAX_SEGMENTS + 1))
+        save_to_notion(
+            "test-token", "db-id", self._make_result(),
+            "https://slack.com/test", "general", memo,
+        )
+        deleted = [c.args[0].rsplit("/", 1)[1] for c in mock_delete.call_args_list]
+        assert deleted == ["h1", "p1"]
+        assert mock_patch.call_args.args[0].endswith("/blocks/existing-id/children")
+
+    @patch("src.notion_client.httpx.get")
+    @patch("src.notion_client.httpx.patch")
+    @patch("src.notion_client.httpx.post")
+    def test_page_saved_without_overflow_is_not_listed(self, mock_post, mock_patch, mock_get):
+        mock_post.return_value.json.return_value = {"results": [{"id": "existing-id"}]}
+
+        save_to_notion(
+            "test-token", "db-id", self._make_result(),
+            "https://slack.com/test", "general", None, overflow=False,
+        )
+
+        mock_get.assert_not_called()
+        mock_patch.assert_called_once()
+
 
 class TestFetchOpenPages:
     @patch("src.notion_client.httpx.post")
@@ -244,3 +387,53 @@ class TestFetchOpenPages:
 
         pages = fetch_open_pages("test-token", "db-id")
         assert pages == []
+
+    @patch("src.notion_client.httpx.post")
+    def test_reads_formula_aging_days(self, mock_post):
+        mock_resp = MagicMock()
+        mock_resp.json.return_value = {
+            "results": [
+                {
+                    "id": "page-1",
+                    "properties": {
+                        "Title": {"title": [{"text": {"content": "議論A"}}]},
+                        "Slack URL": {"url": "https://slack.com/archives/C01/p111"},
+                        "Aging Days": {"type": "formula", "formula": {"type": "number", "number": 9}},
+                        "Status": {"select": {"name": "Open"}},
+                    },
+                },
+            ]
+        }
+        mock_resp.raise_for_status = MagicMock()
+        mock_post.return_value = mock_resp
+
+        pages = fetch_open_pages("test-token", "db-id")
+        assert pages[0]["aging_days"] == 9
+
+    @patch("src.notion_client.httpx.post")
+    def test_follows_pagination(self, mock_post):
+        def query_resp(page_id, has_more, next_cursor):
+            resp = MagicMock()
+            resp.json.return_value = {
+                "results": [
+                    {
+                        "id": page_id,
+                        "properties": {
+                            "Title": {"title": [{"text": {"content": page_id}}]},
+                            "Slack URL": {"url": f"https://slack.com/{page_id}"},
+                            "Status": {"select": {"name": "Open"}},
+                        },
+                    }
+                ],
+                "has_more": has_more,
+                "next_cursor": next_cursor,
+            }
+            resp.raise_for_status = MagicMock()
+            return resp
+
+        mock_post.side_effect = [query_resp("p1", True, "c1"), query_resp("p2", False, None)]
+
+        pages = list(iter_open_pages("test-token", "db-id"))
+        assert [p["page_id"] for p in pages] == ["p1", "p2"]
+        assert mock_post.call_args.kwargs["json"]["start_cursor"] == "c1"
+        assert mock_post.call_args.kwargs["timeout"] == HTTP_TIMEOUT
@@ -0,0 +1,282 @@
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from src.aging import run_aging_update
+from src.checkpoint import Checkpoint
+from src.models import AnalysisResult, DiscussionStructure
+from src.notion_client import fetch_open_pages, find_page_summary, save_to_notion
+from src.notion_mirror import NotionMirror
+from src.notion_schema import cache_schema
+
+SCHEMA = {
+    "Title": {"id": "title", "type": "title"},
+    "Slack URL": {"id": "url1", "type": "url"},
+    "Status": {"id": "st1", "type": "select"},
+    "Last Managed At": {"id": "lma1", "type": "date"},
+    "Aging Days": {"id": "age1", "type": "number"},
+    "Premises": {"id": "pre1", "type": "rich_text"},
+}
+
+
+def _make_page(
+    page_id,
+    status="Open",
+    last_managed="2026-02-01",
+    edited="2026-02-01T10:00:00.000Z",
+    slack_url=None,
+    aging=None,
+):
+    return {
+        "id": page_id,
+        "last_edited_time": edited,
+        "properties": {
+            "Title": {"title": [{"text": {"content": f"Theme {page_id}"}}]},
+            "Slack URL": {"url": slack_url or f"https://slack/{page_id}"},
+            "Status": {"select": {"name": status}},
+            "Last Managed At": {"date": {"start": last_managed}},
+            "Aging Days": aging or {"number": 0},
+            "Premises": {"rich_text": [{"text": {"content": "not mirrored"}}]},
+        },
+    }
+
+
+def _query_resp(pages, has_more=False, next_cursor=None):
+    resp = MagicMock()
+    resp.json.return_value = {"results": pages, "has_more": has_more, "next_cursor": next_cursor}
+    return resp
+
+
+def _make_result() -> AnalysisResult:
+    return AnalysisResult(
+        theme="Theme",
+        structure=DiscussionStructure(premises=[], key_issues=[], conclusions_or_current_state=[]),
+        next_decision_required="Decide",
+        suggested_next_action="Act",
+        suggested_owner="Alice",
+        new_concepts=[],
+        strategic_implications=[],
+        risk_signals=[],
+    )
+
+
+def _mirror() -> NotionMirror:
+    cache_schema("db-id", SCHEMA)
+    return NotionMirror("db-id")
+
+
+class TestSync:
+    @patch("src.notion_mirror.httpx.post")
+    def test_first_sync_is_full_and_projected(self, mock_post):
+        mock_post.side_effect = [
+            _query_resp([_make_page("p1")], has_more=True, next_cursor="c2"),
+            _query_resp([_make_page("p2", edited="2026-02-02T10:00:00.000Z")]),
+        ]
+        mirror = _mirror()
+
+        assert mirror.sync("token") == {"fetched": 2, "full": True, "skipped": False}
+
+        first = mock_post.call_args_list[0]
+        assert "filter" not in first.kwargs["json"]
+        assert first.kwargs["json"]["sorts"] == [
+            {"timestamp": "last_edited_time", "direction": "ascending"}
+        ]
+        assert ("filter_properties", "url1") in first.kwargs["params"]
+        assert ("filter_properties", "pre1") not in first.kwargs["params"]
+        assert mock_post.call_args_list[1].kwargs["json"]["start_cursor"] == "c2"
+        assert "Premises" not in mirror.page_for_url("https://slack/p1")["properties"]
+
+    @patch("src.notion_mirror.httpx.post")
+    def test_later_syncs_fetch_only_edited_pages(self, mock_post):
+        mock_post.side_effect = [
+            _query_resp([_make_page("p1", edited="2026-02-02T10:00:00.000Z")]),
+            _query_resp([_make_page("p1", status="Done", edited="2026-02-03T09:00:00.000Z")]),
+        ]
+        mirror = _mirror()
+        mirror.sync("token")
+
+        assert mirror.sync("token")["full"] is False
+        assert mock_post.call_args.kwargs["json"]["filter"] == {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {"on_or_after": "2026-02-02T10:00:00.000Z"},
+        }
+        assert mirror.active_pages() == []
+
+    @patch("src.notion_mirror.httpx.post")
+    def test_full_sync_drops_removed_pages(self, mock_post):
+        mock_post.side_effect = [
+            _query_resp([_make_page("p1"), _make_page("p2")]),
+            _query_resp([_make_page("p2")]),
+        ]
+        mirror = _mirror()
+        mirror.sync("token")
+        mirror.sync("token", full=True)
+
+        assert [p["id"] for p in mirror.active_pages()] == ["p2"]
+
+    @patch("src.notion_mirror.httpx.post")
+    def test_recent_sync_is_skipped(self, mock_post):
+        mock_post.return_value = _query_resp([])
+        mirror = _mirror()
+        mirror.sync("token")
+
+        assert mirror.sync("token", max_age=60)["skipped"] is True
+        assert mock_post.call_count == 1
+
+
+class TestMirrorReads:
+    def test_recomputes_formula_aging(self):
+        mirror = NotionMirror("db-id")
+        formula = {"type": "formula", "formula": {"number": 0}}
+        mirror.upsert_page(_make_page("p1", last_managed="2026-02-01", aging=formula))
+
+        page = mirror.active_pages(today=date(2026, 2, 11))[0]
+        assert page["properties"]["Aging Days"]["formula"]["number"] == 10
+
+    def test_candidate_queries(self):
+        mirror = NotionMirror("db-id")
+        mirror.upsert_page(_make_page("stale", last_managed="2026-02-01"))
+        mirror.upsert_page(_make_page("today", last_managed="2026-02-11"))
+        mirror.upsert_page(_make_page("waiting", status="Waiting", last_managed="2026-02-01"))
+        mirror.upsert_page(_make_page("done", status="Done", last_managed="2026-02-01"))
+        today = date(2026, 2, 11)
+
+        assert {p["id"] for p in mirror.aging_update_pages(today)} == {"stale", "waiting"}
+        assert [p["id"] for p in mirror.reminder_pages(today, 7)] == ["stale"]
+
+    def test_archived_page_is_removed(self):
+        mirror = NotionMirror("db-id")
+        mirror.upsert_page(_make_page("p1"))
+        mirror.upsert_page({**_make_page("p1"), "archived": True})
+
+        assert mirror.page_for_url("https://slack/p1") is None
+
+
+class TestMirroredNotionClient:
+    @patch("src.notion_mirror.httpx.post")
+    @patch("src.notion_client.httpx.post")
+    def test_open_pages_and_lookup_are_local(self, mock_client_post, mock_mirror_post):
+        mock_mirror_post.return_value = _query_resp(
+            [_make_page("p1"), _make_page("p2", status="Done")]
+        )
+        mirror = _mirror()
+
+        pages = fetch_open_pages("token", "db-id", mirror)
+        summary = find_page_summary("token", "db-id", "https://slack/p2", mirror=mirror)
+
+        assert [p["page_id"] for p in pages] == ["p1"]
+        assert summary["status"] == "Done"
+        assert mock_mirror_post.call_count == 1
+        mock_client_post.assert_not_called()
+
+    @patch("src.notion_client.httpx.get")
+    @patch("src.notion_client.httpx.patch")
+    @patch("src.notion_client.httpx.post")
+    def test_save_writes_through(self, mock_post, mock_patch, mock_get):
+        mock_get.return_value.json.return_value = {"results": [], "has_more": False}
+        mirror = NotionMirror("db-id")
+        mirror.upsert_page(_make_page("p1"))
+        mock_patch.return_value.json.return_value = _make_page(
+            "p1", status="Waiting", edited="2026-02-05T00:00:00.000Z"
+        )
+        result = _make_result()
+
+        url = save_to_notion(
+            "token", "db-id", result, "https://slack/p1", "general", None, "Waiting", mirror=mirror
+        )
+
+        assert url == "https://notion.so/p1"
+        mock_post.assert_not_called()
+        assert mirror.page_for_url("https://slack/p1")["properties"]["Status"] == {
+            "select": {"name": "Waiting"}
+        }
+
+    @patch("src.notion_client.httpx.patch")
+    @patch("src.notion_client.httpx.post")
+    def test_save_recreates_page_archived_since_sync(self, mock_post, mock_patch):
+        mirror = NotionMirror("db-id")
+        mirror.upsert_page(_make_page("p1"))
+        mock_patch.return_value.status_code = 400
+        mock_patch.return_value.json.return_value = {
+            "object": "error",
+            "message": "Can't edit block that is archived.",
+        }
+        created = MagicMock()
+        created.json.return_value = _make_page("p2", slack_url="https://slack/p1")
+        mock_post.side_effect = [_query_resp([]), created]
+
+        url = save_to_notion(
+            "token", "db-id", _make_result(), "https://slack/p1", "general", None, mirror=mirror
+        )
+
+        assert url == "https://notion.so/p2"
+        mock_patch.assert_called_once()
+        assert mock_post.call_args_list[1].args[0].endswith("/pages")
+        assert mirror.page_for_url("https://slack/p1")["id"] == "p2"
+
+
+class TestMirroredAging:
+    @patch("src.aging.httpx.patch")
+    @patch("src.aging.httpx.post")
+    @patch("src.notion_mirror.httpx.post")
+    def test_candidates_come_from_mirror(self, mock_mirror_post, mock_aging_post, mock_patch):
+        mock_mirror_post.return_value = _query_resp(
+            [
+                _make_page("stale", last_managed="2026-02-01"),
+                _make_page("fresh", last_managed="2026-02-11"),
+            ]
+        )
+        mock_patch.return_value.json.return_value = _make_page(
+            "stale", last_managed="2026-02-01", aging={"number": 10}
+        )
+        mirror = _mirror()
+
+        result = run_aging_update("token", "db-id", today=date(2026, 2, 11), mirror=mirror)
+
+        assert result["updated"] == 1
+        assert [r["page_id"] for r in result["reminders"]] == ["stale"]
+        mock_aging_post.assert_not_called()
+        assert mirror.page_for_url("https://slack/stale")["properties"]["Aging Days"] == {
+            "number": 10
+        }
+
+    @patch("src.aging.httpx.patch")
+    @patch("src.notion_mirror.httpx.post")
+    def test_archived_page_is_dropped_and_skipped(self, mock_mirror_post, mock_patch):
+        mock_mirror_post.return_value = _query_resp(
+            [
+                _make_page("gone", last_managed="2026-02-01"),
+                _make_page("stale", last_managed="2026-02-02"),
+            ]
+        )
+        archived = MagicMock(status_code=400)
+        archived.json.return_value = {"message": "Can't edit block that is archived."}
+        updated = MagicMock(status_code=200)
+        updated.json.return_value = _make_page(
+            "stale", last_managed="2026-02-02", aging={"number": 9}
+        )
+        mock_patch.side_effect = lambda url, **kwargs: archived if "gone" in url else updated
+        mirror = _mirror()
+
+        result = run_aging_update("token", "db-id", today=date(2026, 2, 11), mirror=mirror)
+
+        assert result["updated"] == 1
+        assert [r["page_id"] for r in result["reminders"]] == ["stale"]
+        assert mirror.page_for_url("https://slack/gone") is None
+
+    @patch("src.aging.httpx.patch")
+    @patch("src.notion_mirror.httpx.post")
+    def test_resume_uses_done_set_not_cursor(self, mock_mirror_post, mock_patch):
+        mock_mirror_post.return_value = _query_resp(
+            [_make_page("first", last_managed="2026-02-01"), _make_page("second")]
+        )
+        mock_patch.return_value.json.return_value = _make_page("second", aging={"number": 10})
+        checkpoint = Checkpoint("aging", scope="2026-02-11")
+        checkpoint.mark_done("first")
+
+        run_aging_update(
+            "token", "db-id", today=date(2026, 2, 11), checkpoint=checkpoint, mirror=_mirror()
+        )
+
+        assert [c.args[0].rsplit("/", 1)[1] for c in mock_patch.call_args_list] == ["second"]
+        assert checkpoint.cursor is None
+        assert checkpoint.done == {"first", "second"}
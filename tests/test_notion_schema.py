@@ -0,0 +1,100 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.notion_schema import (
+    EXPECTED_PROPERTIES,
+    HTTP_TIMEOUT,
+    SchemaError,
+    ensure_schema,
+    fetch_database_schema,
+    validate_schema,
+)
+
+
+def _full_schema(**overrides) -> dict:
+    props = {
+        name: {"id": f"id-{i}", "type": prop_type}
+        for i, (name, prop_type) in enumerate(EXPECTED_PROPERTIES.items())
+    }
+    props.update(overrides)
+    return {k: v for k, v in props.items() if v is not None}
+
+
+def _schema_resp(properties: dict):
+    resp = MagicMock()
+    resp.json.return_value = {"properties": properties}
+    resp.raise_for_status = MagicMock()
+    return resp
+
+
+class TestValidateSchema:
+    def test_accepts_full_schema(self):
+        assert validate_schema(_full_schema()) == []
+
+    def test_accepts_formula_aging_days(self):
+        schema = _full_schema(**{"Aging Days": {"id": "a", "type": "formula"}})
+        assert validate_schema(schema) == []
+
+    def test_reports_missing_property(self):
+        problems = validate_schema(_full_schema(Memo=None))
+        assert problems == ["missing property 'Memo' (rich_text)"]
+
+    def test_reports_wrong_type(self):
+        schema = _full_schema(Channel={"id": "c", "type": "rich_text"})
+        assert validate_schema(schema) == [
+            "property 'Channel' is rich_text, expected select"
+        ]
+
+
+class TestFetchDatabaseSchema:
+    @patch("src.notion_schema.httpx.get")
+    def test_caches_schema_per_database(self, mock_get):
+        mock_get.return_value = _schema_resp(_full_schema())
+
+        first = fetch_database_schema("test-token", "db-id")
+        second = fetch_database_schema("test-token", "db-id")
+        assert first is second
+        mock_get.assert_called_once()
+        assert mock_get.call_args.kwargs["timeout"] == HTTP_TIMEOUT
+
+    @patch("src.notion_schema.httpx.get")
+    def test_refresh_bypasses_cache(self, mock_get):
+        mock_get.return_value = _schema_resp(_full_schema())
+
+        fetch_database_schema("test-token", "db-id")
+        fetch_database_schema("test-token", "db-id", refresh=True)
+        assert mock_get.call_count == 2
+
+
+class TestEnsureSchema:
+    @patch("src.notion_schema.httpx.get")
+    def test_raises_schema_error(self, mock_get):
+        mock_get.return_value = _schema_resp(_full_schema(Participants=None))
+
+        with pytest.raises(SchemaError) as exc_info:
+            ensure_schema("test-token", "db-id")
+        assert exc_info.value.problems == ["missing property 'Participants' (rich_text)"]
+
+    @patch("src.notion_schema.httpx.patch")
+    @patch("src.notion_schema.httpx.get")
+    def test_provisions_missing_properties(self, mock_get, mock_patch):
+        mock_get.return_value = _schema_resp(_full_schema(Status=None, Memo=None))
+        mock_patch.return_value = _schema_resp(_full_schema())
+
+        properties = ensure_schema("test-token", "db-id", provision=True)
+        assert validate_schema(properties) == []
+        mock_patch.assert_called_once()
+        created = mock_patch.call_args.kwargs["json"]["properties"]
+        assert set(created) == {"Status", "Memo"}
+        assert created["Memo"] == {"rich_text": {}}
+        status_options = [o["name"] for o in created["Status"]["select"]["options"]]
+        assert status_options == ["Open", "Waiting", "Done", "Archived"]
+
+    @patch("src.notion_schema.httpx.patch")
+    @patch("src.notion_schema.httpx.get")
+    def test_does_not_provision_valid_schema(self, mock_get, mock_patch):
+        mock_get.return_value = _schema_resp(_full_schema())
+
+        ensure_schema("test-token", "db-id", provision=True)
+        mock_patch.assert_not_called()
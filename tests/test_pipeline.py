@@ -0,0 +1,368 @@
+import threading
+import time
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+from src.llm_analyzer import TokenUsage
+from src.models import AnalysisResult, DiscussionStructure, SlackMessage, SlackThread
+from src.pipeline import (
+    StageLimits,
+    analyze_with_state,
+    refresh_saved_thread,
+    refresh_thread,
+    refresh_threads,
+)
+from src.slack_client import fetch_slack_thread
+from src.thread_state import ThreadStateStore
+
+URL = "https://workspace.slack.com/archives/C01234ABC/p1705312200123456"
+
+
+def _make_thread() -> SlackThread:
+    return SlackThread(
+        channel_name="general",
+        channel_id="C01234ABC",
+        thread_ts="1705312200.123456",
+        url=URL,
+        messages=[
+            SlackMessage(
+                user="Alice",
+                text="hello",
+                timestamp=datetime(2026, 2, 13, 10, 0, 0, tzinfo=timezone.utc),
+            ),
+        ],
+        last_reply_at=datetime(2026, 2, 13, 10, 0, 0, tzinfo=timezone.utc),
+    )
+
+
+def _make_analysis() -> AnalysisResult:
+    return AnalysisResult(
+        theme="Test Theme",
+        structure=DiscussionStructure(
+            premises=["p1"],
+            key_issues=["k1"],
+            conclusions_or_current_state=["c1"],
+        ),
+        next_decision_required="Decide X",
+        suggested_next_action="Alice does Y by Friday",
+        suggested_owner="Alice",
+        new_concepts=["concept"],
+        strategic_implications=["implication"],
+        risk_signals=["risk"],
+    )
+
+
+class TestRefreshThread:
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_runs_fetch_analyze_save(self, mock_fetch, mock_analyze, mock_save):
+        mock_fetch.return_value = _make_thread()
+        mock_analyze.return_value = (
+            _make_analysis(),
+            TokenUsage(
+                prompt_tokens=10, completion_tokens=20, total_tokens=30,
+                model="gemini-2.0-flash-lite", route_reason="short",
+            ),
+        )
+        mock_save.return_value = "https://notion.so/page"
+
+        result = refresh_thread(
+            MagicMock(), "gemini-key", "notion-token", "db-id", URL,
+            memo="memo", status="Waiting",
+        )
+        assert result == {
+            "theme": "Test Theme",
+            "page_url": "https://notion.so/page",
+            "total_tokens": 30,
+            "model": "gemini-2.0-flash-lite",
+            "skipped": False,
+        }
+        assert mock_fetch.call_args.args[1:] == ("C01234ABC", "1705312200.123456", URL)
+        assert mock_save.call_args.args[5:] == ("memo", "Waiting")
+
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_records_saved_analysis_in_indexes(self, mock_fetch, mock_analyze, mock_save):
+        thread = _make_thread()
+        mock_fetch.return_value = thread
+        mock_analyze.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        mock_save.return_value = "https://notion.so/page"
+        indexes = [MagicMock(), MagicMock()]
+
+        refresh_thread(MagicMock(), "k", "t", "db", URL, indexes=indexes)
+
+        for index in indexes:
+            index.record.assert_called_once_with(thread, _make_analysis(), "https://notion.so/page")
+
+
+class TestRefreshSavedThread:
+    @patch("src.pipeline.refresh_thread")
+    @patch("src.pipeline.find_page_summary")
+    def test_uses_memo_and_status_from_page(self, mock_find, mock_refresh):
+        mock_find.return_value = {"status": "Waiting", "memo": "memo", "slack_url": URL}
+        mock_refresh.return_value = {"skipped": False}
+
+        refresh_saved_thread(MagicMock(), "gemini-key", "notion-token", "db-id", URL)
+
+        kwargs = mock_refresh.call_args.kwargs
+        assert (kwargs["memo"], kwargs["status"], kwargs["saved_url"]) == ("memo", "Waiting", URL)
+
+    @patch("src.pipeline.refresh_thread")
+    @patch("src.pipeline.find_page_summary")
+    def test_skips_closed_or_missing_pages(self, mock_find, mock_refresh):
+        for page in (None, {"status": "Done", "memo": None, "slack_url": URL}):
+            mock_find.return_value = page
+            result = refresh_saved_thread(
+                MagicMock(), "gemini-key", "notion-token", "db-id", URL
+            )
+            assert result["skipped"] is True
+        mock_refresh.assert_not_called()
+
+
+class TestStageLimits:
+    def test_reads_config(self):
+        config = {"REFRESH_SLACK_CONCURRENCY": "8", "REFRESH_LLM_CONCURRENCY": "1"}
+        limits = StageLimits.from_config(lambda key: config.get(key, ""))
+        assert limits == StageLimits(slack=8, llm=1, notion=3)
+        assert limits.workers == 12
+
+
+class TestRefreshThreads:
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_yields_results_and_errors(self, mock_fetch, mock_analyze, mock_save):
+        def fetch(client, channel_id, thread_ts, url):
+            if url.endswith("999999"):
+                raise RuntimeError("thread_not_found")
+            return _make_thread()
+
+        mock_fetch.side_effect = fetch
+        mock_analyze.return_value = (
+            _make_analysis(),
+            TokenUsage(prompt_tokens=10, completion_tokens=20, total_tokens=30),
+        )
+        mock_save.return_value = "https://notion.so/page"
+
+        pages = [
+            {"slack_url": URL, "status": "Open"},
+            {"slack_url": "https://w.slack.com/archives/C01/p1705312200999999"},
+        ]
+        results = list(
+            refresh_threads(pages, MagicMock(), "gemini-key", "notion-token", "db-id")
+        )
+        assert len(results) == 2
+        errors = [error for _, _, error in results if error]
+        assert errors == ["thread_not_found"]
+
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_saves_under_the_page_url(self, mock_fetch, mock_analyze, mock_save):
+        reply_link = URL.replace("p1705312200123456", "p1705312299000000")
+        reply_link += "?thread_ts=1705312200.123456&cid=C01234ABC"
+        mock_fetch.return_value = _make_thread()
+        mock_analyze.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        mock_save.return_value = "https://notion.so/page"
+
+        pages = [{"slack_url": reply_link, "status": "Open"}]
+        list(refresh_threads(pages, MagicMock(), "gemini-key", "notion-token", "db-id"))
+
+        assert mock_save.call_args.args[3] == reply_link
+
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_respects_llm_concurrency(self, mock_fetch, mock_analyze, mock_save):
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def analyze(*args, **kwargs):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+            return _make_analysis(), TokenUsage(1, 1, 2)
+
+        mock_fetch.return_value = _make_thread()
+        mock_analyze.side_effect = analyze
+        mock_save.return_value = "https://notion.so/page"
+
+        pages = [{"slack_url": URL} for _ in range(8)]
+        limits = StageLimits(slack=8, llm=2, notion=8)
+        results = list(
+            refresh_threads(pages, MagicMock(), "k", "t", "db", limits=limits)
+        )
+        assert len(results) == 8
+        assert peak <= 2
+
+
+def _thread_with_replies(count: int) -> SlackThread:
+    messages = [
+        SlackMessage(
+            user="Alice",
+            text=f"message {i}",
+            timestamp=datetime(2026, 2, 13, 10, i, 0, tzinfo=timezone.utc),
+            ts=f"1705312200.{i:06d}",
+        )
+        for i in range(count)
+    ]
+    return SlackThread(
+        channel_name="general",
+        channel_id="C01234ABC",
+        thread_ts="1705312200.000000",
+        url=URL,
+        messages=messages,
+        last_reply_at=messages[-1].timestamp,
+    )
+
+
+class TestAnalyzeWithState:
+    @patch("src.pipeline.analyze_thread_incremental")
+    @patch("src.pipeline.analyze_thread")
+    def test_full_analysis_without_previous_state(self, mock_full, mock_incremental):
+        mock_full.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+
+        analyze_with_state(_thread_with_replies(5), "key", state=ThreadStateStore())
+        mock_full.assert_called_once()
+        mock_incremental.assert_not_called()
+
+    @patch("src.pipeline.analyze_thread_incremental")
+    @patch("src.pipeline.analyze_thread")
+    def test_incremental_when_few_new_replies(self, mock_full, mock_incremental):
+        mock_incremental.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        state = ThreadStateStore()
+        state.put("C01234ABC", "1705312200.000000", "1705312200.000007", _make_analysis())
+
+        analyze_with_state(_thread_with_replies(10), "key", state=state)
+        mock_full.assert_not_called()
+        assert mock_incremental.call_args.args[3] == "1705312200.000007"
+
+    @patch("src.pipeline.analyze_thread_incremental")
+    @patch("src.pipeline.analyze_thread")
+    def test_full_analysis_when_most_replies_are_new(self, mock_full, mock_incremental):
+        mock_full.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        state = ThreadStateStore()
+        state.put("C01234ABC", "1705312200.000000", "1705312200.000001", _make_analysis())
+
+        analyze_with_state(_thread_with_replies(10), "key", state=state)
+        mock_full.assert_called_once()
+        mock_incremental.assert_not_called()
+
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_refresh_records_state(self, mock_fetch, mock_analyze, mock_save):
+        mock_fetch.return_value = _thread_with_replies(3)
+        mock_analyze.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        mock_save.return_value = "https://notion.so/page"
+        state = ThreadStateStore()
+
+        refresh_thread(MagicMock(), "k", "t", "db", URL, state=state)
+        saved = state.get("C01234ABC", "1705312200.000000")
+        assert saved["last_ts"] == "1705312200.000002"
+        assert saved["overflow"] is False
+        assert mock_save.call_args.kwargs["overflow"] is None
+
+        refresh_thread(MagicMock(), "k", "t", "db", URL, state=state, force=True)
+        assert mock_save.call_args.kwargs["overflow"] is False
+
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_skips_unchanged_thread(self, mock_fetch, mock_analyze, mock_save):
+        mock_fetch.return_value = _thread_with_replies(3)
+        mock_analyze.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        mock_save.return_value = "https://notion.so/page"
+        state = ThreadStateStore()
+
+        refresh_thread(MagicMock(), "k", "t", "db", URL, memo="m", state=state)
+        result = refresh_thread(MagicMock(), "k", "t", "db", URL, memo="m", state=state)
+
+        assert result == {
+            "theme": "Test Theme",
+            "page_url": "https://notion.so/page",
+            "total_tokens": 0,
+            "model": "",
+            "skipped": True,
+        }
+        assert mock_analyze.call_count == 1
+        assert mock_save.call_count == 1
+
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_reanalyzes_when_memo_changes_or_forced(self, mock_fetch, mock_analyze, mock_save):
+        mock_fetch.return_value = _thread_with_replies(3)
+        mock_analyze.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        mock_save.return_value = "https://notion.so/page"
+        state = ThreadStateStore()
+
+        refresh_thread(MagicMock(), "k", "t", "db", URL, memo="m", state=state)
+        refresh_thread(MagicMock(), "k", "t", "db", URL, memo="changed", state=state)
+        refresh_thread(MagicMock(), "k", "t", "db", URL, memo="changed", state=state, force=True)
+        assert mock_analyze.call_count == 3
+
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_url_variant_updates_the_saved_page(self, mock_fetch, mock_analyze, mock_save):
+        mock_analyze.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        mock_save.return_value = "https://notion.so/page"
+        state = ThreadStateStore()
+        mock_fetch.return_value = _thread_with_replies(3)
+        refresh_thread(MagicMock(), "k", "t", "db", URL, state=state)
+
+        variant = "https://other.enterprise.slack.com/archives/C01234ABC/p1705312200000000"
+        mock_fetch.return_value = _thread_with_replies(3)
+        mock_fetch.return_value.url = variant
+        refresh_thread(MagicMock(), "k", "t", "db", variant, state=state, force=True)
+
+        assert [c.args[3] for c in mock_save.call_args_list] == [URL, URL]
+
+
+def _replies_client(texts: list[str]) -> MagicMock:
+    client = MagicMock()
+    client.conversations_info.return_value = {"channel": {"name": "general"}}
+    client.users_info.return_value = {"user": {"real_name": "Alice"}}
+    client.conversations_replies.return_value = {
+        "messages": [
+            {"user": "U001", "text": text, "ts": f"1705312200.{i:06d}"}
+            for i, text in enumerate(texts)
+        ],
+        "has_more": False,
+    }
+    return client
+
+
+class TestTruncatedThreads:
+    @patch("src.pipeline.save_to_notion")
+    @patch("src.pipeline.analyze_thread_incremental")
+    @patch("src.pipeline.analyze_thread")
+    @patch("src.pipeline.fetch_slack_thread")
+    def test_reply_after_truncation_is_analyzed(
+        self, mock_fetch, mock_full, mock_incremental, mock_save
+    ):
+        mock_fetch.side_effect = lambda *args: fetch_slack_thread(*args, max_tokens=400)
+        mock_full.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        mock_incremental.return_value = (_make_analysis(), TokenUsage(1, 1, 2))
+        mock_save.return_value = "https://notion.so/page"
+        state = ThreadStateStore()
+        texts = [f"{c}" * 400 for c in "abcdef"]
+
+        refresh_thread(_replies_client(texts), "k", "t", "db", URL, state=state)
+        assert mock_full.call_args.args[0].omitted
+
+        client = _replies_client([*texts, "g" * 400])
+        result = refresh_thread(client, "k", "t", "db", URL, state=state)
+
+        assert not result["skipped"]
+        analyzed = (mock_incremental.call_args or mock_full.call_args).args[0]
+        assert analyzed.messages[-1].text == "g" * 400
+        assert state.get("C01234ABC", "1705312200.000000")["last_ts"] == "1705312200.000006"
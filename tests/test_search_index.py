@@ -0,0 +1,166 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from src.models import AnalysisResult, DiscussionStructure, SlackThread
+from src.search_index import (
+    GeminiEmbedder,
+    HashingEmbedder,
+    SearchIndex,
+    embedder_from_config,
+)
+from src.thread_state import ThreadStateStore
+
+
+def _make_analysis(theme: str, issues: list[str]) -> AnalysisResult:
+    return AnalysisResult(
+        theme=theme,
+        structure=DiscussionStructure(
+            premises=[], key_issues=issues, conclusions_or_current_state=[]
+        ),
+        next_decision_required="Decide",
+        suggested_next_action="Act",
+        suggested_owner="Alice",
+        new_concepts=[],
+        strategic_implications=[],
+        risk_signals=[],
+    )
+
+
+def _make_thread(ts: str) -> SlackThread:
+    return SlackThread(
+        channel_id="C01",
+        channel_name="general",
+        thread_ts=ts,
+        messages=[],
+        url=f"https://slack/{ts}",
+        last_reply_at=datetime(2026, 2, 13, tzinfo=timezone.utc),
+    )
+
+
+class TestHashingEmbedder:
+    def test_vectors_are_normalized(self):
+        vectors = HashingEmbedder().embed(["pricing model review", ""])
+
+        assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+        assert not vectors[1].any()
+
+    def test_japanese_text_shares_bigrams(self):
+        embedder = HashingEmbedder()
+        a, b, c = embedder.embed(["料金体系の見直し", "料金体系について", "採用計画"])
+
+        assert a @ b > a @ c
+
+
+class TestSearchIndex:
+    def test_finds_related_analysis(self):
+        index = SearchIndex()
+        index.record(_make_thread("1.0"), _make_analysis("Pricing change", ["discount policy"]))
+        index.record(_make_thread("2.0"), _make_analysis("Hiring plan", ["new engineers"]))
+
+        hits = index.search("discount pricing")
+
+        assert hits[0]["theme"] == "Pricing change"
+        assert hits[0]["slack_url"] == "https://slack/1.0"
+        assert all(h["theme"] != "Hiring plan" for h in hits)
+
+    def test_record_replaces_existing_thread(self):
+        index = SearchIndex()
+        index.record(_make_thread("1.0"), _make_analysis("Old theme", ["alpha"]))
+        index.record(_make_thread("1.0"), _make_analysis("New theme", ["beta"]), "https://notion/1")
+
+        hits = index.search("beta")
+        assert len(index) == 1
+        assert [(h["theme"], h["page_url"]) for h in hits] == [("New theme", "https://notion/1")]
+        assert index.search("alpha") == []
+
+    def test_persists_across_instances(self):
+        SearchIndex().record(_make_thread("1.0"), _make_analysis("Pricing", ["discount"]))
+
+        assert SearchIndex().search("discount")[0]["theme"] == "Pricing"
+
+    def test_reembeds_when_embedder_changes(self):
+        SearchIndex().record(_make_thread("1.0"), _make_analysis("Pricing", ["discount"]))
+
+        index = SearchIndex(embedder=HashingEmbedder(dim=64))
+
+        assert index._matrix.shape == (1, 64)
+        assert index.search("discount")[0]["theme"] == "Pricing"
+
+    def test_sees_rows_written_by_another_instance(self):
+        index = SearchIndex()
+        index.record(_make_thread("1.0"), _make_analysis("Pricing", ["discount"]))
+
+        other = SearchIndex()
+        other.record(_make_thread("1.0"), _make_analysis("Pricing", ["rebate"]))
+        other.record(_make_thread("2.0"), _make_analysis("Hiring", ["engineers"]))
+
+        assert index.search("engineers")[0]["theme"] == "Hiring"
+        assert index.search("rebate")[0]["slack_url"] == "https://slack/1.0"
+        assert len(index) == 2
+
+    @patch("src.search_index.EMBED_BATCH_SIZE", 2)
+    def test_reembeds_in_batches(self):
+        index = SearchIndex()
+        for ts in ("1.0", "2.0", "3.0"):
+            index.record(_make_thread(ts), _make_analysis("Pricing", ["discount"]))
+        embedder = HashingEmbedder(dim=64)
+        embedder.embed = MagicMock(side_effect=HashingEmbedder(dim=64).embed)
+
+        SearchIndex(embedder=embedder)
+
+        assert [len(c.args[0]) for c in embedder.embed.call_args_list] == [2, 1]
+
+    def test_backfill_from_thread_state(self):
+        state = ThreadStateStore()
+        state.put(
+            "C01", "1.0", "2.0", _make_analysis("Pricing", ["discount"]), slack_url="https://slack/1.0"
+        )
+
+        index = SearchIndex()
+
+        assert index.backfill(state) == 1
+        assert index.search("discount")[0]["slack_url"] == "https://slack/1.0"
+
+    def test_empty_index(self):
+        assert SearchIndex().search("anything") == []
+
+    def test_rejects_non_positive_limit(self):
+        index = SearchIndex()
+        index.record(_make_thread("1.0"), _make_analysis("Pricing", ["discount"]))
+
+        with pytest.raises(ValueError):
+            index.search("discount", limit=0)
+
+    def test_query_is_embedded_without_the_lock(self):
+        index = SearchIndex()
+        index.record(_make_thread("1.0"), _make_analysis("Pricing", ["discount"]))
+        embed = index.embedder.embed
+
+        def embed_unlocked(texts):
+            assert not index._lock.locked()
+            return embed(texts)
+
+        index.embedder.embed = embed_unlocked
+
+        assert index.search("discount")[0]["theme"] == "Pricing"
+
+
+class TestEmbedderFromConfig:
+    def test_defaults_to_hashing(self):
+        assert isinstance(embedder_from_config({}.get), HashingEmbedder)
+
+    def test_gemini_embeddings(self):
+        client = MagicMock()
+        client.models.embed_content.return_value.embeddings = [MagicMock(values=[3.0, 4.0])]
+        config = {"SEARCH_EMBEDDINGS": "gemini", "SEARCH_EMBEDDING_MODEL": "custom-embed"}
+
+        embedder = embedder_from_config(config.get, client)
+
+        assert isinstance(embedder, GeminiEmbedder)
+        assert np.allclose(embedder.embed(["text"]), [[0.6, 0.8]])
+        client.models.embed_content.assert_called_once_with(
+            model="custom-embed", contents=["text"]
+        )
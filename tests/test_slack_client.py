@@ -3,8 +3,9 @@ from unittest.mock import MagicMock
 
 import pytest
 from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
 
-from src.slack_client import fetch_slack_thread, parse_slack_thread_url
+from src.slack_client import fetch_slack_thread, parse_slack_thread_url, thread_url
 
 
 class TestParseSlackThreadUrl:
@@ -34,6 +35,31 @@ class TestParseSlackThreadUrl:
         with pytest.raises(ValueError, match="Invalid Slack thread URL"):
             parse_slack_thread_url("https://myworkspace.slack.com/archives/C01234ABC")
 
+    def test_reply_permalink_resolves_to_parent(self):
+        url = (
+            "https://myworkspace.slack.com/archives/C01234ABC/p1705312999000100"
+            "?thread_ts=1705312200.123456&cid=C01234ABC"
+        )
+        assert parse_slack_thread_url(url) == ("C01234ABC", "1705312200.123456")
+
+    def test_web_client_thread_url(self):
+        url = "https://app.slack.com/client/T0001/C01234ABC/thread/C01234ABC-1705312200.123456"
+        assert parse_slack_thread_url(url) == ("C01234ABC", "1705312200.123456")
+
+
+class TestThreadUrl:
+    def test_drops_query_and_reply_ts(self):
+        url = "https://myworkspace.slack.com/archives/C01234ABC/p1705312999000100?thread_ts=x"
+        assert thread_url(url, "C01234ABC", "1705312200.123456") == (
+            "https://myworkspace.slack.com/archives/C01234ABC/p1705312200123456"
+        )
+
+    def test_web_client_host_becomes_slack_com(self):
+        url = "https://app.slack.com/client/T0001/C01234ABC/thread/C01234ABC-1705312200.123456"
+        assert thread_url(url, "C01234ABC", "1705312200.123456") == (
+            "https://slack.com/archives/C01234ABC/p1705312200123456"
+        )
+
 
 class TestFetchSlackThread:
     def _mock_client(self):
@@ -76,6 +102,30 @@ class TestFetchSlackThread:
         assert thread.messages[0].user == "Alice"
         assert thread.messages[1].user == "Bob"
         assert thread.messages[0].text == "Let's discuss the API"
+        assert thread.messages[1].ts == "1705312260.654321"
+
+    def test_fetch_resolves_reply_to_parent(self):
+        client = self._mock_client()
+        reply = {
+            "user": "U002",
+            "text": "reply",
+            "ts": "1705312260.654321",
+            "thread_ts": "1705312200.123456",
+        }
+        parent_page = client.conversations_replies.return_value
+        client.conversations_replies.side_effect = [{"messages": [reply]}, parent_page]
+
+        thread = fetch_slack_thread(
+            client,
+            "C01234ABC",
+            "1705312260.654321",
+            "https://workspace.slack.com/archives/C01234ABC/p1705312260654321",
+        )
+
+        assert client.conversations_replies.call_args.kwargs["ts"] == "1705312200.123456"
+        assert thread.thread_ts == "1705312200.123456"
+        assert thread.url == "https://workspace.slack.com/archives/C01234ABC/p1705312200123456"
+        assert len(thread.messages) == 2
 
     def test_fetch_sets_last_reply_at(self):
         client = self._mock_client()
@@ -119,3 +169,108 @@ class TestFetchSlackThread:
         assert len(thread.messages) == 2
         assert thread.messages[0].user == "Alice"
         assert thread.messages[1].user == "deploy-bot"
+
+    def _paged_client(self, pages: list[list[str]]) -> MagicMock:
+        client = MagicMock(spec=WebClient)
+        client.conversations_info.return_value = {"channel": {"name": "general"}}
+        responses = []
+        for i, texts in enumerate(pages):
+            last = i == len(pages) - 1
+            responses.append({
+                "messages": [
+                    {"user": "U001", "text": text, "ts": f"17053122{i}{j}.000100"}
+                    for j, text in enumerate(texts)
+                ],
+                "has_more": not last,
+                "response_metadata": {"next_cursor": "" if last else f"cursor-{i + 1}"},
+            })
+        client.conversations_replies.side_effect = responses
+        client.users_info.return_value = {"user": {"real_name": "Alice"}}
+        return client
+
+    def test_fetch_follows_pagination(self):
+        client = self._paged_client([["a", "b"], ["c"], ["d"]])
+
+        thread = fetch_slack_thread(client, "C01234ABC", "1705312200.000100", "url")
+
+        assert [m.text for m in thread.messages] == ["a", "b", "c", "d"]
+        assert thread.omitted == 0
+        cursors = [c.kwargs.get("cursor") for c in client.conversations_replies.call_args_list]
+        assert cursors == [None, "cursor-1", "cursor-2"]
+        client.users_info.assert_called_once()
+
+    def test_fetch_keeps_opening_and_latest_replies_at_token_budget(self):
+        client = self._paged_client([["x" * 400], ["y" * 400], ["z" * 400]])
+
+        thread = fetch_slack_thread(
+            client, "C01234ABC", "1705312200.000100", "url", max_tokens=250
+        )
+
+        assert [m.text[0] for m in thread.messages] == ["x", "z"]
+        assert (thread.omitted, thread.omitted_at) == (1, 1)
+        assert thread.last_reply_at == thread.messages[-1].timestamp
+        assert client.conversations_replies.call_count == 3
+
+    def test_fetch_normalizes_mentions_with_shared_cache(self):
+        client = MagicMock(spec=WebClient)
+        client.conversations_info.side_effect = lambda channel: {
+            "channel": {"name": {"C01234ABC": "general", "C999": "design"}[channel]}
+        }
+        client.conversations_replies.return_value = {
+            "messages": [
+                {"user": "U001", "text": "<@U002> see <#C999>", "ts": "1705312200.123456"},
+                {"user": "U002", "text": "<@U001> <https://x.dev|docs>", "ts": "1705312260.654321"},
+            ]
+        }
+        client.users_info.side_effect = lambda user: {
+            "user": {"real_name": {"U001": "Alice", "U002": "Bob"}[user]}
+        }
+
+        for _ in range(2):
+            thread = fetch_slack_thread(client, "C01234ABC", "1705312200.123456", "url")
+
+        assert [m.text for m in thread.messages] == ["@Bob see #design", "@Alice docs"]
+        assert client.users_info.call_count == 2
+        assert client.conversations_info.call_count == 2
+
+    def test_failed_lookups_are_retried_not_cached(self):
+        client = self._mock_client()
+        rate_limited = SlackApiError("ratelimited", MagicMock(status_code=429))
+        client.users_info.side_effect = [rate_limited, {"user": {"real_name": "Bob"}}]
+        client.conversations_replies.return_value = {
+            "messages": [{"user": "U002", "text": "hi", "ts": "1705312200.123456"}]
+        }
+
+        first = fetch_slack_thread(client, "C01234ABC", "1705312200.123456", "url")
+        second = fetch_slack_thread(client, "C01234ABC", "1705312200.123456", "url")
+
+        assert first.messages[0].user == "U002"
+        assert second.messages[0].user == "Bob"
+
+    def test_thread_channel_lookup_error_propagates(self):
+        client = self._mock_client()
+        client.conversations_info.side_effect = SlackApiError(
+            "ratelimited", MagicMock(status_code=429)
+        )
+
+        with pytest.raises(SlackApiError):
+            fetch_slack_thread(client, "C01234ABC", "1705312200.123456", "url")
+
+    def test_fetch_appends_attachment_text(self):
+        client = MagicMock(spec=WebClient)
+        client.conversations_info.return_value = {"channel": {"name": "general"}}
+        client.conversations_replies.return_value = {
+            "messages": [
+                {
+                    "user": "U001",
+                    "text": "FYI",
+                    "ts": "1705312200.123456",
+                    "attachments": [{"title": "Incident", "text": "<@U001> is on call"}],
+                },
+            ]
+        }
+        client.users_info.return_value = {"user": {"real_name": "Alice"}}
+
+        thread = fetch_slack_thread(client, "C01234ABC", "1705312200.123456", "url")
+
+        assert thread.messages[0].text == "FYI\n[Attachment: Incident] @Alice is on call"
@@ -0,0 +1,119 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from src.slack_content import (
+    ContentExtractor,
+    _cache_path,
+    clip_bytes,
+    fetch_file_texts,
+    file_text,
+    message_extras,
+)
+
+TEXT_FILE = {
+    "id": "F001",
+    "name": "notes.md",
+    "filetype": "markdown",
+    "url_private_download": "https://files.slack.com/F001",
+    "preview": "preview only",
+}
+
+
+class TestClipBytes:
+    def test_does_not_split_multibyte_characters(self):
+        assert clip_bytes("日本語", 7) == "日本"
+        assert clip_bytes("abc", 10) == "abc"
+
+
+class TestMessageExtras:
+    def test_blocks_attachments_and_files(self):
+        msg = {
+            "text": "Deploy finished",
+            "blocks": [
+                {"type": "rich_text", "elements": []},
+                {"type": "section", "text": {"type": "mrkdwn", "text": "Deploy finished"}},
+                {"type": "section", "fields": [{"type": "mrkdwn", "text": "*Env* prod"}]},
+            ],
+            "attachments": [{"title": "PR #12", "text": "Fix login", "fields": [{"title": "Status", "value": "merged"}]}],
+            "files": [TEXT_FILE, {"id": "F002", "mode": "tombstone"}],
+        }
+        sections = message_extras(msg, {"F001": "# Notes"})
+        assert sections == [
+            "*Env* prod",
+            "[Attachment: PR #12] Fix login\nStatus: merged",
+            "[File: notes.md]\n# Notes",
+        ]
+
+
+class TestFileText:
+    @patch("src.slack_content._download_text", return_value="# Notes")
+    def test_downloads_once_then_uses_disk_cache(self, mock_download):
+        assert file_text("xoxp", TEXT_FILE) == "# Notes"
+        assert file_text("xoxp", TEXT_FILE) == "# Notes"
+        mock_download.assert_called_once()
+
+    @patch("src.slack_content._download_text", return_value="議事メモ")
+    def test_cache_is_utf8(self, mock_download):
+        assert file_text("xoxp", TEXT_FILE) == "議事メモ"
+        assert file_text("xoxp", TEXT_FILE) == "議事メモ"
+        assert _cache_path(TEXT_FILE["id"]).read_bytes() == "議事メモ".encode()
+
+    @patch("src.slack_content._download_text")
+    def test_binary_files_use_preview(self, mock_download):
+        image = {**TEXT_FILE, "id": "F003", "filetype": "png", "mimetype": "image/png"}
+        assert file_text("xoxp", image) == "preview only"
+        mock_download.assert_not_called()
+
+    def test_download_limit_and_concurrency(self):
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def download(token, url, max_bytes):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+            return url
+
+        files = [{**TEXT_FILE, "id": f"F{i}", "url_private_download": f"u{i}"} for i in range(8)]
+        with patch("src.slack_content._download_text", side_effect=download):
+            texts = fetch_file_texts("xoxp", files, workers=2)
+
+        assert texts == {f"F{i}": f"u{i}" for i in range(8)}
+        assert peak <= 2
+
+
+class TestContentExtractor:
+    def test_applies_message_and_thread_budgets(self):
+        client = MagicMock()
+        client.token = "xoxp"
+        extractor = ContentExtractor(client, message_max_bytes=30, thread_max_bytes=50)
+        page = [
+            {"ts": f"{i}.0", "text": "", "attachments": [{"text": "x" * 100}]}
+            for i in range(3)
+        ]
+
+        extras = extractor.page_extras(page)
+
+        assert [len(v) for v in extras.values()] == [30, 20]
+        assert extractor.page_extras(page) == {}
+
+    @patch("src.slack_content._download_text", side_effect=lambda token, url, max_bytes: "t" * 40)
+    def test_stops_downloading_once_budget_is_spent(self, mock_download):
+        client = MagicMock()
+        client.token = "xoxp"
+        extractor = ContentExtractor(client, message_max_bytes=30, thread_max_bytes=50)
+        page = [
+            {"ts": f"{i}.0", "text": "", "files": [{**TEXT_FILE, "id": f"F1{i}"}]}
+            for i in range(20)
+        ]
+
+        extras = extractor.page_extras(page)
+
+        assert len(extras) == 2
+        assert mock_download.call_count == 2
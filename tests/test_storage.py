@@ -0,0 +1,17 @@
+from src.storage import DATA_DIR_ENV, DEFAULT_DATA_DIR, data_dir
+
+
+class TestDataDir:
+    def test_defaults_to_home_not_working_directory(self, tmp_path, monkeypatch):
+        monkeypatch.delenv(DATA_DIR_ENV)
+        monkeypatch.setenv("HOME", str(tmp_path / "home"))
+        monkeypatch.chdir(tmp_path)
+
+        assert data_dir() == tmp_path / "home" / DEFAULT_DATA_DIR
+        assert not (tmp_path / DEFAULT_DATA_DIR).exists()
+
+    def test_env_override(self, tmp_path, monkeypatch):
+        monkeypatch.setenv(DATA_DIR_ENV, str(tmp_path / "state"))
+
+        assert data_dir() == tmp_path / "state"
+        assert data_dir().is_dir()
@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+
+from src.models import AnalysisResult, DiscussionStructure, SlackMessage, SlackThread
+from src.thread_state import ThreadStateStore, thread_fingerprint
+
+
+def _make_analysis(theme: str = "Theme") -> AnalysisResult:
+    return AnalysisResult(
+        theme=theme,
+        structure=DiscussionStructure(
+            premises=[], key_issues=[], conclusions_or_current_state=[]
+        ),
+        next_decision_required="Decide",
+        suggested_next_action="Alice by Friday",
+        suggested_owner="Alice",
+        new_concepts=[],
+        strategic_implications=[],
+        risk_signals=[],
+    )
+
+
+class TestThreadStateStore:
+    def test_returns_none_for_unknown_thread(self):
+        assert ThreadStateStore().get("C01", "1.0") is None
+
+    def test_round_trips_analysis(self):
+        ThreadStateStore().put("C01", "1.0", "3.0", _make_analysis())
+
+        state = ThreadStateStore().get("C01", "1.0")
+        assert state["last_ts"] == "3.0"
+        assert state["analysis"] == _make_analysis()
+
+    def test_put_overwrites(self):
+        store = ThreadStateStore()
+        store.put("C01", "1.0", "3.0", _make_analysis("Old"))
+        store.put("C01", "1.0", "5.0", _make_analysis("New"))
+
+        state = store.get("C01", "1.0")
+        assert state["last_ts"] == "5.0"
+        assert state["analysis"].theme == "New"
+
+    def test_tracked_url(self):
+        store = ThreadStateStore()
+        store.put("C01", "1.0", "3.0", _make_analysis(), slack_url="https://slack/1")
+
+        assert store.tracked_url("C01", "1.0") == "https://slack/1"
+        assert store.tracked_url("C01", "2.0") is None
+
+
+def _make_thread(texts: list[str]) -> SlackThread:
+    messages = [
+        SlackMessage(
+            user="Alice",
+            text=text,
+            timestamp=datetime(2026, 2, 13, 10, i, 0, tzinfo=timezone.utc),
+            ts=f"1705312200.{i:06d}",
+        )
+        for i, text in enumerate(texts)
+    ]
+    return SlackThread(
+        channel_name="general",
+        channel_id="C01",
+        thread_ts=messages[0].ts,
+        url="https://workspace.slack.com/archives/C01/p1705312200000000",
+        messages=messages,
+        last_reply_at=messages[-1].timestamp,
+    )
+
+
+class TestThreadFingerprint:
+    def test_stable_for_same_content(self):
+        assert thread_fingerprint(_make_thread(["a", "b"])) == thread_fingerprint(
+            _make_thread(["a", "b"])
+        )
+
+    def test_starts_with_last_reply_ts(self):
+        assert thread_fingerprint(_make_thread(["a", "b"])).startswith("1705312200.000001:")
+
+    def test_changes_on_edit_reply_or_memo(self):
+        base = thread_fingerprint(_make_thread(["a", "b"]))
+        assert thread_fingerprint(_make_thread(["a", "edited"])) != base
+        assert thread_fingerprint(_make_thread(["a", "b", "c"])) != base
+        assert thread_fingerprint(_make_thread(["a", "b"]), memo="memo") != base
@@ -0,0 +1,73 @@
+from datetime import date
+
+import pytest
+
+from src.token_budget import (
+    OUTPUT_TOKEN_RESERVE,
+    BudgetExceeded,
+    TokenBudget,
+    estimate_tokens,
+)
+
+
+def _budget(**kwargs) -> TokenBudget:
+    return TokenBudget(today=lambda: date(2026, 2, 11), **kwargs)
+
+
+class TestEstimateTokens:
+    def test_ascii_and_japanese(self):
+        assert estimate_tokens("abcd" * 10) == 10
+        assert estimate_tokens("議論") == 2
+
+
+class TestTokenBudget:
+    def test_within_budget_reserves_then_settles(self):
+        budget = _budget(per_request=1_000, per_day=100_000)
+
+        plan = budget.preflight(800)
+        assert plan.max_tokens is None and plan.model is None
+        assert budget.used_today() == 800 + OUTPUT_TOKEN_RESERVE
+
+        budget.settle(plan, 1_200)
+        assert budget.used_today() == 1_200
+
+    def test_over_request_budget_is_compacted(self):
+        plan = _budget(per_request=3_000).preflight(10_000)
+
+        assert plan.max_tokens == 3_000
+        assert "per-request" in plan.reason
+
+    def test_route_and_reject(self):
+        routed = _budget(per_request=3_000, overflow="route", overflow_model="big").preflight(10_000)
+        assert routed.model == "big"
+
+        with pytest.raises(BudgetExceeded, match="per-request"):
+            _budget(per_request=3_000, overflow="reject").preflight(10_000)
+
+    def test_delta_prompt_is_not_compacted(self):
+        with pytest.raises(BudgetExceeded):
+            _budget(per_request=3_000).preflight(10_000, can_compact=False)
+
+    def test_daily_budget_is_shared_and_per_day(self):
+        day = [date(2026, 2, 11)]
+        first = TokenBudget(per_day=30_000, today=lambda: day[0])
+        second = TokenBudget(per_day=30_000, today=lambda: day[0])
+        first.settle(first.preflight(5_000), 14_000)
+
+        with pytest.raises(BudgetExceeded, match="daily budget"):
+            second.preflight(15_000, can_compact=False)
+        assert second.preflight(15_000).max_tokens == 30_000 - 14_000 - OUTPUT_TOKEN_RESERVE
+
+        day[0] = date(2026, 2, 12)
+        assert second.preflight(15_000).max_tokens is None
+
+    def test_from_config(self):
+        env = {"TOKEN_BUDGET_PER_REQUEST": "50000", "TOKEN_BUDGET_OVERFLOW": "Reject"}
+        budget = TokenBudget.from_config(env.get)
+
+        assert budget.per_request == 50_000
+        assert budget.per_day is None
+        assert budget.overflow == "reject"
+
+        with pytest.raises(ValueError, match="overflow"):
+            TokenBudget.from_config({"TOKEN_BUDGET_OVERFLOW": "drop"}.get)